@@ -0,0 +1,90 @@
+import asyncio
+import time
+import traceback
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS afk (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    since REAL NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+);
+'''
+
+_DELETED = object()
+
+
+# AFK registry keyed by (guild_id, user_id).
+# Lookups on the message hot path only touch the in-memory dict; changes are queued and
+# written to the afk table in one transaction per flush by a write-behind task.
+class AfkStore:
+    def __init__(self, db, flush_interval=5.0):
+        self.db = db
+        self.flush_interval = flush_interval
+        self._entries = {}
+        self._pending = {}
+        self._task = None
+
+    async def start(self):
+        if self._task is not None:
+            return
+        await self.db.executescript(SCHEMA)
+        rows = await self.db.fetchall('SELECT guild_id, user_id, status, since FROM afk')
+        self._entries = {(row['guild_id'], row['user_id']): (row['status'], row['since']) for row in rows}
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, guild_id, user_id):
+        # Return (status, since) or None
+        return self._entries.get((guild_id, user_id))
+
+    def set(self, guild_id, user_id, status):
+        key = (guild_id, user_id)
+        entry = (status, time.time())
+        self._entries[key] = entry
+        self._pending[key] = entry
+
+    def clear(self, guild_id, user_id):
+        key = (guild_id, user_id)
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._pending[key] = _DELETED
+        return entry
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        upserts = [(guild_id, user_id, entry[0], entry[1]) for (guild_id, user_id), entry in pending.items() if entry is not _DELETED]
+        deletes = [key for key, entry in pending.items() if entry is _DELETED]
+
+        def _write(conn):
+            with conn:
+                conn.execute('BEGIN')
+                conn.executemany('INSERT OR REPLACE INTO afk (guild_id, user_id, status, since) VALUES (?, ?, ?, ?)', upserts)
+                conn.executemany('DELETE FROM afk WHERE guild_id = ? AND user_id = ?', deletes)
+
+        try:
+            await self.db.run(_write)
+        except Exception:
+            # Requeue anything not superseded since, so the next flush retries it
+            for key, entry in pending.items():
+                self._pending.setdefault(key, entry)
+            raise
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                traceback.print_exc()
@@ -0,0 +1,624 @@
+import argparse
+import asyncio
+import datetime
+import gc
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import traceback
+import tracemalloc
+
+import discord
+
+# Offline load-testing harness.
+# botix is imported inside a scratch directory (fresh database and settings) and its command
+# callbacks and event listeners are driven directly with synthetic interactions and messages at
+# a fixed arrival rate. Every REST call the handlers make goes to FakeRest, which adds latency and
+# answers with 429s when a route or the global bucket is exhausted, the way Discord would.
+# Permission checks are granted so the handlers' own work is what gets measured.
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+_ids = itertools.count(10**17)
+
+
+def snowflake():
+    return next(_ids)
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after, is_global):
+        self.retry_after = retry_after
+        self.is_global = is_global
+
+
+# Stand-in for the Discord REST API: fixed latency with jitter, per-route and global buckets
+# and an optional random 429 rate. Like discord.py, callers wait out a 429 and retry.
+class FakeRest:
+    def __init__(self, latency=0.02, jitter=0.01, route_limit=5, route_window=1.0, global_limit=50,
+                 random_429=0.0, on_rate_limit=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.route_limit = route_limit
+        self.route_window = route_window
+        self.global_limit = global_limit
+        self.random_429 = random_429
+        self.on_rate_limit = on_rate_limit
+        self.requests = 0
+        self.rate_limited = 0
+        self._buckets = {}
+        self._global = []
+
+    def _take(self, key, limit, window, now):
+        calls = self._buckets.setdefault(key, []) if key is not None else self._global
+        while calls and calls[0] <= now - window:
+            calls.pop(0)
+        if len(calls) >= limit:
+            return calls[0] + window - now
+        calls.append(now)
+        return 0.0
+
+    def _check(self, route):
+        now = time.monotonic()
+        retry_after = self._take(None, self.global_limit, 1.0, now)
+        if retry_after:
+            raise RateLimited(retry_after, True)
+        retry_after = self._take(route, self.route_limit, self.route_window, now)
+        if retry_after:
+            raise RateLimited(retry_after, False)
+        if self.random_429 and random.random() < self.random_429:
+            raise RateLimited(random.uniform(0.05, 0.5), False)
+
+    async def request(self, *route):
+        while True:
+            self.requests += 1
+            await asyncio.sleep(max(self.latency + random.uniform(-self.jitter, self.jitter), 0))
+            try:
+                self._check(route)
+                return
+            except RateLimited as exc:
+                self.rate_limited += 1
+                if self.on_rate_limit is not None:
+                    self.on_rate_limit('global' if exc.is_global else 'route')
+                await asyncio.sleep(exc.retry_after)
+
+
+# Fake gateway objects implementing the parts of the discord.py models the handlers touch
+
+class FakeRole(discord.Role):
+    def __init__(self, guild, role_id, name, permissions=0, position=0):
+        self.guild = guild
+        self.id = role_id
+        self.name = name
+        self._permissions = permissions
+        self.position = position
+        self.managed = False
+
+    def __repr__(self):
+        return f'<FakeRole id={self.id} name={self.name!r}>'
+
+
+class FakeUser:
+    def __init__(self, rest, guild=None, bot=False, created_at=None):
+        self.rest = rest
+        self.guild = guild
+        self.id = snowflake()
+        self.name = f'user{self.id % 100000}'
+        self.display_name = self.name
+        self.bot = bot
+        self.mention = f'<@{self.id}>'
+        self.created_at = created_at or discord.utils.utcnow()
+        self.joined_at = discord.utils.utcnow()
+        self.roles = [guild.default_role] if guild is not None else []
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def top_role(self):
+        return max(self.roles, key=lambda role: role.position)
+
+    def get_role(self, role_id):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    async def send(self, content=None, **kwargs):
+        await self.rest.request('dm', self.id)
+
+    async def edit(self, **kwargs):
+        await self.rest.request('member', self.guild.id, self.id)
+        if 'roles' in kwargs:
+            self.roles = list(kwargs['roles'])
+
+    async def add_roles(self, *roles, **kwargs):
+        for role in roles:
+            await self.rest.request('member_role', self.guild.id, self.id)
+            self.roles.append(role)
+
+    async def kick(self, **kwargs):
+        await self.rest.request('kick', self.guild.id)
+
+    async def ban(self, **kwargs):
+        await self.rest.request('ban', self.guild.id)
+
+
+class FakeMessage:
+    def __init__(self, channel, author, content, created_at=None):
+        self.rest = channel.rest
+        self.id = snowflake()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.created_at = created_at or discord.utils.utcnow()
+        self.pinned = False
+        self.attachments = []
+        self.mentions = []
+        self.role_mentions = []
+        self.mention_everyone = False
+        self.jump_url = f'https://discord.com/channels/{self.guild.id}/{channel.id}/{self.id}'
+
+    async def delete(self):
+        await self.rest.request('delete_message', self.channel.id)
+
+    async def reply(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeChannel:
+    def __init__(self, guild, name, history_size=0):
+        self.rest = guild.rest
+        self.guild = guild
+        self.id = snowflake()
+        self.name = name
+        self.mention = f'<#{self.id}>'
+        self.overwrites = {}
+        self._history = []
+        if history_size:
+            now = discord.utils.utcnow()
+            authors = [guild.add_member(bot=index % 4 == 0) for index in range(20)]
+            self._history = [
+                FakeMessage(self, authors[index % len(authors)], f'message {index}', now - datetime.timedelta(seconds=index))
+                for index in range(history_size)
+            ]
+
+    def permissions_for(self, member):
+        return discord.Permissions.all()
+
+    async def history(self, limit=None, before=None, after=None):
+        for index, message in enumerate(self._history):
+            if limit is not None and index >= limit:
+                return
+            if index % 100 == 0:
+                await self.rest.request('history', self.id)
+            yield message
+
+    async def delete_messages(self, messages):
+        await self.rest.request('bulk_delete', self.id)
+        deleted = {message.id for message in messages}
+        self._history = [message for message in self._history if message.id not in deleted]
+
+    async def edit(self, overwrites=None, reason=None, **kwargs):
+        await self.rest.request('channel', self.id)
+        if overwrites is not None:
+            self.overwrites = dict(overwrites)
+
+    async def send(self, content=None, **kwargs):
+        await self.rest.request('send', self.id)
+        return FakeMessage(self, self.guild.me, content or '')
+
+
+class FakeGuild:
+    def __init__(self, rest, roles=20, channels=5, history_size=0):
+        self.rest = rest
+        self.id = snowflake()
+        self.name = f'guild{self.id % 1000}'
+        self.shard_id = 0
+        self.default_role = FakeRole(self, self.id, '@everyone', discord.Permissions.general().value)
+        self.roles = [self.default_role]
+        for position in range(1, roles):
+            permissions = discord.Permissions(manage_messages=True).value if position % 25 == 0 else 0
+            self.roles.append(FakeRole(self, snowflake(), f'role{position}', permissions, position))
+        self.roles.append(FakeRole(self, snowflake(), 'botix', discord.Permissions.all().value, roles))
+        self._roles = {role.id: role for role in self.roles}
+        self._members = {}
+        self.me = self.add_member(bot=True)
+        self.me.roles.append(self.roles[-1])
+        self.owner_id = self.me.id
+        self.channels = [FakeChannel(self, f'channel{index}', history_size) for index in range(channels)]
+        self._channels = {channel.id: channel for channel in self.channels}
+
+    @property
+    def member_count(self):
+        return len(self._members)
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def add_member(self, bot=False, created_at=None):
+        member = FakeUser(self.rest, self, bot=bot, created_at=created_at)
+        self._members[member.id] = member
+        return member
+
+    def remove_member(self, member):
+        self._members.pop(member.id, None)
+
+    async def ban(self, user, **kwargs):
+        await self.rest.request('ban', self.id)
+        self.remove_member(user)
+
+    async def bulk_ban(self, users, **kwargs):
+        await self.rest.request('bulk_ban', self.id)
+        users = list(users)
+        for user in users:
+            self.remove_member(user)
+        return discord.guild.BulkBanResult(banned=[discord.Object(id=user.id) for user in users], failed=[])
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def defer(self, **kwargs):
+        self._done = True
+        await self.interaction.rest.request('interaction', self.interaction.id)
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        await self.interaction.rest.request('interaction', self.interaction.id)
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        await self.interaction.rest.request('webhook', self.interaction.id)
+
+
+class FakeInteraction:
+    def __init__(self, user, channel):
+        self.rest = channel.rest
+        self.id = snowflake()
+        self.user = user
+        self.guild = channel.guild
+        self.guild_id = channel.guild.id
+        self.channel = channel
+        self.channel_id = channel.id
+        self.extras = {'received_at': time.perf_counter()}
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+    async def edit_original_response(self, **kwargs):
+        await self.rest.request('webhook', self.id)
+
+
+# Drives synthetic arrivals at a fixed rate and records per-arrival latency.
+# Latency runs from the scheduled arrival time, so queueing behind slow handlers is included.
+class FakeGateway:
+    def __init__(self, botix):
+        self.botix = botix
+
+    async def dispatch(self, event, *args):
+        # Await every listener registered for the event, as the gateway would run them
+        for listener in self.botix.bot.extra_events.get(event, []):
+            await listener(*args)
+
+    async def invoke(self, name, interaction, **options):
+        # Run a command and wait for any background job it queued
+        command = self.botix.bot.tree.get_command(name)
+        await command.callback(interaction, **options)
+        for job in self.botix.jobs.for_guild(interaction.guild_id):
+            if job.interaction is interaction:
+                await job.wait()
+                if job.status == 'failed':
+                    raise RuntimeError(f'job #{job.id} ({job.name}) failed')
+
+    async def drive(self, make_call, count, rate):
+        loop = asyncio.get_running_loop()
+        latencies = []
+        errors = 0
+
+        async def arrival(index, scheduled):
+            nonlocal errors
+            try:
+                await make_call(index)
+            except Exception:
+                if not errors:
+                    traceback.print_exc()
+                errors += 1
+            latencies.append(loop.time() - scheduled)
+
+        start = loop.time()
+        tasks = []
+        for index in range(count):
+            scheduled = start + index / rate if rate else loop.time()
+            delay = scheduled - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(arrival(index, scheduled)))
+        await asyncio.gather(*tasks)
+        return latencies, errors, loop.time() - start
+
+
+# Scenarios: each prepares its fixtures, then returns (gateway call, default count)
+
+async def purge_storm(botix, gateway, rest, args):
+    guild = FakeGuild(rest, channels=args.channels, history_size=args.history)
+    moderator = guild.add_member()
+
+    async def call(index):
+        channel = guild.channels[index % len(guild.channels)]
+        await gateway.invoke('purge', FakeInteraction(moderator, channel), count=args.purge_count, bots=index % 2 == 0)
+    return call
+
+
+async def lockdown_roles(botix, gateway, rest, args):
+    guild = FakeGuild(rest, roles=args.roles, channels=args.channels)
+    for channel in guild.channels:
+        channel.overwrites = {
+            role: discord.PermissionOverwrite(send_messages=True, read_messages=True) for role in guild.roles[1::2]
+        }
+    botix.settings.update(guild.id, lockdown_channels=[channel.id for channel in guild.channels])
+    moderator = guild.add_member()
+
+    async def call(index):
+        interaction = FakeInteraction(moderator, guild.channels[0])
+        await gateway.invoke('lockdown', interaction, action='start' if index % 2 == 0 else 'end')
+    return call
+
+
+WORDS = ('deploy', 'server', 'release', 'bug', 'raid', 'lunch', 'meeting', 'ticket', 'patch', 'update',
+         'error', 'crash', 'review', 'merge', 'build', 'outage', 'ping', 'latency', 'shard', 'cache')
+
+
+async def highlight_chat(botix, gateway, rest, args):
+    guild = FakeGuild(rest, channels=args.channels)
+    subscribers = [guild.add_member() for _ in range(args.subscribers)]
+    for member in subscribers:
+        for phrase in random.sample(WORDS, 3):
+            await botix.highlights_index.add(guild.id, member.id, f'{phrase} {random.choice(WORDS)}')
+    authors = [guild.add_member() for _ in range(50)]
+    rng = random.Random(1)
+
+    async def call(index):
+        channel = guild.channels[index % len(guild.channels)]
+        content = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 40)))
+        await gateway.dispatch('on_message', FakeMessage(channel, authors[index % len(authors)], content))
+    return call
+
+
+async def spam_flood(botix, gateway, rest, args):
+    # Many distinct senders under server-wide slowmode and both spam rules; a fraction repeat
+    # themselves or mass-mention
+    guild = FakeGuild(rest, channels=args.channels)
+    botix.settings.update(guild.id, server_slowmode=5, spam_duplicates=3, spam_mentions=10)
+    senders = [guild.add_member() for _ in range(args.senders)]
+    rng = random.Random(2)
+
+    async def call(index):
+        spam = index % 100 == 0
+        author = senders[index % 10] if spam else senders[rng.randrange(len(senders))]
+        message = FakeMessage(rng.choice(guild.channels), author, 'buy now' if spam else f'hello {index}')
+        if index % 200 == 50:
+            message.mentions = rng.sample(senders, 8)
+        await gateway.dispatch('on_message', message)
+    return call
+
+
+async def mass_ban(botix, gateway, rest, args):
+    # Each command bans a different batch of raid accounts by ID
+    guild = FakeGuild(rest, channels=args.channels)
+    moderator = guild.add_member()
+    batches = [[guild.add_member() for _ in range(args.batch_size)] for _ in range(args.count or 5)]
+
+    async def call(index):
+        ids = ' '.join(str(member.id) for member in batches[index])
+        await gateway.invoke('massban', FakeInteraction(moderator, guild.channels[0]), ids=ids, delete_messages='1h')
+    return call
+
+
+async def join_raid(botix, gateway, rest, args):
+    guild = FakeGuild(rest, channels=args.channels)
+    botix.settings.update(guild.id, raid_joins=50, raid_alert_channel=guild.channels[0].id,
+                          lockdown_channels=[channel.id for channel in guild.channels])
+    now = discord.utils.utcnow()
+    # Members who left with persisted roles and rejoin during the raid
+    rejoining = []
+    for index in range(20):
+        member = guild.add_member(created_at=now - datetime.timedelta(days=400))
+        for role in guild.roles[1 + index % 5:4 + index % 5]:
+            await botix.role_persistence.add(guild.id, member.id, role.id)
+        guild.remove_member(member)
+        rejoining.append(member)
+
+    async def call(index):
+        # Most raid accounts are minutes old; some are established accounts, some rejoin
+        if index % 100 == 0 and rejoining:
+            member = rejoining.pop()
+            member.roles = [guild.default_role]
+            guild._members[member.id] = member
+        else:
+            age = datetime.timedelta(minutes=random.randint(1, 60)) if index % 5 else datetime.timedelta(days=400)
+            member = guild.add_member(created_at=now - age)
+        await gateway.dispatch('on_member_join', member)
+    return call
+
+
+async def modlog_export(botix, gateway, rest, args):
+    # Chat keeps arriving while two moderators export a large mod log as NDJSON and CSV; the
+    # exports run off the event loop, so message latency should stay close to an idle bot's
+    guild = FakeGuild(rest, channels=args.channels)
+    guild.filesize_limit = 2**20
+    moderator = guild.add_member()
+    authors = [guild.add_member() for _ in range(200)]
+    for start in range(0, args.export_rows, 10000):
+        await botix.moderation.add_cases([
+            (guild.id, random.randrange(10**17, 10**18), moderator.id, random.choice(('warn', 'mute', 'ban')), f'reason {index}', None)
+            for index in range(start, min(start + 10000, args.export_rows))
+        ])
+    exports = [asyncio.ensure_future(gateway.invoke('export', FakeInteraction(moderator, guild.channels[0]), format=fmt))
+               for fmt in ('ndjson', 'csv')]
+    count = args.count or SCENARIOS['modlog-export'][1]
+    rng = random.Random(3)
+
+    async def call(index):
+        await gateway.dispatch('on_message', FakeMessage(rng.choice(guild.channels), rng.choice(authors), f'hello {index}'))
+        if index == count - 1:
+            await asyncio.gather(*exports)
+    return call
+
+
+SCENARIOS = {
+    'purge-storm': (purge_storm, 50),
+    'lockdown-roles': (lockdown_roles, 10),
+    'highlight-chat': (highlight_chat, 5000),
+    'spam-flood': (spam_flood, 10000),
+    'join-raid': (join_raid, 2000),
+    'mass-ban': (mass_ban, 5),
+    'modlog-export': (modlog_export, 5000),
+}
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+async def run_scenario(botix, name, args):
+    setup, default_count = SCENARIOS[name]
+    rest = FakeRest(args.latency, args.jitter, args.route_limit, args.route_window, args.global_limit,
+                    args.random_429, on_rate_limit=botix.metrics.rate_limit)
+    gateway = FakeGateway(botix)
+    call = await setup(botix, gateway, rest, args)
+    count = args.count or default_count
+
+    gc.collect()
+    rss_before = rss_mb()
+    if args.trace_memory:
+        tracemalloc.start()
+    latencies, errors, elapsed = await gateway.drive(call, count, args.rate)
+    peak = tracemalloc.get_traced_memory()[1] / 2**20 if args.trace_memory else None
+    if args.trace_memory:
+        tracemalloc.stop()
+
+    return {
+        'scenario': name,
+        'count': count,
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'per_second': round(count / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'max_ms': round(max(latencies, default=0) * 1000, 1),
+        'rest_requests': rest.requests,
+        'rest_429s': rest.rate_limited,
+        'rss_mb': round(rss_mb(), 1),
+        'rss_delta_mb': round(rss_mb() - rss_before, 1),
+        'peak_traced_mb': round(peak, 1) if peak is not None else None,
+    }
+
+
+def import_botix(workdir):
+    # Run the bot's module in a scratch directory so it gets its own database and settings
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    import botix
+    botix.check_permissions = lambda ctx, required_permissions: True
+    return botix
+
+
+def print_table(results):
+    columns = ('scenario', 'count', 'errors', 'per_second', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms',
+               'rest_requests', 'rest_429s', 'rss_mb', 'rss_delta_mb', 'peak_traced_mb')
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print('  '.join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark botix handlers offline against a fake gateway and REST API.')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument('--count', type=int, help='arrivals per scenario (default depends on the scenario)')
+    parser.add_argument('--rate', type=float, default=200.0, help='arrivals per second, 0 for all at once')
+    parser.add_argument('--latency', type=float, default=0.02, help='simulated REST latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.01, help='REST latency jitter in seconds')
+    parser.add_argument('--route-limit', type=int, default=5, help='requests per route per window before a 429')
+    parser.add_argument('--route-window', type=float, default=1.0, help='route bucket window in seconds')
+    parser.add_argument('--global-limit', type=int, default=50, help='requests per second before a global 429')
+    parser.add_argument('--random-429', type=float, default=0.0, help='probability of a spurious 429')
+    parser.add_argument('--channels', type=int, default=10, help='channels per fake guild')
+    parser.add_argument('--roles', type=int, default=200, help='roles in the lockdown guild')
+    parser.add_argument('--history', type=int, default=1000, help='messages per channel for purge-storm')
+    parser.add_argument('--purge-count', type=int, default=200, help='messages each purge asks for')
+    parser.add_argument('--subscribers', type=int, default=500, help='highlight subscribers in highlight-chat')
+    parser.add_argument('--senders', type=int, default=100000, help='distinct message authors in spam-flood')
+    parser.add_argument('--batch-size', type=int, default=300, help='users banned per command in mass-ban')
+    parser.add_argument('--export-rows', type=int, default=300000, help='mod log cases in modlog-export')
+    parser.add_argument('--trace-memory', action='store_true', help='also report tracemalloc peak (slower)')
+    parser.add_argument('--json', metavar='PATH', help='write results as JSON to PATH')
+    parser.add_argument('--max-p99', type=float, metavar='MS', help='exit with status 1 if any scenario p99 exceeds MS')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    random.seed(0)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='botix-bench-') as workdir:
+        botix = import_botix(workdir)
+
+        async def run():
+            await botix.start_stores()
+            botix.jobs.start()
+            try:
+                return [await run_scenario(botix, name, args) for name in args.scenarios or SCENARIOS]
+            finally:
+                await botix.stop_stores()
+
+        try:
+            results = asyncio.run(run())
+        finally:
+            os.chdir(cwd)
+
+    print_table(results)
+    if json_path:
+        with open(json_path, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.max_p99 is not None and any(result['p99_ms'] > args.max_p99 for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
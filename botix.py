@@ -1,29 +1,481 @@
 import discord
 from discord.ext import commands
-import json
 import asyncio
 import datetime
+import os
+import tempfile
+import threading
+import time
+import traceback
+
+from storage import Database, ModerationStore
+from scheduler import Scheduler, parse_duration
+from highlights import Highlights
+from afk import AfkStore
+from customcmds import CustomCommands
+from lockdown import LockEngine
+from roles import MassRoleJobs, RoleEditQueue, RolePersistence, parse_roles
+from purge import build_filter, purge_messages
+from starboard import Starboard, STAR
+from settings import SETTING_MINIMUMS, SETTING_TYPES, SettingsStore
+from permissions import PermissionResolver
+from sync import CommandTree, sync_if_changed
+from cluster import ClusterClient
+from metrics import Metrics
+from jobs import JobRunner
+from export import QUERIES as EXPORT_KINDS, FORMATS as EXPORT_FORMATS, PART_HEADROOM, ExportCancelled, export_guild
+from spam import SpamFilter
+from members import MemberCache
+from raid import RaidDetector
+from massaction import MAX_DELETE_SECONDS, MassModeration, match_members, parse_ids
+from dispatcher import AUTOMATION, MODERATION, UTILITY, RestDispatcher, request
+from responses import EmojiIndex, PageView, ResponseCache, paginate_text, serverinfo_embed, whois_embed
 
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+# Bot-wide config.json and per-guild settings, hot-reloaded when the files change
+settings = SettingsStore('config.json', 'settings')
+permission_resolver = PermissionResolver(settings)
+
+# Member cache policy: 'full' caches every member of every guild (chunked at startup); 'lean'
+# skips chunking, caches only members in voice and keeps recently active members in member_cache
+member_options = {}
+lean_members = settings.config.get('member_cache', 'full') == 'lean'
+if lean_members:
+    member_options = {'chunk_guilds_at_startup': False, 'member_cache_flags': discord.MemberCacheFlags(joined=False)}
+
+# Under the cluster supervisor (cluster.py) this process only runs its assigned range of shards
+cluster = ClusterClient.from_env()
+if cluster is not None:
+    bot = commands.AutoShardedBot(command_prefix='!', intents=intents, tree_cls=CommandTree,
+                                  shard_ids=cluster.shard_ids, shard_count=cluster.shard_count, **member_options)
+else:
+    bot = commands.Bot(command_prefix='!', intents=intents, tree_cls=CommandTree, **member_options)
+
+# Latency histograms, error/rate-limit counters and loop lag, served on a local Prometheus endpoint
+metrics = Metrics()
+
+# Outbound REST requests are prioritised moderation > automation > utility and paced per route
+rest = RestDispatcher(concurrency=settings.config.get('rest_concurrency', 8), limits=settings.config.get('rest_limits'))
+role_edits = RoleEditQueue(rest)
+metrics.collectors.append(rest.metric_lines)
+member_cache = MemberCache(settings.config.get('member_cache_size', 50000) if lean_members else 0, rest=rest)
+metrics.collectors.append(member_cache.metric_lines)
+
+# Persistent storage and the timer scheduler shared by temprole, remindme, ban, mute and duration
+db = Database(settings.config.get('database', 'botix.db'))
+scheduler = Scheduler(db, owns=(lambda timer: cluster.owns_guild(timer.payload.get('guild_id'))) if cluster else None)
+moderation = ModerationStore(db)
+highlights_index = Highlights(db, cooldown=settings.config.get('highlight_cooldown', 300))
+afk_store = AfkStore(db)
+role_persistence = RolePersistence(db)
+mass_moderation = MassModeration(moderation, rest=rest, concurrency=settings.config.get('mass_action_concurrency', 4))
+lock_engine = LockEngine(db, concurrency=settings.config.get('lockdown_concurrency', 3), rest=rest)
+mass_roles = MassRoleJobs(db, concurrency=settings.config.get('mass_role_concurrency', 5), role_edits=role_edits)
+starboard_tracker = Starboard(
+    db,
+    settings_for_guild=settings.guild,
+    bot=bot,
+    rest=rest,
+)
+custom_commands = CustomCommands(db, prefix=bot.command_prefix, max_entries=settings.config.get('custom_command_cache_size', 50000))
+# Deferred background jobs for slow commands, with a per-guild cap on concurrently running jobs
+jobs = JobRunner(
+    workers=settings.config.get('job_workers', 4),
+    limit_for_guild=lambda guild_id: max(settings.guild(guild_id).job_concurrency, 1),
+)
+# Message rate state for per-user and server-wide slowmode and the spam rules
+spam_filter = SpamFilter(
+    window=settings.config.get('spam_window', 10.0),
+    max_entries=settings.config.get('spam_max_senders', 1_000_000),
+)
+metrics.collectors.append(spam_filter.metric_lines)
+# Join-burst detection per guild; settings raid_joins (0 = off), raid_window and raid_account_age
+raid_detector = RaidDetector(cooldown=settings.config.get('raid_cooldown', 600))
+# Prebuilt emotes/serverinfo/whois responses, dropped by the update events below
+response_cache = ResponseCache(max_entries=settings.config.get('response_cache_size', 5000))
+
+# Create tables and load the in-memory indexes of every store
+async def start_stores():
+    await settings.load()
+    await scheduler.setup()
+    await moderation.start()
+    await highlights_index.start()
+    await afk_store.start()
+    await custom_commands.start()
+    await lock_engine.start()
+    await role_persistence.start()
+    await starboard_tracker.start()
+
+# Stop background work, flush the write-behind stores and close the database; safe to repeat
+async def stop_stores():
+    await jobs.close()
+    await scheduler.stop()
+    await afk_store.stop()
+    await starboard_tracker.stop()
+    await db.close()
+
+# Disconnect first so no new events arrive, then shut the stores down
+async def close_bot(close=bot.close):
+    try:
+        await close()
+    finally:
+        await stop_stores()
+
+bot.close = close_bot
 
-# Load configuration from config.json
-with open('config.json') as config_file:
-    config = json.load(config_file)
+# Prepare storage and sync slash commands once per process, before connecting to the gateway
+@bot.event
+async def setup_hook():
+    started = time.perf_counter()
+    metrics_port = settings.config.get('metrics_port', 9108)
+    if metrics_port and cluster is not None:
+        metrics_port += cluster.cluster_id
+    metrics.start(port=metrics_port)
+    jobs.start()
+    await start_stores()
+
+    # The command schema is hashed and only sent to Discord when it changed since the last sync;
+    # in cluster mode only the first cluster syncs
+    if cluster is not None and cluster.cluster_id != 0:
+        print(f'Setup finished in {(time.perf_counter() - started) * 1000:.0f}ms (cluster {cluster.cluster_id})')
+        return
+    sync_guild = settings.config.get('sync_guild')
+    guild = discord.Object(id=sync_guild) if sync_guild else None
+    if guild is not None:
+        bot.tree.copy_global_to(guild=guild)
+    synced = await sync_if_changed(bot.tree, db, guild=guild, force=settings.config.get('force_sync', False))
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"Setup finished in {elapsed:.0f}ms ({'synced' if synced else 'skipped'} command sync)")
 
 # Set bot's activity
 @bot.event
 async def on_ready():
     print(f'Logged in as {bot.user.name}')
     await bot.change_presence(activity=discord.Game(name='Managing servers'))
-
-# Helper function to check permissions
+    settings.start()
+    # Anything that acts on guilds waits for the guild cache
+    await scheduler.start()
+    await mass_roles.start(bot)
+    if cluster is not None:
+        await cluster.start(cluster_stats)
+
+# Stats this process reports to the cluster supervisor
+def cluster_stats():
+    return {
+        'guilds': len(bot.guilds),
+        'members': sum(guild.member_count or 0 for guild in bot.guilds),
+        'latencies': {str(shard_id): latency for shard_id, latency in bot.latencies} if cluster else {'0': bot.latency},
+    }
+
+# Stats of every cluster, or of this process alone when not running under the supervisor
+async def gather_stats():
+    if cluster is not None:
+        try:
+            return await cluster.stats()
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+    return {
+        'started_at': cluster.started_at if cluster else None,
+        'shard_count': bot.shard_count or 1,
+        'clusters': {'0': dict(cluster_stats(), started_at=cluster.started_at if cluster else None)},
+    }
+
+# Record how long each slash command took and whether it failed
+@bot.listen('on_app_command_completion')
+async def record_command(interaction, command):
+    received_at = interaction.extras.get('received_at')
+    if received_at is not None:
+        metrics.observe_command(command.qualified_name, time.perf_counter() - received_at)
+
+@bot.tree.error
+async def on_app_command_error(interaction, error):
+    received_at = interaction.extras.get('received_at', time.perf_counter())
+    name = interaction.command.qualified_name if interaction.command else 'unknown'
+    metrics.observe_command(name, time.perf_counter() - received_at, error=True)
+    print(f'Ignoring exception in command {name!r}')
+    traceback.print_exception(type(error), error, error.__traceback__)
+
+# Log a timer that failed to fire; the scheduler retries it with backoff
+def log_timer_error(timer, error):
+    print(f'{timer.kind} timer {timer.id} failed:')
+    traceback.print_exception(type(error), error, error.__traceback__)
+
+# Remove roles for a batch of timers, one member edit per member; returns the timers that failed
+async def remove_timed_roles(timers, reason):
+    by_member = {}
+    for timer in timers:
+        key = (timer.payload['guild_id'], timer.payload['user_id'])
+        by_member.setdefault(key, []).append(timer)
+
+    failed = []
+    for (guild_id, user_id), member_timers in by_member.items():
+        guild = bot.get_guild(guild_id)
+        if guild is None:
+            continue
+        try:
+            # A cached member may predate the mute or temprole, so its roles cannot be trusted here
+            member = await member_cache.fetch(guild, user_id, priority=AUTOMATION, fresh=True)
+            roles = [role for role in (guild.get_role(timer.payload['role_id']) for timer in member_timers) if role is not None]
+            if member is not None and roles:
+                await role_edits.edit(member, remove=roles, reason=reason, priority=AUTOMATION)
+        except discord.HTTPException as error:
+            log_timer_error(member_timers[0], error)
+            failed.extend(member_timers)
+    return failed
+
+@scheduler.handler('temprole')
+async def expire_temproles(timers):
+    return await remove_timed_roles(timers, 'Temporary role expired')
+
+# Close the cases behind expired timed mutes/bans and log the automatic reversal in one transaction
+async def record_expired_cases(timers, action, reason):
+    if not timers:
+        return
+    await moderation.add_cases([
+        (timer.payload['guild_id'], timer.payload['user_id'], bot.user.id, action, reason, None)
+        for timer in timers
+    ])
+    await moderation.deactivate_cases([timer.payload['case_id'] for timer in timers if 'case_id' in timer.payload])
+
+@scheduler.handler('unmute')
+async def expire_mutes(timers):
+    failed = await remove_timed_roles(timers, 'Mute expired')
+    failed_ids = {timer.id for timer in failed}
+    await record_expired_cases([timer for timer in timers if timer.id not in failed_ids], 'unmute', 'Mute expired')
+    return failed
+
+@scheduler.handler('unban')
+async def expire_bans(timers):
+    unbanned, failed = [], []
+    for timer in timers:
+        guild = bot.get_guild(timer.payload['guild_id'])
+        if guild is None:
+            continue
+        try:
+            await request(rest, AUTOMATION, ('guild.unban', guild.id),
+                          lambda: guild.unban(discord.Object(id=timer.payload['user_id']), reason='Temporary ban expired'))
+        except discord.NotFound:
+            pass
+        except discord.HTTPException as error:
+            log_timer_error(timer, error)
+            failed.append(timer)
+            continue
+        unbanned.append(timer)
+    await record_expired_cases(unbanned, 'unban', 'Temporary ban expired')
+    return failed
+
+@scheduler.handler('reminder')
+async def send_reminders(timers):
+    failed = []
+    for timer in timers:
+        channel = bot.get_channel(timer.payload['channel_id'])
+        try:
+            if channel is None:
+                channel = await bot.fetch_channel(timer.payload['channel_id'])
+            await request(rest, UTILITY, ('channel.send', channel.id),
+                          lambda: channel.send(f"<@{timer.payload['user_id']}> Reminder: {timer.payload['reminder']}"))
+        except discord.NotFound:
+            pass
+        except discord.HTTPException as error:
+            log_timer_error(timer, error)
+            failed.append(timer)
+    return failed
+
+# Cancel the pending timer of a timed mute/ban and mark its case inactive
+async def end_timed_case(key):
+    timer = await scheduler.cancel_key(key)
+    if timer is not None and 'case_id' in timer.payload:
+        await moderation.deactivate_cases([timer.payload['case_id']])
+
+# Helper to format a moderation case as a single line
+def format_case(case):
+    line = f"**Case {case['id']}** | {case['action']} | <@{case['target_id']}> by <@{case['moderator_id']}> | <t:{int(case['created_at'])}:f>"
+    if case['expires_at']:
+        line += f" | expires <t:{int(case['expires_at'])}:R>"
+    line += f"\n> {case['reason'] or 'No reason given'}"
+    if case['deleted']:
+        line = f"~~{line}~~"
+    return line
+
+# Run a purge as a background job with an ephemeral response that is edited as batches are deleted
+async def run_purge(interaction, name, limit, check, before=None, after=None):
+    channel = interaction.channel
+
+    async def work(job):
+        async def report(deleted, scanned):
+            await job.update(f"Deleting messages... {deleted} deleted, {scanned} scanned.")
+
+        deleted, scanned = await purge_messages(
+            channel, limit, check,
+            before=before, after=after,
+            scan_limit=settings.config.get('purge_scan_limit', 10000),
+            progress=report,
+            rest=rest,
+        )
+        return f"Deleted {deleted} messages ({scanned} scanned)."
+
+    await jobs.submit(interaction, name, work, description=f"up to {limit} messages in {channel.mention}", ephemeral=True)
+
+# Helper to parse an optional message ID argument into a snowflake
+def message_snowflake(value):
+    return discord.Object(id=int(value)) if value else None
+
+# Helper to find the mute role: the configured one, or a role named Muted
+def get_mute_role(guild):
+    role_id = settings.guild(guild.id).mute_role
+    return guild.get_role(role_id) if role_id else discord.utils.get(guild.roles, name='Muted')
+
+# Helper function to check permissions, including mod/admin grants from addmod/addadmin
 def check_permissions(ctx, required_permissions):
-    user_permissions = ctx.author.permissions_in(ctx.channel)
-    return all(getattr(user_permissions, perm, False) for perm in required_permissions)
+    user = getattr(ctx, 'user', None) or ctx.author
+    return permission_resolver.has(user, ctx.channel, required_permissions)
+
+# Drop memoized permissions when roles, channel overwrites or guild ownership change.
+# Member role changes need nothing: entries are keyed on the member's role set.
+@bot.listen('on_guild_role_create')
+@bot.listen('on_guild_role_delete')
+async def invalidate_role_permissions(role):
+    permission_resolver.invalidate_guild(role.guild.id)
+
+@bot.listen('on_guild_role_update')
+async def invalidate_updated_role_permissions(before, after):
+    if before.permissions != after.permissions or before.position != after.position:
+        permission_resolver.invalidate_guild(after.guild.id)
+
+@bot.listen('on_guild_channel_update')
+async def invalidate_channel_permissions(before, after):
+    if before.overwrites != after.overwrites or getattr(before, 'category_id', None) != getattr(after, 'category_id', None):
+        permission_resolver.invalidate_channel(after.guild.id, after.id)
+
+@bot.listen('on_guild_channel_delete')
+async def invalidate_deleted_channel_permissions(channel):
+    permission_resolver.invalidate_channel(channel.guild.id, channel.id)
+
+@bot.listen('on_guild_update')
+async def invalidate_guild_permissions(before, after):
+    if before.owner_id != after.owner_id:
+        permission_resolver.invalidate_guild(after.id)
+
+@bot.listen('on_guild_remove')
+async def forget_guild_permissions(guild):
+    permission_resolver.invalidate_guild(guild.id)
+
+# Drop cached responses when the data they show changes
+@bot.listen('on_guild_emojis_update')
+async def invalidate_emoji_responses(guild, before, after):
+    response_cache.invalidate(guild.id, 'emoji_index')
+    response_cache.invalidate(guild.id, 'emotes')
+    response_cache.invalidate(guild.id, 'serverinfo')
+
+@bot.listen('on_guild_update')
+async def invalidate_guild_responses(before, after):
+    response_cache.invalidate(after.id, 'serverinfo')
+
+@bot.listen('on_guild_channel_create')
+@bot.listen('on_guild_channel_delete')
+@bot.listen('on_guild_role_create')
+@bot.listen('on_guild_role_delete')
+async def invalidate_serverinfo(target):
+    response_cache.invalidate(target.guild.id, 'serverinfo')
+
+@bot.listen('on_guild_role_update')
+async def invalidate_role_responses(before, after):
+    # Role names and colours show up in every whois
+    response_cache.invalidate(after.guild.id, 'whois')
+
+@bot.listen('on_member_join')
+@bot.listen('on_member_remove')
+async def invalidate_member_count(member):
+    response_cache.invalidate(member.guild.id, 'serverinfo')
+    response_cache.invalidate(member.guild.id, 'whois', member.id)
+
+@bot.listen('on_member_update')
+async def invalidate_member_responses(before, after):
+    response_cache.invalidate(after.guild.id, 'whois', after.id)
+
+# Keep recently active members in the lean member cache; slash command Member options need no
+# cache at all because Discord sends the resolved member with the interaction
+@bot.listen('on_message')
+async def remember_author(message):
+    member_cache.touch(message.author)
+
+@bot.listen('on_interaction')
+async def remember_interaction_user(interaction):
+    member_cache.touch(interaction.user)
+
+@bot.listen('on_member_join')
+async def remember_joined_member(member):
+    member_cache.touch(member)
+
+# Give rejoining members their persisted roles back in one member edit; members with nothing
+# persisted cost a single dict lookup
+@bot.listen('on_member_join')
+async def restore_persisted_roles(member):
+    roles = role_persistence.restorable(member)
+    if roles:
+        await role_edits.edit(member, add=roles, reason="Restoring persisted roles", priority=AUTOMATION)
+
+# Count joins per guild; a burst of young accounts locks the lockdown channels and alerts the mods
+@bot.listen('on_member_join')
+@metrics.timed_event('on_member_join')
+async def detect_raid(member):
+    config = settings.guild(member.guild.id)
+    if not config.raid_joins or member.bot:
+        return
+    account_age = (discord.utils.utcnow() - member.created_at).total_seconds()
+    if raid_detector.record(member.guild.id, member.id, account_age, config.raid_joins,
+                            window=config.raid_window, young_age=config.raid_account_age * 86400):
+        await start_raid_lockdown(member.guild, config)
+
+async def start_raid_lockdown(guild, config):
+    channels = [channel for channel in map(guild.get_channel, config.lockdown_channels) if channel is not None]
+    summary = "No lockdown channels are configured, so nothing was locked."
+    if channels:
+        changed, skipped, failed = await lock_engine.apply(
+            channels,
+            reason="Raid detected",
+            message="This channel has been locked while a raid is handled.",
+            priority=MODERATION,
+        )
+        summary = f"Locked {changed} channels" + (f", {failed} failed" if failed else "") + "."
+
+    alert_channel = guild.get_channel(config.raid_alert_channel) if config.raid_alert_channel else None
+    if alert_channel is None:
+        return
+    joins, young, _ = raid_detector.status(guild.id)
+    await request(rest, MODERATION, ('channel.send', alert_channel.id), lambda: alert_channel.send(
+        f"Raid detected: {young} accounts younger than {config.raid_account_age} days joined in the last "
+        f"{config.raid_window} seconds ({joins} joins in total). {summary}\n"
+        f"Suspicious accounts are queued for review: use `/raid review`, and `/raid end` once it is over."
+    ))
+
+@bot.listen('on_guild_remove')
+async def forget_guild_joins(guild):
+    raid_detector.forget(guild.id)
+
+@bot.listen('on_guild_role_delete')
+async def forget_persisted_role(role):
+    await role_persistence.remove_role(role.guild.id, role.id)
+
+@bot.listen('on_member_remove')
+async def forget_member(member):
+    member_cache.discard(member.guild.id, member.id)
+
+@bot.listen('on_guild_remove')
+async def forget_guild_members(guild):
+    member_cache.discard_guild(guild.id)
+
+@bot.listen('on_user_update')
+async def invalidate_user_responses(before, after):
+    for guild in after.mutual_guilds:
+        response_cache.invalidate(guild.id, 'whois', after.id)
+
+@bot.listen('on_guild_remove')
+async def forget_guild_responses(guild):
+    response_cache.invalidate_guild(guild.id)
 
 # Lock command
 @bot.tree.command(name='lock', description='Lock a channel for all roles except specified ones.')
@@ -32,16 +484,16 @@ async def lock(interaction: discord.Interaction, channel: discord.TextChannel):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    allowed_roles = [role.id for role in interaction.guild.roles if role.permissions.administrator or role.permissions.manage_messages]
-    for role in interaction.guild.roles:
-        if role.id not in allowed_roles:
-            await channel.set_permissions(role, send_messages=False)
-    
-    await interaction.response.send_message(f"Channel {channel.mention} has been locked for all roles except allowed ones.")
+    async def work(job):
+        if not await lock_engine.lock(channel, reason=f"Locked by {interaction.user}", priority=MODERATION):
+            return f"Channel {channel.mention} is already locked."
+        return f"Channel {channel.mention} has been locked for all roles except allowed ones."
+
+    await jobs.submit(interaction, 'lock', work, description=channel.mention)
 
-# Slowmode command
-@bot.tree.command(name='slowmode', description='Enable/disable slowmode for a channel or user.')
-async def slowmode(interaction: discord.Interaction, mode: str, channel: discord.TextChannel, limit: int):
+# Slowmode command; 'user' and 'discord' (server-wide) slowmode are enforced by filter_spam, 0 turns it off
+@bot.tree.command(name='slowmode', description='Enable/disable slowmode for a channel, a user or the whole server.')
+async def slowmode(interaction: discord.Interaction, mode: str, limit: int, channel: discord.TextChannel = None, user: discord.Member = None):
     if not check_permissions(interaction, ['manage_channels']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
@@ -49,66 +501,159 @@ async def slowmode(interaction: discord.Interaction, mode: str, channel: discord
     if mode not in ['channel', 'user', 'discord']:
         await interaction.response.send_message("Invalid mode. Use 'channel', 'user', or 'discord'.")
         return
+    if limit < 0:
+        await interaction.response.send_message("The limit must be 0 or more seconds.")
+        return
 
     if mode == 'channel':
-        await channel.edit(slowmode_delay=limit)
+        channel = channel or interaction.channel
+        await request(rest, MODERATION, ('channel.edit', channel.id), lambda: channel.edit(slowmode_delay=limit))
         await interaction.response.send_message(f"Slowmode set to {limit} seconds for {channel.mention}.")
     elif mode == 'user':
-        await interaction.response.send_message("User-specific slowmode is not supported in this implementation.")
+        if user is None:
+            await interaction.response.send_message("Specify the user to slow down.")
+            return
+        user_slowmode = dict(settings.guild(interaction.guild.id).user_slowmode)
+        if limit:
+            user_slowmode[str(user.id)] = limit
+        else:
+            user_slowmode.pop(str(user.id), None)
+        settings.update(interaction.guild.id, user_slowmode=user_slowmode)
+        if limit:
+            await interaction.response.send_message(f"{user.mention} can now send one message every {limit} seconds.")
+        else:
+            await interaction.response.send_message(f"Slowmode removed for {user.mention}.")
     elif mode == 'discord':
-        await interaction.response.send_message("Server-wide slowmode is not directly supported.")
+        settings.update(interaction.guild.id, server_slowmode=limit)
+        if limit:
+            await interaction.response.send_message(f"Every member can now send one message every {limit} seconds across the server.")
+        else:
+            await interaction.response.send_message("Server-wide slowmode disabled.")
+
+# Delete messages that break user or server-wide slowmode or the duplicate and mention spam rules.
+# Guilds with no limits configured return after the settings lookup; members who can manage
+# messages are exempt, checked only once a message has already broken a rule.
+@bot.listen('on_message')
+@metrics.timed_event('on_message')
+async def filter_spam(message):
+    if message.author.bot or message.guild is None:
+        return
+
+    config = settings.guild(message.guild.id)
+    slowmode = config.server_slowmode
+    if config.user_slowmode:
+        slowmode = max(slowmode, config.user_slowmode.get(str(message.author.id), 0))
+    if not (slowmode or config.spam_duplicates or config.spam_mentions):
+        return
+
+    mentions = len(message.mentions) + len(message.role_mentions) + (1 if message.mention_everyone else 0)
+    rule = spam_filter.check(
+        message.guild.id, message.author.id, message.content, mentions,
+        slowmode=slowmode, max_duplicates=config.spam_duplicates, max_mentions=config.spam_mentions,
+    )
+    if rule is None:
+        return
+    permissions = getattr(message.author, 'guild_permissions', None)
+    if permissions is not None and permissions.manage_messages:
+        return
+    try:
+        await request(rest, AUTOMATION, ('message.delete', message.channel.id), message.delete)
+    except discord.HTTPException:
+        pass
 
 # Addmod command
-@bot.tree.command(name='addmod', description='Add a moderator role to a user.')
+@bot.tree.command(name='addmod', description='Register a role as a moderator role.')
 async def addmod(interaction: discord.Interaction, role: discord.Role):
-    if not check_permissions(interaction, ['manage_roles']):
+    # Mod roles grant manage_roles themselves, so promoting one needs a permission they do not grant
+    if not check_permissions(interaction, ['manage_guild']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Add moderator role to the user (custom logic needed)
-    await interaction.user.add_roles(role)
-    await interaction.response.send_message(f"Added {role.name} role to {interaction.user.mention}")
+    # Members with a mod role get moderation command access through check_permissions
+    mod_roles = settings.guild(interaction.guild.id).mod_roles
+    if role.id in mod_roles:
+        await interaction.response.send_message(f"{role.name} is already a moderator role.")
+        return
+    settings.update(interaction.guild.id, mod_roles=mod_roles + [role.id])
+    await interaction.response.send_message(f"Added {role.name} as a moderator role.")
 
 # Addadmin command
 @bot.tree.command(name='addadmin', description='Grant full access to all commands to the mentioned user.')
 async def addadmin(interaction: discord.Interaction, user: discord.Member):
-    if not check_permissions(interaction, ['manage_roles']):
+    if not check_permissions(interaction, ['administrator']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Grant admin role to the user (custom logic needed)
-    admin_role = discord.utils.get(interaction.guild.roles, name='Admin')
-    if admin_role:
-        await user.add_roles(admin_role)
-        await interaction.response.send_message(f"Granted admin access to {user.mention}")
-    else:
-        await interaction.response.send_message("Admin role does not exist in this server.")
+    admin_users = settings.guild(interaction.guild.id).admin_users
+    if user.id in admin_users:
+        await interaction.response.send_message(f"{user.mention} already has admin access.")
+        return
+    settings.update(interaction.guild.id, admin_users=admin_users + [user.id])
+    await interaction.response.send_message(f"Granted admin access to {user.mention}")
 
 # AFK Commands
 @bot.tree.command(name='afk', description='Set an AFK status to display when you are mentioned.')
 async def afk(interaction: discord.Interaction, *, status: str):
-    # Store AFK status in a database or cache
-    # For demonstration, just sending a message
+    afk_store.set(interaction.guild.id, interaction.user.id, status)
     await interaction.response.send_message(f"AFK status set to: {status}")
 
 @bot.tree.command(name='afkreset', description='Reset the AFK status for a user.')
 async def afkreset(interaction: discord.Interaction, user: discord.Member):
-    # Remove AFK status from the database or cache
-    # For demonstration, just sending a message
+    if afk_store.clear(interaction.guild.id, user.id) is None:
+        await interaction.response.send_message(f"{user.mention} is not AFK.")
+        return
     await interaction.response.send_message(f"AFK status reset for {user.mention}")
 
+# Clear the author's AFK status and report AFK members that were mentioned, without any I/O on the lookup
+@bot.listen('on_message')
+@metrics.timed_event('on_message')
+async def check_afk(message):
+    if message.author.bot or message.guild is None:
+        return
+
+    guild_id = message.guild.id
+    if afk_store.clear(guild_id, message.author.id) is not None:
+        await message.channel.send(f"Welcome back {message.author.mention}, I removed your AFK status.", delete_after=10)
+
+    if not message.mentions or not len(afk_store):
+        return
+    notices = []
+    seen = set()
+    for member in message.mentions:
+        if member.id in seen:
+            continue
+        seen.add(member.id)
+        entry = afk_store.get(guild_id, member.id)
+        if entry is not None:
+            status, since = entry
+            notices.append(f"{member.display_name} is AFK: {status} (<t:{int(since)}:R>)")
+    if notices:
+        await message.reply('\n'.join(notices), mention_author=False)
+
 # Info command
 @bot.tree.command(name='info', description='Get bot info.')
 async def info(interaction: discord.Interaction):
-    await interaction.response.send_message(f"Bot name: {bot.user.name}\nBot ID: {bot.user.id}")
+    stats = await gather_stats()
+    clusters = stats['clusters'].values()
+    await interaction.response.send_message(
+        f"Bot name: {bot.user.name}\nBot ID: {bot.user.id}\n"
+        f"Servers: {sum(c['guilds'] for c in clusters)}\nMembers: {sum(c['members'] for c in clusters)}\n"
+        f"Shards: {stats['shard_count']} across {len(stats['clusters'])} cluster(s)"
+    )
 
 # Uptime command
 @bot.tree.command(name='uptime', description='Get bot uptime.')
 async def uptime(interaction: discord.Interaction):
-    # Track the bot's start time
-    start_time = datetime.datetime.utcnow()
-    uptime_duration = datetime.datetime.utcnow() - start_time
-    await interaction.response.send_message(f"Bot has been up for: {uptime_duration}")
+    if cluster is None:
+        uptime_duration = datetime.timedelta(seconds=int(metrics.uptime()))
+        await interaction.response.send_message(f"Bot has been up for: {uptime_duration}")
+        return
+    stats = await gather_stats()
+    now = time.time()
+    lines = [f"Cluster has been up for: {datetime.timedelta(seconds=int(now - stats['started_at']))}"]
+    for cluster_id, data in sorted(stats['clusters'].items(), key=lambda item: int(item[0])):
+        lines.append(f"Cluster {cluster_id}: {datetime.timedelta(seconds=int(now - data['started_at']))}")
+    await interaction.response.send_message('\n'.join(lines))
 
 # Example of additional commands
 @bot.tree.command(name='avatar', description='Get a user\'s avatar.')
@@ -129,26 +674,42 @@ async def membercount(interaction: discord.Interaction):
 @bot.tree.command(name='remindme', description='Set a reminder.')
 async def remindme(interaction: discord.Interaction, time: str, *, reminder: str):
     try:
-        time = int(time)
-        await asyncio.sleep(time)
-        await interaction.response.send_message(f"Reminder: {reminder}")
+        delay = parse_duration(time)
     except ValueError:
-        await interaction.response.send_message("Invalid time format. Use seconds.")
+        await interaction.response.send_message("Invalid time format. Use e.g. 90, 10m, 1h30m or 2d.")
+        return
+
+    async def work(job):
+        await scheduler.schedule('reminder', delay, {
+            'guild_id': interaction.guild_id,
+            'channel_id': interaction.channel_id,
+            'user_id': interaction.user.id,
+            'reminder': reminder,
+        })
+        return f"I'll remind you in {time}."
+
+    await jobs.submit(interaction, 'remindme', work, description=f"in {time}", ephemeral=True)
 
 @bot.tree.command(name='whois', description='Get user information.')
 async def whois(interaction: discord.Interaction, user: discord.Member):
-    embed = discord.Embed(title=f"User Info: {user.name}", description=f"ID: {user.id}")
-    embed.set_thumbnail(url=user.avatar.url)
+    embed = response_cache.get(interaction.guild.id, 'whois', user.id, lambda: whois_embed(user))
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name='purge', description='Delete a number of messages from a channel.')
-async def purge(interaction: discord.Interaction, count: int):
+async def purge(interaction: discord.Interaction, count: discord.app_commands.Range[int, 1], user: discord.User = None,
+                bots: bool = False, contains: str = None, attachments: bool = False, before: str = None, after: str = None):
     if not check_permissions(interaction, ['manage_messages']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    await interaction.channel.purge(limit=count)
-    await interaction.response.send_message(f"Deleted {count} messages.")
+    try:
+        before, after = message_snowflake(before), message_snowflake(after)
+    except ValueError:
+        await interaction.response.send_message("Invalid message ID for before/after.")
+        return
+
+    check = build_filter(author_id=user.id if user else None, bots_only=bots, contains=contains, attachments=attachments)
+    await run_purge(interaction, 'purge', count, check, before=before, after=after)
 
 @bot.tree.command(name='announce', description='Send an announcement using the bot.')
 async def announce(interaction: discord.Interaction, channel: discord.TextChannel, *, message: str):
@@ -187,21 +748,79 @@ async def rolename(interaction: discord.Interaction, role: discord.Role, *, new_
     await interaction.response.send_message(f"Role name changed to {new_name}.")
 
 @bot.tree.command(name='role', description='Add/remove a user to a role or roles.')
-async def role(interaction: discord.Interaction, user: discord.Member, action: str, *roles: discord.Role):
+async def role(interaction: discord.Interaction, user: discord.Member, action: str, roles: str):
     if not check_permissions(interaction, ['manage_roles']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
+    if action not in ('add', 'remove', 'toggle'):
+        await interaction.response.send_message("Invalid action. Use 'add', 'remove' or 'toggle'.")
+        return
+
+    parsed, unknown = parse_roles(interaction.guild, roles)
+    if unknown:
+        await interaction.response.send_message(f"Unknown roles: {', '.join(unknown)}")
+        return
+
     if action == 'add':
-        for role in roles:
-            await user.add_roles(role)
-        await interaction.response.send_message(f"Added roles to {user.mention}.")
+        add, remove = parsed, []
     elif action == 'remove':
-        for role in roles:
-            await user.remove_roles(role)
-        await interaction.response.send_message(f"Removed roles from {user.mention}.")
+        add, remove = [], parsed
     else:
-        await interaction.response.send_message("Invalid action. Use 'add' or 'remove'.")
+        add = [r for r in parsed if r not in user.roles]
+        remove = [r for r in parsed if r in user.roles]
+
+    added, removed = await role_edits.edit(user, add, remove, reason=f"Role command by {interaction.user}")
+    changes = [f"added {', '.join(r.name for r in added)}"] if added else []
+    if removed:
+        changes.append(f"removed {', '.join(r.name for r in removed)}")
+    if not changes:
+        await interaction.response.send_message(f"No role changes needed for {user.mention}.")
+        return
+    await interaction.response.send_message(f"Roles for {user.mention}: {'; '.join(changes)}.")
+
+# Command to add or remove a role for every member matching a filter
+@bot.tree.command(name='massrole', description='Add/remove a role for all members, optionally filtered by role or join date.')
+async def massrole(interaction: discord.Interaction, action: str, role: discord.Role = None, has_role: discord.Role = None, joined_after: str = None):
+    if not check_permissions(interaction, ['manage_roles']):
+        await interaction.response.send_message("You don't have permission to use this command.")
+        return
+
+    job = mass_roles.running(interaction.guild.id)
+    if action == 'status':
+        if job is None:
+            await interaction.response.send_message("No mass role job is running.")
+            return
+        await interaction.response.send_message(
+            f"Mass role job #{job.id} ({job.describe()}): {job.processed} checked, {job.changed} changed, {job.failed} failed."
+        )
+        return
+    if action == 'cancel':
+        job = await mass_roles.cancel(interaction.guild.id)
+        await interaction.response.send_message(f"Cancelled mass role job #{job.id}." if job else "No mass role job is running.")
+        return
+
+    if action not in ('add', 'remove') or role is None:
+        await interaction.response.send_message("Invalid action. Use 'add <role>', 'remove <role>', 'status' or 'cancel'.")
+        return
+    if job is not None:
+        await interaction.response.send_message(f"Mass role job #{job.id} is already running. Cancel it first.")
+        return
+
+    since = None
+    if joined_after:
+        # Either a date (2024-01-31) or a duration meaning "within the last ..."
+        try:
+            since = datetime.datetime.fromisoformat(joined_after).replace(tzinfo=datetime.timezone.utc).timestamp()
+        except ValueError:
+            try:
+                since = time.time() - parse_duration(joined_after)
+            except ValueError:
+                await interaction.response.send_message("Invalid join date. Use a date like 2024-01-31 or a duration like 7d.")
+                return
+
+    job = await mass_roles.create(interaction.guild, interaction.channel_id, interaction.user.id, action, role, has_role, since)
+    await interaction.response.send_message(f"Started mass role job #{job.id}: {job.describe()}. Check progress with `/massrole status`.")
 
 @bot.tree.command(name='temprole', description='Assign/unassign a temporary role to a user.')
 async def temprole(interaction: discord.Interaction, user: discord.Member, time: str, role: discord.Role, *, reason: str = None):
@@ -209,23 +828,104 @@ async def temprole(interaction: discord.Interaction, user: discord.Member, time:
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    await user.add_roles(role)
-    await interaction.response.send_message(f"Temporary role {role.name} assigned to {user.mention} for {time}.")
+    try:
+        delay = parse_duration(time)
+    except ValueError:
+        await interaction.response.send_message("Invalid time format. Use e.g. 90, 10m, 1h30m or 2d.")
+        return
+
+    async def work(job):
+        await role_edits.edit(user, add=[role], reason=reason)
+        await scheduler.schedule('temprole', delay, {
+            'guild_id': interaction.guild.id,
+            'user_id': user.id,
+            'role_id': role.id,
+        }, key=f'temprole:{interaction.guild.id}:{user.id}:{role.id}')
+        return f"Temporary role {role.name} assigned to {user.mention} for {time}."
 
-    # Remove role after time (handling needs to be implemented)
-    await asyncio.sleep(int(time))
-    await user.remove_roles(role)
-    await interaction.response.send_message(f"Temporary role {role.name} removed from {user.mention}.")
+    await jobs.submit(interaction, 'temprole', work, description=f"{role.name} for {user} ({time})")
 
 @bot.tree.command(name='modlogs', description='Get a list of moderation logs for a user.')
-async def modlogs(interaction: discord.Interaction, user: discord.Member, page: int = 1):
+async def modlogs(interaction: discord.Interaction, user: discord.User, page: int = 1):
+    if not check_permissions(interaction, ['view_audit_log']):
+        await interaction.response.send_message("You don't have permission to use this command.")
+        return
+
+    cases, pages = await moderation.modlogs_page(interaction.guild.id, user.id, max(page, 1))
+    if not cases:
+        await interaction.response.send_message(f"No moderation logs for {user.mention} on page {page}.")
+        return
+
+    embed = discord.Embed(title=f"Moderation logs for {user} (Page {page}/{pages})")
+    embed.description = '\n'.join(format_case(case) for case in cases)[:4096]
+    await interaction.response.send_message(embed=embed)
+
+# Upload one finished export part to the invoker, by DM once the interaction has expired
+async def send_export_part(interaction, path, content):
+    filename = os.path.basename(path)
+    try:
+        await request(rest, UTILITY, ('channel.send', interaction.channel_id), lambda: interaction.followup.send(
+            content, file=discord.File(path, filename=filename), ephemeral=True))
+    except discord.HTTPException:
+        await request(rest, UTILITY, ('user.dm', interaction.user.id), lambda: interaction.user.send(
+            content, file=discord.File(path, filename=filename)))
+
+# Stream the server's mod log, warnings and notes into gzip-compressed NDJSON or CSV attachments.
+# The export runs on a worker thread with its own read-only connection, uploading each part as
+# soon as it is written, so neither the event loop nor the database thread waits on it.
+@bot.tree.command(name='export', description="Export this server's moderation history as compressed NDJSON or CSV files.")
+async def export_modlogs(interaction: discord.Interaction, kind: str = 'all', format: str = 'ndjson'):
     if not check_permissions(interaction, ['view_audit_log']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Fetch logs (mock example)
-    logs = f"Moderation logs for {user.mention} (Page {page})"
-    await interaction.response.send_message(logs)
+    if kind != 'all' and kind not in EXPORT_KINDS:
+        await interaction.response.send_message(f"Invalid kind. Use 'all', {', '.join(repr(name) for name in EXPORT_KINDS)}.")
+        return
+    if format not in EXPORT_FORMATS:
+        await interaction.response.send_message("Invalid format. Use 'ndjson' or 'csv'.")
+        return
+
+    guild = interaction.guild
+    kinds = ('cases', 'notes') if kind == 'all' else (kind,)
+    part_size = settings.config.get('export_part_size', guild.filesize_limit)
+    if not isinstance(part_size, int) or part_size <= PART_HEADROOM:
+        await interaction.response.send_message(
+            f"The export_part_size setting must be a number of bytes above {PART_HEADROOM}; ask the bot owner to fix it.")
+        return
+    part_limit = min(part_size, guild.filesize_limit)
+
+    async def work(job):
+        loop = asyncio.get_running_loop()
+        stop = threading.Event()
+        parts = []
+
+        def upload(part_kind, path, rows):
+            # Called on the export thread; waiting for the upload keeps at most one part on disk
+            parts.append(path)
+            asyncio.run_coroutine_threadsafe(
+                send_export_part(interaction, path, f"Part {len(parts)}: {rows} {part_kind} rows"), loop).result()
+            os.remove(path)
+            asyncio.run_coroutine_threadsafe(job.update(f"Uploaded {len(parts)} parts..."), loop)
+
+        with tempfile.TemporaryDirectory(prefix='botix-export-') as directory:
+            thread = asyncio.ensure_future(asyncio.to_thread(
+                export_guild, db.path, guild.id, kinds, format, directory, part_limit, stop, upload))
+            try:
+                totals = await asyncio.shield(thread)
+            except asyncio.CancelledError:
+                # Let the thread stop at its next batch before the directory is removed
+                stop.set()
+                await asyncio.wait((thread,))
+                error = None if thread.cancelled() else thread.exception()
+                if error is not None and not isinstance(error, ExportCancelled):
+                    traceback.print_exception(type(error), error, error.__traceback__)
+                raise
+        if not parts:
+            return "There is no moderation history to export."
+        return f"Exported {', '.join(f'{rows} {name}' for name, rows in totals.items())} in {len(parts)} files."
+
+    await jobs.submit(interaction, 'export', work, description=f"{kind} as {format}", ephemeral=True)
 
 @bot.tree.command(name='warn', description='Warn a member.')
 async def warn(interaction: discord.Interaction, user: discord.Member, *, reason: str):
@@ -233,18 +933,23 @@ async def warn(interaction: discord.Interaction, user: discord.Member, *, reason
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Log warning (mock example)
-    await interaction.response.send_message(f"Warned {user.mention} for reason: {reason}")
+    case = await moderation.add_case(interaction.guild.id, user.id, interaction.user.id, 'warn', reason)
+    await interaction.response.send_message(f"Warned {user.mention} for reason: {reason} (Case {case['id']})")
 
 @bot.tree.command(name='warnings', description='Get warnings for a user.')
-async def warnings(interaction: discord.Interaction, user: discord.Member):
+async def warnings(interaction: discord.Interaction, user: discord.User):
     if not check_permissions(interaction, ['manage_roles']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Fetch warnings (mock example)
-    warnings_list = f"Warnings for {user.mention}: None"
-    await interaction.response.send_message(warnings_list)
+    cases = await moderation.warnings(interaction.guild.id, user.id)
+    if not cases:
+        await interaction.response.send_message(f"Warnings for {user.mention}: None")
+        return
+
+    embed = discord.Embed(title=f"{len(cases)} warnings for {user}")
+    embed.description = '\n'.join(format_case(case) for case in cases[-20:])[:4096]
+    await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name='unban', description='Unban a member.')
 async def unban(interaction: discord.Interaction, user_id: int, *, reason: str = None):
@@ -253,8 +958,10 @@ async def unban(interaction: discord.Interaction, user_id: int, *, reason: str =
         return
 
     user = discord.Object(id=user_id)
-    await interaction.guild.unban(user, reason=reason)
-    await interaction.response.send_message(f"Unbanned {user_id}.")
+    await request(rest, MODERATION, ('guild.unban', interaction.guild.id), lambda: interaction.guild.unban(user, reason=reason))
+    await end_timed_case(f'ban:{interaction.guild.id}:{user_id}')
+    case = await moderation.add_case(interaction.guild.id, user_id, interaction.user.id, 'unban', reason)
+    await interaction.response.send_message(f"Unbanned {user_id}. (Case {case['id']})")
 
 @bot.tree.command(name='ban', description='Ban a member, with optional time limit.')
 async def ban(interaction: discord.Interaction, user: discord.Member, limit: str = None, *, reason: str = None):
@@ -262,8 +969,63 @@ async def ban(interaction: discord.Interaction, user: discord.Member, limit: str
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    await interaction.guild.ban(user, reason=reason)
-    await interaction.response.send_message(f"Banned {user.mention} for reason: {reason}")
+    delay = None
+    if limit:
+        try:
+            delay = parse_duration(limit)
+        except ValueError:
+            await interaction.response.send_message("Invalid time limit. Use e.g. 90, 10m, 1h30m or 2d.")
+            return
+
+    await request(rest, MODERATION, ('guild.ban', interaction.guild.id), lambda: interaction.guild.ban(user, reason=reason))
+    await end_timed_case(f'ban:{interaction.guild.id}:{user.id}')
+    expires_at = time.time() + delay if delay is not None else None
+    case = await moderation.add_case(interaction.guild.id, user.id, interaction.user.id, 'ban', reason, expires_at)
+    if delay is None:
+        await interaction.response.send_message(f"Banned {user.mention} for reason: {reason} (Case {case['id']})")
+        return
+
+    await scheduler.schedule('unban', delay, {
+        'guild_id': interaction.guild.id,
+        'user_id': user.id,
+        'case_id': case['id'],
+    }, key=f'ban:{interaction.guild.id}:{user.id}')
+    await interaction.response.send_message(f"Banned {user.mention} for {limit} for reason: {reason} (Case {case['id']})")
+
+@bot.tree.command(name='mute', description='Mute a member, with optional time limit.')
+async def mute(interaction: discord.Interaction, user: discord.Member, limit: str = None, *, reason: str = None):
+    if not check_permissions(interaction, ['manage_roles']):
+        await interaction.response.send_message("You don't have permission to use this command.")
+        return
+
+    muted_role = get_mute_role(interaction.guild)
+    if not muted_role:
+        await interaction.response.send_message("Muted role does not exist in this server.")
+        return
+
+    delay = None
+    if limit:
+        try:
+            delay = parse_duration(limit)
+        except ValueError:
+            await interaction.response.send_message("Invalid time limit. Use e.g. 90, 10m, 1h30m or 2d.")
+            return
+
+    await role_edits.edit(user, add=[muted_role], reason=reason)
+    await end_timed_case(f'mute:{interaction.guild.id}:{user.id}')
+    expires_at = time.time() + delay if delay is not None else None
+    case = await moderation.add_case(interaction.guild.id, user.id, interaction.user.id, 'mute', reason, expires_at)
+    if delay is None:
+        await interaction.response.send_message(f"Muted {user.mention} for reason: {reason} (Case {case['id']})")
+        return
+
+    await scheduler.schedule('unmute', delay, {
+        'guild_id': interaction.guild.id,
+        'user_id': user.id,
+        'role_id': muted_role.id,
+        'case_id': case['id'],
+    }, key=f'mute:{interaction.guild.id}:{user.id}')
+    await interaction.response.send_message(f"Muted {user.mention} for {limit} for reason: {reason} (Case {case['id']})")
 
 @bot.tree.command(name='unmute', description='Unmute a member.')
 async def unmute(interaction: discord.Interaction, user: discord.Member, *, reason: str = None):
@@ -271,8 +1033,12 @@ async def unmute(interaction: discord.Interaction, user: discord.Member, *, reas
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Implement unmute logic here
-    await interaction.response.send_message(f"Unmuted {user.mention}.")
+    muted_role = get_mute_role(interaction.guild)
+    if muted_role:
+        await role_edits.edit(user, remove=[muted_role], reason=reason)
+    await end_timed_case(f'mute:{interaction.guild.id}:{user.id}')
+    case = await moderation.add_case(interaction.guild.id, user.id, interaction.user.id, 'unmute', reason)
+    await interaction.response.send_message(f"Unmuted {user.mention}. (Case {case['id']})")
 
 @bot.tree.command(name='kick', description='Kick a member.')
 async def kick(interaction: discord.Interaction, user: discord.Member, *, reason: str = None):
@@ -280,8 +1046,9 @@ async def kick(interaction: discord.Interaction, user: discord.Member, *, reason
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    await user.kick(reason=reason)
-    await interaction.response.send_message(f"Kicked {user.mention} for reason: {reason}")
+    await request(rest, MODERATION, ('member.kick', interaction.guild.id), lambda: user.kick(reason=reason))
+    case = await moderation.add_case(interaction.guild.id, user.id, interaction.user.id, 'kick', reason)
+    await interaction.response.send_message(f"Kicked {user.mention} for reason: {reason} (Case {case['id']})")
 
 @bot.tree.command(name='deafen', description='Deafen a member.')
 async def deafen(interaction: discord.Interaction, user: discord.Member):
@@ -289,7 +1056,7 @@ async def deafen(interaction: discord.Interaction, user: discord.Member):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    await user.edit(deafen=True)
+    await request(rest, MODERATION, ('member.edit', interaction.guild.id), lambda: user.edit(deafen=True))
     await interaction.response.send_message(f"Deafened {user.mention}.")
 
 @bot.tree.command(name='undeafen', description='Undeafen a member.')
@@ -298,7 +1065,7 @@ async def undeafen(interaction: discord.Interaction, user: discord.Member):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    await user.edit(deafen=False)
+    await request(rest, MODERATION, ('member.edit', interaction.guild.id), lambda: user.edit(deafen=False))
     await interaction.response.send_message(f"Undeafened {user.mention}.")
 
 @bot.tree.command(name='diagnose', description='Diagnose any command or module in the bot.')
@@ -307,9 +1074,22 @@ async def diagnose(interaction: discord.Interaction, command_or_module: str):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Diagnose command/module (mock example)
-    diagnosis = f"Diagnosis of {command_or_module}: No issues found."
-    await interaction.response.send_message(diagnosis)
+    name = command_or_module.strip().lstrip('/')
+    lag = f"Event loop lag: {metrics.last_loop_lag * 1000:.1f}ms (p99 {(metrics.loop_lag.quantile(0.99) or 0) * 1000:.1f}ms)"
+    lag += f"\nREST queue: {', '.join(f'{name} {depth}' for name, depth in rest.depth().items())}, {rest.in_flight} in flight"
+    if bot.tree.get_command(name.split()[0]) is None:
+        await interaction.response.send_message(f"Unknown command '{name}'.\n{lag}")
+        return
+    summary = metrics.command_summary(name)
+    if summary is None:
+        await interaction.response.send_message(f"Diagnosis of /{name}: no calls recorded since startup.\n{lag}")
+        return
+    calls, p50, p99, error_rate = summary
+    await interaction.response.send_message(
+        f"Diagnosis of /{name} over {calls} call(s):\n"
+        f"Latency: p50 {p50 * 1000:.0f}ms, p99 {p99 * 1000:.0f}ms\n"
+        f"Error rate: {error_rate:.1%}\n{lag}"
+    )
 
 @bot.tree.command(name='rolepersist', description='Assign/unassign a role that persists if the user leaves and rejoins.')
 async def rolepersist(interaction: discord.Interaction, user: discord.Member, role: discord.Role, action: str, *, reason: str = None):
@@ -317,37 +1097,185 @@ async def rolepersist(interaction: discord.Interaction, user: discord.Member, ro
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
+    if action not in ('add', 'remove', 'toggle'):
+        await interaction.response.send_message("Invalid action. Use 'add', 'remove', or 'toggle'.")
+        return
+    if role.is_default() or role.managed:
+        await interaction.response.send_message(f"{role.name} cannot be assigned.")
+        return
+
+    guild_id = interaction.guild.id
+    if action == 'toggle':
+        action = 'remove' if role_persistence.is_persisted(guild_id, user.id, role.id) else 'add'
+    reason = f"Persistent role {action} by {interaction.user}" + (f": {reason}" if reason else "")
     if action == 'add':
-        # Add role persistently (mock example)
+        await role_persistence.add(guild_id, user.id, role.id)
+        await role_edits.edit(user, add=[role], reason=reason)
         await interaction.response.send_message(f"Role {role.name} added to {user.mention} persistently.")
-    elif action == 'remove':
-        # Remove role persistently (mock example)
-        await interaction.response.send_message(f"Role {role.name} removed from {user.mention} persistently.")
-    elif action == 'toggle':
-        # Toggle role persistence (mock example)
-        await interaction.response.send_message(f"Toggled role {role.name} for {user.mention}.")
     else:
-        await interaction.response.send_message("Invalid action. Use 'add', 'remove', or 'toggle'.")
+        await role_persistence.remove(guild_id, user.id, role.id)
+        await role_edits.edit(user, remove=[role], reason=reason)
+        await interaction.response.send_message(f"Role {role.name} removed from {user.mention} persistently.")
 
 @bot.tree.command(name='softban', description='Softban a member (ban and immediate unban to delete user messages).')
-async def softban(interaction: discord.Interaction, user: discord.Member, *, reason: str = None):
+async def softban(interaction: discord.Interaction, user: discord.Member, delete_messages: str = '1d', *, reason: str = None):
     if not check_permissions(interaction, ['ban_members']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    await interaction.guild.ban(user, reason=reason)
-    await interaction.guild.unban(user)
-    await interaction.response.send_message(f"Softbanned {user.mention} for reason: {reason}")
+    try:
+        delete_seconds = parse_delete_window(delete_messages)
+    except ValueError:
+        await interaction.response.send_message("Invalid delete window. Use e.g. 0, 1h, 1d or 7d.")
+        return
 
-@bot.tree.command(name='modlogs', description='Get a list of moderation logs for a user.')
-async def modlogs(interaction: discord.Interaction, user: discord.Member, page: int = 1):
-    if not check_permissions(interaction, ['view_audit_log']):
+    await request(rest, MODERATION, ('guild.ban', interaction.guild.id),
+                  lambda: interaction.guild.ban(user, reason=reason, delete_message_seconds=delete_seconds))
+    await request(rest, MODERATION, ('guild.unban', interaction.guild.id), lambda: interaction.guild.unban(user, reason="Softban"))
+    case = await moderation.add_case(interaction.guild.id, user.id, interaction.user.id, 'softban', reason)
+    await interaction.response.send_message(f"Softbanned {user.mention} for reason: {reason} (Case {case['id']})")
+
+# Parse how much message history a ban deletes, capped at Discord's 7 day maximum
+def parse_delete_window(text):
+    if text.strip() in ('0', 'none'):
+        return 0
+    return min(parse_duration(text), MAX_DELETE_SECONDS)
+
+# Whether the invoking moderator and the bot both rank above a target member
+def can_moderate(interaction, target):
+    guild = interaction.guild
+    if target.id in (guild.owner_id, interaction.user.id, guild.me.id if guild.me else None):
+        return False
+    if not isinstance(target, discord.Member):
+        return True
+    if interaction.user.id != guild.owner_id and target.top_role >= interaction.user.top_role:
+        return False
+    return guild.me is None or target.top_role < guild.me.top_role
+
+# Resolve the targets of massban/masskick from an ID list and member filters (joined within
+# seconds, name glob); runs inside the job, since looking up uncached members takes a request
+# each. Returns (targets, skipped count, lookup failures, error message).
+async def select_mass_targets(interaction, user_ids, joined_seconds, name, members_only, progress=None):
+    guild = interaction.guild
+    targets = {}
+    unresolved = 0
+    if joined_seconds is not None or name:
+        candidates = member_cache.members(guild)
+        if user_ids:
+            wanted = set(user_ids)
+            candidates = [member for member in candidates if member.id in wanted]
+        for member in match_members(candidates, joined_within=joined_seconds, name=name):
+            targets[member.id] = member
+    else:
+        resolved = {}
+
+        async def resolve(user_id):
+            nonlocal unresolved
+            # The full member cache is authoritative, so a miss there means the user is not a member
+            try:
+                member = await member_cache.fetch(guild, user_id, priority=AUTOMATION) if lean_members else guild.get_member(user_id)
+            except discord.HTTPException:
+                unresolved += 1
+                return
+            if member is not None:
+                resolved[user_id] = member
+            elif not members_only:
+                # Users outside the guild can still be banned by ID
+                resolved[user_id] = discord.Object(id=user_id, type=discord.User)
+            if progress is not None:
+                await progress(len(resolved) + unresolved, len(user_ids))
+
+        await asyncio.gather(*(resolve(user_id) for user_id in user_ids))
+        targets = {user_id: resolved[user_id] for user_id in user_ids if user_id in resolved}
+
+    limit = settings.config.get('mass_action_limit', 1000)
+    if len(targets) > limit:
+        return None, 0, unresolved, f"That matches {len(targets)} users; the limit is {limit} per command."
+    allowed = [target for target in targets.values() if can_moderate(interaction, target)]
+    return allowed, len(targets) - len(allowed), unresolved, None
+
+async def run_mass_action(interaction, action, ids, joined_within, name, from_raid, reason, delete_messages=None):
+    guild = interaction.guild
+    delete_seconds = 0
+    if action == 'ban':
+        try:
+            delete_seconds = parse_delete_window(delete_messages)
+        except ValueError:
+            await interaction.response.send_message("Invalid delete window. Use e.g. 0, 1h, 1d or 7d.")
+            return
+    if not (ids or joined_within or name or from_raid):
+        await interaction.response.send_message("Give user IDs, a filter (joined_within, name) or from_raid.")
+        return
+    user_ids, invalid = parse_ids(ids)
+    if invalid:
+        await interaction.response.send_message(f"Not user IDs: {', '.join(invalid[:10])}")
+        return
+    try:
+        joined_seconds = parse_duration(joined_within) if joined_within else None
+    except ValueError:
+        await interaction.response.send_message("Invalid joined_within duration. Use e.g. 10m, 1h or 2d.")
+        return
+    if from_raid:
+        user_ids += [member_id for member_id, _, _ in raid_detector.review(guild.id) if member_id not in user_ids]
+    limit = settings.config.get('mass_action_limit', 1000)
+    if len(user_ids) > limit and joined_seconds is None and not name:
+        await interaction.response.send_message(f"That is {len(user_ids)} users; the limit is {limit} per command.")
+        return
+
+    verb = 'Banned' if action == 'ban' else 'Kicked'
+    reason = reason or f"Mass {action} by {interaction.user}"
+
+    async def work(job):
+        async def report_lookup(looked_up, total):
+            await job.update(f"Looking up users... {looked_up}/{total}")
+
+        targets, skipped, unresolved, error = await select_mass_targets(
+            interaction, user_ids, joined_seconds, name, action == 'kick', progress=report_lookup)
+        if error:
+            return error
+        if not targets:
+            return "No users matched" + (f" ({skipped} outrank you or the bot)." if skipped else ".")
+
+        async def report(done, failed, total):
+            await job.update(f"{verb} {done}/{total}" + (f", {failed} failed" if failed else "") + "...")
+
+        if action == 'ban':
+            done, failed, cases = await mass_moderation.ban(guild, targets, interaction.user.id, reason, delete_seconds, progress=report)
+        else:
+            done, failed, cases = await mass_moderation.kick(guild, targets, interaction.user.id, reason, progress=report)
+        if from_raid:
+            raid_detector.dismiss(guild.id, set(done))
+        summary = f"{verb} {len(done)} users"
+        if cases:
+            summary += f" (cases {cases[0]}-{cases[-1]})" if len(cases) > 1 else f" (case {cases[0]})"
+        if failed:
+            summary += f", {len(failed)} failed"
+        if skipped:
+            summary += f", {skipped} skipped because they outrank you or the bot"
+        if unresolved:
+            summary += f", {unresolved} could not be looked up"
+        return summary + "."
+
+    description = f"{len(user_ids)} users" if joined_seconds is None and not name else "filtered members"
+    await jobs.submit(interaction, f'mass{action}', work, description=description)
+
+# Ban many users at once by ID list, raid review queue or filter
+@bot.tree.command(name='massban', description='Ban many users by ID list, raid review queue or join time/name filter.')
+async def massban(interaction: discord.Interaction, ids: str = None, joined_within: str = None, name: str = None,
+                  from_raid: bool = False, delete_messages: str = '1d', *, reason: str = None):
+    if not check_permissions(interaction, ['ban_members']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
+    await run_mass_action(interaction, 'ban', ids, joined_within, name, from_raid, reason, delete_messages)
 
-    # Fetch logs (mock example)
-    logs = f"Moderation logs for {user.mention} (Page {page})"
-    await interaction.response.send_message(logs)
+# Kick many members at once by ID list, raid review queue or filter
+@bot.tree.command(name='masskick', description='Kick many members by ID list, raid review queue or join time/name filter.')
+async def masskick(interaction: discord.Interaction, ids: str = None, joined_within: str = None, name: str = None,
+                   from_raid: bool = False, *, reason: str = None):
+    if not check_permissions(interaction, ['kick_members']):
+        await interaction.response.send_message("You don't have permission to use this command.")
+        return
+    await run_mass_action(interaction, 'kick', ids, joined_within, name, from_raid, reason)
 
 @bot.tree.command(name='note', description='Add note(s) about a member.')
 async def note(interaction: discord.Interaction, user: discord.Member, *, text: str):
@@ -355,18 +1283,26 @@ async def note(interaction: discord.Interaction, user: discord.Member, *, text:
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Add note (mock example)
-    await interaction.response.send_message(f"Added note to {user.mention}: {text}")
+    note_id = await moderation.add_note(interaction.guild.id, user.id, interaction.user.id, text)
+    await interaction.response.send_message(f"Added note {note_id} to {user.mention}: {text}")
 
 @bot.tree.command(name='notes', description='Get notes for a user.')
-async def notes(interaction: discord.Interaction, user: discord.Member):
+async def notes(interaction: discord.Interaction, user: discord.User):
     if not check_permissions(interaction, ['manage_roles']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Fetch notes (mock example)
-    notes_list = f"Notes for {user.mention}: None"
-    await interaction.response.send_message(notes_list)
+    rows = await moderation.notes(interaction.guild.id, user.id)
+    if not rows:
+        await interaction.response.send_message(f"Notes for {user.mention}: None")
+        return
+
+    embed = discord.Embed(title=f"{len(rows)} notes for {user}")
+    embed.description = '\n'.join(
+        f"**Note {row['id']}** by <@{row['moderator_id']}> | <t:{int(row['created_at'])}:f>\n> {row['text']}"
+        for row in rows[-20:]
+    )[:4096]
+    await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name='delnote', description='Delete a note about a member.')
 async def delnote(interaction: discord.Interaction, user: discord.Member, note_id: int):
@@ -374,7 +1310,9 @@ async def delnote(interaction: discord.Interaction, user: discord.Member, note_i
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Delete note (mock example)
+    if not await moderation.delete_note(interaction.guild.id, user.id, note_id):
+        await interaction.response.send_message(f"Note {note_id} does not exist for {user.mention}.")
+        return
     await interaction.response.send_message(f"Deleted note {note_id} for {user.mention}.")
 
 @bot.tree.command(name='editnote', description='Edit a note about a member.')
@@ -383,7 +1321,9 @@ async def editnote(interaction: discord.Interaction, user: discord.Member, note_
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Edit note (mock example)
+    if not await moderation.edit_note(interaction.guild.id, user.id, note_id, new_note):
+        await interaction.response.send_message(f"Note {note_id} does not exist for {user.mention}.")
+        return
     await interaction.response.send_message(f"Edited note {note_id} for {user.mention}: {new_note}")
 
 @bot.tree.command(name='clearnotes', description='Delete all notes for a member.')
@@ -392,8 +1332,8 @@ async def clearnotes(interaction: discord.Interaction, user: discord.Member):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Clear all notes (mock example)
-    await interaction.response.send_message(f"Cleared all notes for {user.mention}.")
+    count = await moderation.clear_notes(interaction.guild.id, user.id)
+    await interaction.response.send_message(f"Cleared {count} notes for {user.mention}.")
 
 @bot.tree.command(name='delwarn', description='Delete a warning.')
 async def delwarn(interaction: discord.Interaction, warning_id: int):
@@ -401,7 +1341,9 @@ async def delwarn(interaction: discord.Interaction, warning_id: int):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Delete warning (mock example)
+    if not await moderation.delete_warning(interaction.guild.id, warning_id):
+        await interaction.response.send_message(f"Warning {warning_id} does not exist.")
+        return
     await interaction.response.send_message(f"Deleted warning {warning_id}.")
 
 @bot.tree.command(name='modstats', description='Get moderation statistics for a mod/admin.')
@@ -410,9 +1352,13 @@ async def modstats(interaction: discord.Interaction, user: discord.Member):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Fetch stats (mock example)
-    stats = f"Moderation stats for {user.mention}"
-    await interaction.response.send_message(stats)
+    stats = await moderation.moderator_stats(interaction.guild.id, user.id)
+    embed = discord.Embed(title=f"Moderation stats for {user}")
+    if not stats:
+        embed.description = "No moderation actions recorded."
+    for action, (week, month, total) in sorted(stats.items()):
+        embed.add_field(name=action.capitalize(), value=f"Last 7 days: {week}\nLast 30 days: {month}\nAll time: {total}")
+    await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name='duration', description='Change the duration of a mute/ban.')
 async def duration(interaction: discord.Interaction, modlog_id: int, limit: str):
@@ -420,72 +1366,92 @@ async def duration(interaction: discord.Interaction, modlog_id: int, limit: str)
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Change duration (mock example)
+    case = await moderation.get_case(interaction.guild.id, modlog_id)
+    timer = None
+    if case is not None and case['action'] in ('ban', 'mute') and case['active']:
+        timer = scheduler.get_by_key(f"{case['action']}:{interaction.guild.id}:{case['target_id']}")
+    if timer is None or timer.payload.get('case_id') != modlog_id:
+        await interaction.response.send_message(f"No active timed mute/ban with modlog ID {modlog_id}.")
+        return
+
+    try:
+        new_duration = parse_duration(limit)
+    except ValueError:
+        await interaction.response.send_message("Invalid time limit. Use e.g. 90, 10m, 1h30m or 2d.")
+        return
+
+    # The new duration counts from when the mute/ban was issued
+    expires_at = max(case['created_at'] + new_duration, time.time())
+    await scheduler.reschedule(timer.id, expires_at)
+    await moderation.set_case_expiry(interaction.guild.id, modlog_id, expires_at)
     await interaction.response.send_message(f"Changed duration for modlog ID {modlog_id} to {limit}.")
 
 @bot.tree.command(name='lockdown', description='Lock channels defined in moderation settings.')
-async def lockdown(interaction: discord.Interaction, *, message: str = None):
+async def lockdown(interaction: discord.Interaction, action: str = 'start', *, message: str = None):
     if not check_permissions(interaction, ['manage_channels']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Lockdown logic (mock example)
-    await interaction.response.send_message(f"Channels locked down. {message if message else ''}")
+    if action not in ('start', 'end'):
+        await interaction.response.send_message("Invalid action. Use 'start' or 'end'.")
+        return
+
+    channel_ids = settings.guild(interaction.guild.id).lockdown_channels
+    channels = [channel for channel in map(interaction.guild.get_channel, channel_ids) if channel is not None]
+    if not channels:
+        await interaction.response.send_message("No lockdown channels are configured for this server.")
+        return
+
+    verb = 'Locking' if action == 'start' else 'Unlocking'
+
+    async def work(job):
+        async def report(done, total):
+            await job.update(f"{verb} channels... {done}/{total}")
+
+        changed, skipped, failed = await lock_engine.apply(
+            channels,
+            unlock=action == 'end',
+            reason=f"Lockdown {action} by {interaction.user}",
+            message=message,
+            progress=report,
+            priority=MODERATION,
+        )
+        summary = f"Lockdown {'started' if action == 'start' else 'ended'}: {changed} channels {'locked' if action == 'start' else 'unlocked'}"
+        if skipped:
+            summary += f", {skipped} already {'locked' if action == 'start' else 'unlocked'}"
+        if failed:
+            summary += f", {failed} failed"
+        return f"{summary}. {message if message else ''}"
+
+    await jobs.submit(interaction, 'lockdown', work, description=f"{action} on {len(channels)} channels")
 
 @bot.tree.command(name='star', description='View starboard stats for a message.')
-async def star(interaction: discord.Interaction, message_id: int):
+async def star(interaction: discord.Interaction, message_id: str):
     if not check_permissions(interaction, ['view_audit_log']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Fetch starboard stats (mock example)
-    stats = f"Starboard stats for message ID {message_id}"
-    await interaction.response.send_message(stats)
-
-# Command to add an AFK status
-@bot.tree.command(name='afk', description='Set an AFK status.')
-async def afk(interaction: discord.Interaction, *, status: str):
-    await interaction.response.send_message(f"AFK status set to: {status}")
-
-# Command to reset AFK status
-@bot.tree.command(name='afkreset', description='Reset AFK status for a user.')
-async def afkreset(interaction: discord.Interaction, user: discord.Member):
-    await interaction.response.send_message(f"AFK status reset for {user.mention}")
-
-# Command to get a user's avatar
-@bot.tree.command(name='avatar', description='Get a user\'s avatar.')
-async def avatar(interaction: discord.Interaction, user: discord.Member):
-    await interaction.response.send_message(user.avatar.url)
-
-# Command to generate a random color
-@bot.tree.command(name='randomcolor', description='Generate a random hex color.')
-async def randomcolor(interaction: discord.Interaction):
-    import random
-    color = "#{:06x}".format(random.randint(0, 0xFFFFFF))
-    await interaction.response.send_message(f"Random color: {color}")
+    entry = await starboard_tracker.get(int(message_id)) if message_id.isdigit() else None
+    if entry is None or entry.guild_id != interaction.guild.id:
+        await interaction.response.send_message(f"No starboard stats for message ID {message_id}.")
+        return
 
-# Command to get server member count
-@bot.tree.command(name='membercount', description='Get the server member count.')
-async def membercount(interaction: discord.Interaction):
-    count = interaction.guild.member_count
-    await interaction.response.send_message(f"Member count: {count}")
+    stats = f"Starboard stats for message ID {message_id}: {STAR} {entry.stars} in <#{entry.channel_id}>"
+    if entry.author_id:
+        stats += f" by <@{entry.author_id}>"
+    stats += ", on the starboard." if entry.post_id else ", not on the starboard."
+    await interaction.response.send_message(stats, allowed_mentions=discord.AllowedMentions.none())
 
-# Command to set a reminder
-@bot.tree.command(name='remindme', description='Set a reminder.')
-async def remindme(interaction: discord.Interaction, time: str, *, reminder: str):
-    try:
-        time = int(time)
-        await asyncio.sleep(time)
-        await interaction.response.send_message(f"Reminder: {reminder}")
-    except ValueError:
-        await interaction.response.send_message("Invalid time format. Use seconds.")
+# Feed raw reaction events into the starboard counters
+@bot.listen('on_raw_reaction_add')
+@metrics.timed_event('on_raw_reaction_add')
+async def count_star_added(payload):
+    await starboard_tracker.on_reaction(payload, 1)
 
-# Command to get user information
-@bot.tree.command(name='whois', description='Get user information.')
-async def whois(interaction: discord.Interaction, user: discord.Member):
-    embed = discord.Embed(title=f"User Info: {user.name}", description=f"ID: {user.id}")
-    embed.set_thumbnail(url=user.avatar.url)
-    await interaction.response.send_message(embed=embed)
+@bot.listen('on_raw_reaction_remove')
+@metrics.timed_event('on_raw_reaction_remove')
+async def count_star_removed(payload):
+    await starboard_tracker.on_reaction(payload, -1)
 
 # Command to roll dice
 @bot.tree.command(name='roll', description='Roll a dice.')
@@ -509,9 +1475,8 @@ async def flipcoin(interaction: discord.Interaction):
 # Command to get server info
 @bot.tree.command(name='serverinfo', description='Get server info/stats.')
 async def serverinfo(interaction: discord.Interaction):
-    embed = discord.Embed(title=f"Server Info: {interaction.guild.name}")
-    embed.add_field(name="Total Members", value=interaction.guild.member_count)
-    embed.add_field(name="Server Region", value=interaction.guild.region)
+    guild = interaction.guild
+    embed = response_cache.get(guild.id, 'serverinfo', None, lambda: serverinfo_embed(guild))
     await interaction.response.send_message(embed=embed)
 
 # Command to generate a Dyno-like avatar
@@ -536,9 +1501,25 @@ async def color(interaction: discord.Interaction, hex_code: str):
 # Command to list server emojis
 @bot.tree.command(name='emotes', description='Get a list of server emojis.')
 async def emotes(interaction: discord.Interaction, search: str = None):
-    emojis = [emoji for emoji in interaction.guild.emojis if search in emoji.name] if search else interaction.guild.emojis
-    emoji_list = ' '.join(str(emoji) for emoji in emojis)
-    await interaction.response.send_message(f"Emojis: {emoji_list}")
+    guild = interaction.guild
+    query = search.strip().lower() if search else ''
+
+    # Pages for this search are built once from the guild's emoji index and reused for page turns
+    def get_pages():
+        def build():
+            index = response_cache.get(guild.id, 'emoji_index', None, lambda: EmojiIndex(guild.emojis))
+            matches = index.search(query)
+            header = f"Emojis matching '{query}':" if query else "Emojis:"
+            return paginate_text(matches, header) if matches else [f"No emojis found{f' matching {query!r}' if query else ''}."]
+        return response_cache.get(guild.id, 'emotes', query, build)
+
+    pages = get_pages()
+    if len(pages) == 1:
+        await interaction.response.send_message(pages[0])
+        return
+    view = PageView(interaction.user.id, get_pages)
+    await interaction.response.send_message(pages[0], view=view)
+    view.message = await interaction.original_response()
 
 # Command to get COVID-19 stats
 @bot.tree.command(name='covid', description='Get COVID-19 stats.')
@@ -548,49 +1529,107 @@ async def covid(interaction: discord.Interaction, location: str = None):
 
 # Command to get highlights
 @bot.tree.command(name='highlights', description='Get notified when a specific phrase is said in a server.')
-async def highlights(interaction: discord.Interaction, action: str, phrase: str):
-    # Placeholder: Manage highlights (mock example)
-    await interaction.response.send_message(f"Highlights {action} for phrase: {phrase}")
+async def highlights(interaction: discord.Interaction, action: str, phrase: str = None):
+    guild_id, user_id = interaction.guild.id, interaction.user.id
+
+    if action == 'add' and phrase:
+        if await highlights_index.add(guild_id, user_id, phrase):
+            await interaction.response.send_message(f"Added highlight for phrase: {phrase}", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"You already have a highlight for phrase: {phrase}", ephemeral=True)
+    elif action == 'remove' and phrase:
+        if await highlights_index.remove(guild_id, user_id, phrase):
+            await interaction.response.send_message(f"Removed highlight for phrase: {phrase}", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"No highlight found for phrase: {phrase}", ephemeral=True)
+    elif action == 'list':
+        phrases = highlights_index.phrases_for(guild_id, user_id)
+        listing = ', '.join(phrases) if phrases else 'None'
+        await interaction.response.send_message(f"Your highlights: {listing}", ephemeral=True)
+    elif action == 'clear':
+        count = await highlights_index.clear(guild_id, user_id)
+        await interaction.response.send_message(f"Cleared {count} highlights.", ephemeral=True)
+    else:
+        await interaction.response.send_message("Invalid action. Use 'add <phrase>', 'remove <phrase>', 'list' or 'clear'.", ephemeral=True)
 
-# Command to clean up responses
-@bot.tree.command(name='clean', description='Clean up bot responses.')
-async def clean(interaction: discord.Interaction, number: int = None):
-    if not check_permissions(interaction, ['manage_messages']):
-        await interaction.response.send_message("You don't have permission to use this command.")
+# DM one highlight subscriber about a message
+async def send_highlight(message, user_id, phrase):
+    # The full member cache is authoritative; the lean one fetches subscribers it has not seen
+    try:
+        member = await member_cache.fetch(message.guild, user_id) if lean_members else message.guild.get_member(user_id)
+    except discord.HTTPException:
+        return
+    if member is None or not message.channel.permissions_for(member).read_messages:
+        return
+    if not highlights_index.take_cooldown(message.guild.id, user_id):
         return
 
-    # Clean responses (mock example)
-    await interaction.response.send_message(f"Cleaned up {number if number else 'all'} responses.")
-
-# Command to deafen a member
-@bot.tree.command(name='deafen', description='Deafen a member.')
-async def deafen(interaction: discord.Interaction, user: discord.Member):
-    if not check_permissions(interaction, ['manage_channels']):
-        await interaction.response.send_message("You don't have permission to use this command.")
+    embed = discord.Embed(title=f"Highlight: {phrase}", description=message.content[:4000])
+    embed.add_field(name="Channel", value=message.channel.mention)
+    embed.add_field(name="Author", value=message.author.mention)
+    embed.add_field(name="Jump", value=f"[Go to message]({message.jump_url})")
+    try:
+        await request(rest, UTILITY, ('user.dm', member.id), lambda: member.send(embed=embed))
+    except discord.HTTPException:
+        pass
+
+# Highlight DMs in flight; kept referenced until they finish
+highlight_deliveries = set()
+
+# Notify highlight subscribers with one automaton scan per message; the DMs are delivered in
+# the background, so message handling never waits on paced DM requests
+@bot.listen('on_message')
+@metrics.timed_event('on_message')
+async def notify_highlights(message):
+    if message.author.bot or message.guild is None or not message.content:
         return
 
-    await user.edit(deafen=True)
-    await interaction.response.send_message(f"Deafened {user.mention}.")
+    matches = highlights_index.match(message.guild.id, message.content)
+    matches.pop(message.author.id, None)
+    for user_id, phrase in matches.items():
+        task = asyncio.create_task(send_highlight(message, user_id, phrase))
+        highlight_deliveries.add(task)
+        task.add_done_callback(highlight_deliveries.discard)
 
-# Command to undeafen a member
-@bot.tree.command(name='undeafen', description='Undeafen a member.')
-async def undeafen(interaction: discord.Interaction, user: discord.Member):
-    if not check_permissions(interaction, ['manage_channels']):
+# Command to clean up responses
+@bot.tree.command(name='clean', description='Clean up bot responses.')
+async def clean(interaction: discord.Interaction, number: discord.app_commands.Range[int, 1, 1000] = None):
+    if not check_permissions(interaction, ['manage_messages']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    await user.edit(deafen=False)
-    await interaction.response.send_message(f"Undeafened {user.mention}.")
+    # The bot's own messages plus the prefixed messages that triggered custom commands
+    def check(message):
+        return message.author.id == bot.user.id or message.content.startswith(bot.command_prefix)
+
+    await run_purge(interaction, 'clean', number or 100, check)
 
 # Command to manage active moderations
 @bot.tree.command(name='active_mods', description='Manage active moderations.')
-async def active_mods(interaction: discord.Interaction, action: str, mod_id: int):
+async def active_mods(interaction: discord.Interaction, action: str, mod_id: int = None):
     if not check_permissions(interaction, ['view_audit_log']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Manage active moderations (mock example)
-    await interaction.response.send_message(f"Active moderation {action} for mod ID {mod_id}.")
+    if action == 'list':
+        cases = await moderation.active_cases(interaction.guild.id)
+        if not cases:
+            await interaction.response.send_message("No active timed moderations.")
+            return
+        embed = discord.Embed(title=f"{len(cases)} active moderations")
+        embed.description = '\n'.join(format_case(case) for case in cases[:20])[:4096]
+        await interaction.response.send_message(embed=embed)
+    elif action == 'remove' and mod_id is not None:
+        case = await moderation.get_case(interaction.guild.id, mod_id)
+        if case is None or not case['active'] or case['action'] not in ('ban', 'mute'):
+            await interaction.response.send_message(f"No active moderation with ID {mod_id}.")
+            return
+        # Stop the timer without reverting the action; the mute/ban becomes permanent
+        await end_timed_case(f"{case['action']}:{interaction.guild.id}:{case['target_id']}")
+        await moderation.set_case_expiry(interaction.guild.id, mod_id, None)
+        await interaction.response.send_message(f"Active moderation {mod_id} removed; the {case['action']} no longer expires.")
+    else:
+        await interaction.response.send_message("Invalid action. Use 'list' or 'remove <mod_id>'.")
 
 # Command to set a custom command
 @bot.tree.command(name='addcustomcmd', description='Add a custom command.')
@@ -599,8 +1638,16 @@ async def addcustomcmd(interaction: discord.Interaction, command_name: str, *, r
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Add custom command (mock example)
-    await interaction.response.send_message(f"Custom command '{command_name}' added with response: {response}")
+    name = custom_commands.normalize(command_name)
+    if not name or len(name) > 32 or any(char.isspace() for char in name):
+        await interaction.response.send_message("Invalid command name. Use a single word of at most 32 characters.")
+        return
+    if len(response) > 2000:
+        await interaction.response.send_message("Response is too long. Keep it under 2000 characters.")
+        return
+
+    await custom_commands.add(interaction.guild.id, name, response)
+    await interaction.response.send_message(f"Custom command '{name}' added with response: {response}")
 
 # Command to list custom commands
 @bot.tree.command(name='listcustomcmds', description='List all custom commands.')
@@ -609,9 +1656,9 @@ async def listcustomcmds(interaction: discord.Interaction):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # List custom commands (mock example)
-    commands_list = "Custom commands: None"
-    await interaction.response.send_message(commands_list)
+    names = await custom_commands.names(interaction.guild.id)
+    commands_list = f"Custom commands: {', '.join(bot.command_prefix + name for name in names) if names else 'None'}"
+    await interaction.response.send_message(commands_list[:2000])
 
 # Command to delete a custom command
 @bot.tree.command(name='delcustomcmd', description='Delete a custom command.')
@@ -620,22 +1667,55 @@ async def delcustomcmd(interaction: discord.Interaction, command_name: str):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Delete custom command (mock example)
-    await interaction.response.send_message(f"Custom command '{command_name}' deleted.")
+    name = custom_commands.normalize(command_name)
+    if not await custom_commands.remove(interaction.guild.id, name):
+        await interaction.response.send_message(f"Custom command '{name}' does not exist.")
+        return
+    await interaction.response.send_message(f"Custom command '{name}' deleted.")
+
+# Answer custom commands; guilds without any are rejected with a single set lookup
+@bot.listen('on_message')
+@metrics.timed_event('on_message')
+async def run_custom_command(message):
+    if message.author.bot or message.guild is None:
+        return
+
+    response = await custom_commands.resolve(message)
+    if response:
+        await message.channel.send(response[:2000], allowed_mentions=discord.AllowedMentions(everyone=False, roles=False))
 
 # Command to get the bot's ping
 @bot.tree.command(name='ping', description='Get the bot\'s ping.')
 async def ping(interaction: discord.Interaction):
-    await interaction.response.send_message(f"Bot ping is {round(bot.latency * 1000)}ms")
+    stats = await gather_stats()
+    latencies = [latency for data in stats['clusters'].values() for latency in data['latencies'].values()]
+    if len(latencies) <= 1:
+        await interaction.response.send_message(f"Bot ping is {round(bot.latency * 1000)}ms")
+        return
+    shard_id = interaction.guild.shard_id if interaction.guild else 0
+    await interaction.response.send_message(
+        f"Bot ping is {round(bot.latency * 1000)}ms (shard {shard_id})\n"
+        f"Average across {len(latencies)} shards: {round(sum(latencies) / len(latencies) * 1000)}ms, "
+        f"slowest: {round(max(latencies) * 1000)}ms"
+    )
 
 # Command to add a user to the starboard
 @bot.tree.command(name='starboard', description='Add a message to the starboard.')
-async def starboard(interaction: discord.Interaction, message_id: int):
+async def starboard(interaction: discord.Interaction, message_id: str):
     if not check_permissions(interaction, ['manage_messages']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Add message to starboard (mock example)
+    if not settings.guild(interaction.guild.id).starboard_channel:
+        await interaction.response.send_message("No starboard channel is configured for this server.")
+        return
+    if not message_id.isdigit():
+        await interaction.response.send_message("Invalid message ID.")
+        return
+
+    # Messages the bot has never seen starred are assumed to be in the current channel
+    entry = await starboard_tracker.track(int(message_id), interaction.guild.id, interaction.channel_id)
+    starboard_tracker.schedule_publish(entry, force=True)
     await interaction.response.send_message(f"Message ID {message_id} added to starboard.")
 
 # Command to unlock a channel
@@ -645,8 +1725,12 @@ async def unlock(interaction: discord.Interaction, channel: discord.TextChannel)
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Unlock channel (mock example)
-    await interaction.response.send_message(f"Channel {channel.mention} unlocked.")
+    async def work(job):
+        if not await lock_engine.unlock(channel, reason=f"Unlocked by {interaction.user}", priority=MODERATION):
+            return f"Channel {channel.mention} is not locked."
+        return f"Channel {channel.mention} unlocked."
+
+    await jobs.submit(interaction, 'unlock', work, description=channel.mention)
 
 # Command to manage role mentions
 @bot.tree.command(name='management', description='Manage role mentions.')
@@ -666,29 +1750,167 @@ async def management(interaction: discord.Interaction, action: str, role: discor
 
 # Command to clean up message history
 @bot.tree.command(name='cleanhistory', description='Clean up message history.')
-async def cleanhistory(interaction: discord.Interaction, number: int):
+async def cleanhistory(interaction: discord.Interaction, number: discord.app_commands.Range[int, 1], user: discord.User = None):
     if not check_permissions(interaction, ['manage_messages']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    # Clean up message history (mock example)
-    await interaction.response.send_message(f"Cleaned up {number} messages.")
+    check = build_filter(author_id=user.id if user else None, skip_pinned=True)
+    await run_purge(interaction, 'cleanhistory', number, check)
 
-# Command to add or remove a role from a user
-@bot.tree.command(name='role', description='Add or remove a role from a user.')
-async def role(interaction: discord.Interaction, user: discord.Member, role: discord.Role, action: str):
-    if not check_permissions(interaction, ['manage_roles']):
+# Command to inspect the join rate, review suspicious accounts and end a detected raid
+@bot.tree.command(name='raid', description='Show join rates, review suspicious accounts or end a raid.')
+async def raid(interaction: discord.Interaction, action: str = 'status', user: discord.User = None):
+    if not check_permissions(interaction, ['manage_guild']):
         await interaction.response.send_message("You don't have permission to use this command.")
         return
 
-    if action == 'add':
-        await user.add_roles(role)
-        await interaction.response.send_message(f"Role {role.name} added to {user.mention}.")
-    elif action == 'remove':
-        await user.remove_roles(role)
-        await interaction.response.send_message(f"Role {role.name} removed from {user.mention}.")
+    guild = interaction.guild
+    config = settings.guild(guild.id)
+    if action == 'status':
+        status = raid_detector.status(guild.id)
+        if not config.raid_joins:
+            text = "Raid detection is off. Set `raid_joins` with /settings to enable it."
+        elif status is None:
+            text = "No joins recorded yet."
+        else:
+            joins, young, ages = status
+            histogram = ', '.join(f"{label}: {count}" for label, count in ages.items() if count)
+            text = (f"Last {config.raid_window}s: {joins} joins, {young} younger than {config.raid_account_age} days "
+                    f"(threshold {config.raid_joins}).\nAccount ages: {histogram or 'none'}")
+        if raid_detector.active(guild.id):
+            text += f"\nA raid is in progress; {len(raid_detector.review(guild.id))} accounts are queued for review."
+        await interaction.response.send_message(text)
+    elif action == 'review':
+        queued = raid_detector.review(guild.id)
+        if not queued:
+            await interaction.response.send_message("No accounts are queued for review.")
+            return
+        lines = [f"{len(queued)} accounts queued for review:"]
+        for shown, (member_id, age, joined) in enumerate(queued):
+            line = f"<@{member_id}> ({member_id}), created <t:{int(joined - age)}:R>, joined <t:{int(joined)}:R>"
+            if sum(map(len, lines)) + len(lines) + len(line) > 1950:
+                lines.append(f"... and {len(queued) - shown} more")
+                break
+            lines.append(line)
+        await interaction.response.send_message('\n'.join(lines), allowed_mentions=discord.AllowedMentions.none())
+    elif action == 'dismiss':
+        count = raid_detector.dismiss(guild.id, {user.id} if user else None)
+        await interaction.response.send_message(f"Removed {count} accounts from the review queue.")
+    elif action == 'end':
+        raid_detector.end(guild.id)
+        channels = [channel for channel in map(guild.get_channel, config.lockdown_channels) if channel is not None]
+
+        async def work(job):
+            changed, skipped, failed = await lock_engine.apply(channels, unlock=True, reason=f"Raid ended by {interaction.user}",
+                                                              priority=MODERATION)
+            return f"Raid ended: {changed} channels unlocked" + (f", {failed} failed" if failed else "") + "."
+
+        await jobs.submit(interaction, 'raid end', work, description=f"unlock {len(channels)} channels")
     else:
-        await interaction.response.send_message("Invalid action. Use 'add' or 'remove'.")
+        await interaction.response.send_message("Invalid action. Use 'status', 'review', 'dismiss [user]' or 'end'.")
+
+# Command to list, inspect and cancel background jobs
+@bot.tree.command(name='jobs', description='List, inspect or cancel background jobs.')
+async def jobs_command(interaction: discord.Interaction, action: str = 'list', job_id: int = None):
+    guild_jobs = jobs.for_guild(interaction.guild.id)
+    if action == 'list':
+        active = [job for job in guild_jobs if job.active]
+        recent = [job for job in guild_jobs if not job.active][-10:]
+        lines = [job.summary() for job in active] or ["No jobs running."]
+        if recent:
+            lines += ["", "Recently finished:"] + [job.summary() for job in reversed(recent)]
+        await interaction.response.send_message('\n'.join(lines)[:2000], ephemeral=True,
+                                                allowed_mentions=discord.AllowedMentions.none())
+        return
+
+    if action not in ('info', 'cancel'):
+        await interaction.response.send_message("Invalid action. Use 'list', 'info <job_id>' or 'cancel <job_id>'.", ephemeral=True)
+        return
+    job = jobs.get(job_id) if job_id is not None else None
+    if job is None or job.guild_id != interaction.guild.id:
+        await interaction.response.send_message("No such job in this server.", ephemeral=True)
+        return
+
+    if action == 'info':
+        lines = [job.summary(), f"Started by <@{job.user_id}> <t:{int(job.created_at)}:R>"]
+        if job.started_at:
+            lines.append(f"Waited {job.started_at - job.created_at:.1f}s in the queue")
+        if job.finished_at:
+            lines.append(f"Ran for {job.finished_at - (job.started_at or job.created_at):.1f}s")
+        if job.result:
+            lines.append(f"Result: {job.result}")
+        await interaction.response.send_message('\n'.join(lines), ephemeral=True,
+                                                allowed_mentions=discord.AllowedMentions.none())
+        return
+
+    if job.user_id != interaction.user.id and not check_permissions(interaction, ['manage_guild']):
+        await interaction.response.send_message("You can only cancel your own jobs.", ephemeral=True)
+        return
+    if await jobs.cancel(job.id) is None:
+        await interaction.response.send_message(f"Job #{job.id} is not running.", ephemeral=True)
+        return
+    await interaction.response.send_message(f"Cancelling job #{job.id}.", ephemeral=True)
+
+# Command to view or change this server's moderation settings
+@bot.tree.command(name='settings', description='View or change moderation settings for this server.')
+async def settings_command(interaction: discord.Interaction, key: str = None, value: str = None):
+    if not check_permissions(interaction, ['manage_guild']):
+        await interaction.response.send_message("You don't have permission to use this command.")
+        return
+
+    guild = interaction.guild
+    if key is None:
+        current = settings.guild(guild.id)
+        lines = [f"**{name}**: {format_setting(SETTING_TYPES[name], getattr(current, name))}" for name in SETTING_TYPES]
+        await interaction.response.send_message('\n'.join(lines), allowed_mentions=discord.AllowedMentions.none())
+        return
+
+    if key not in SETTING_TYPES:
+        await interaction.response.send_message(f"Unknown setting. Use one of: {', '.join(SETTING_TYPES)}.")
+        return
+
+    try:
+        parsed = parse_setting(guild, SETTING_TYPES[key], value, minimum=SETTING_MINIMUMS.get(key, 0))
+    except ValueError as error:
+        await interaction.response.send_message(f"Invalid value for {key}: {error}")
+        return
+
+    settings.update(guild.id, **{key: parsed})
+    await interaction.response.send_message(f"Set **{key}** to {format_setting(SETTING_TYPES[key], parsed)}.",
+                                            allowed_mentions=discord.AllowedMentions.none())
+
+# Helpers to parse and display typed setting values; an empty value resets the setting
+def parse_setting(guild, kind, value, minimum=0):
+    tokens = [token.strip('<@&#>! ') for token in (value or '').replace(',', ' ').split()]
+    if kind == 'int':
+        if len(tokens) != 1 or not tokens[0].isdigit():
+            raise ValueError("expected a number")
+        if int(tokens[0]) < minimum:
+            raise ValueError(f"must be at least {minimum}")
+        return int(tokens[0])
+    if not all(token.isdigit() for token in tokens):
+        raise ValueError("expected mentions or IDs")
+    ids = [int(token) for token in tokens]
+    lookup = guild.get_role if kind.startswith('role') else guild.get_channel
+    missing = [str(item) for item in ids if lookup(item) is None]
+    if missing:
+        raise ValueError(f"not found in this server: {', '.join(missing)}")
+    if kind in ('roles', 'channels'):
+        return ids
+    if len(ids) > 1:
+        raise ValueError("expected a single value")
+    return ids[0] if ids else None
+
+def format_setting(kind, value):
+    if value is None or value == []:
+        return 'Not set'
+    if kind == 'int':
+        return str(value)
+    mention = '<@&{}>' if kind.startswith('role') else '<#{}>'
+    values = value if isinstance(value, list) else [value]
+    return ', '.join(mention.format(item) for item in values)
 
 # Run the bot
-bot.run('YOUR_BOT_TOKEN') 
+if __name__ == '__main__':
+    bot.run(os.environ.get('BOTIX_TOKEN') or settings.config.get('token', 'YOUR_BOT_TOKEN')) 
@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import sys
+import time
+
+# Environment passed from the supervisor to each cluster process
+ENV_CLUSTER_ID = 'BOTIX_CLUSTER_ID'
+ENV_SHARD_IDS = 'BOTIX_SHARD_IDS'
+ENV_SHARD_COUNT = 'BOTIX_SHARD_COUNT'
+ENV_IPC_SOCKET = 'BOTIX_IPC_SOCKET'
+
+
+# Split shard IDs 0..shard_count-1 into contiguous ranges, one per cluster
+def shard_ranges(shard_count, clusters):
+    size, extra = divmod(shard_count, clusters)
+    ranges, start = [], 0
+    for index in range(clusters):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+# The shard that receives a guild's gateway events
+def shard_for_guild(guild_id, shard_count):
+    return (guild_id >> 22) % shard_count
+
+
+async def _send(writer, message):
+    writer.write(json.dumps(message, separators=(',', ':')).encode() + b'\n')
+    await writer.drain()
+
+
+# IPC client used inside a cluster process.
+# It pushes a heartbeat with this cluster's stats to the supervisor and can request the latest
+# stats of every cluster, over newline-delimited JSON on a unix socket.
+class ClusterClient:
+    def __init__(self, cluster_id, shard_ids, shard_count, socket_path, heartbeat_interval=10.0):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.socket_path = socket_path
+        self.heartbeat_interval = heartbeat_interval
+        self.started_at = time.time()
+        self._reader = None
+        self._writer = None
+        self._requests = {}
+        self._next_request = 0
+        self._tasks = []
+
+    @classmethod
+    def from_env(cls):
+        if ENV_SHARD_IDS not in os.environ:
+            return None
+        return cls(
+            int(os.environ.get(ENV_CLUSTER_ID, 0)),
+            [int(shard) for shard in os.environ[ENV_SHARD_IDS].split(',')],
+            int(os.environ[ENV_SHARD_COUNT]),
+            os.environ.get(ENV_IPC_SOCKET),
+        )
+
+    def owns_guild(self, guild_id):
+        # DMs and guild-less work belong to the first cluster
+        if guild_id is None:
+            return self.cluster_id == 0
+        return shard_for_guild(guild_id, self.shard_count) in self.shard_ids
+
+    async def start(self, collect_stats):
+        # collect_stats() returns this cluster's stats dict for each heartbeat
+        if self._tasks or not self.socket_path:
+            return
+        self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+        await _send(self._writer, {'op': 'hello', 'cluster': self.cluster_id, 'shards': self.shard_ids})
+        self._tasks = [
+            asyncio.create_task(self._read_loop()),
+            asyncio.create_task(self._heartbeat_loop(collect_stats)),
+        ]
+
+    async def _heartbeat_loop(self, collect_stats):
+        while True:
+            stats = dict(collect_stats(), started_at=self.started_at, shards=self.shard_ids)
+            await _send(self._writer, {'op': 'heartbeat', 'cluster': self.cluster_id, 'data': stats})
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def _read_loop(self):
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                for future in self._requests.values():
+                    future.set_exception(ConnectionError('Supervisor connection closed'))
+                self._requests.clear()
+                return
+            message = json.loads(line)
+            future = self._requests.pop(message.get('id'), None)
+            if future is not None and not future.done():
+                future.set_result(message['data'])
+
+    async def stats(self, timeout=2.0):
+        # Return {'started_at': ..., 'clusters': {cluster_id: stats}} from the supervisor
+        self._next_request += 1
+        request_id = self._next_request
+        future = asyncio.get_running_loop().create_future()
+        self._requests[request_id] = future
+        await _send(self._writer, {'op': 'stats', 'id': request_id})
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._requests.pop(request_id, None)
+
+
+# Supervisor process.
+# Spawns one process per shard range, restarts any that exit with a backoff, and serves the
+# IPC socket that collects cluster heartbeats and answers aggregated stats requests.
+class Supervisor:
+    def __init__(self, command, shard_count, clusters, socket_path, env=None):
+        self.command = command
+        self.shard_count = shard_count
+        self.ranges = shard_ranges(shard_count, clusters)
+        self.socket_path = socket_path
+        self.env = env or {}
+        self.started_at = time.time()
+        self.stats = {}
+        self._processes = {}
+        self._stopping = False
+
+    async def run(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        try:
+            await asyncio.gather(*(self._keep_alive(cluster_id) for cluster_id in range(len(self.ranges))))
+        finally:
+            server.close()
+            await server.wait_closed()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def stop(self):
+        self._stopping = True
+        for process in self._processes.values():
+            if process.returncode is None:
+                process.terminate()
+
+    async def _keep_alive(self, cluster_id):
+        backoff = 1.0
+        while not self._stopping:
+            env = dict(os.environ, **self.env)
+            env.update({
+                ENV_CLUSTER_ID: str(cluster_id),
+                ENV_SHARD_IDS: ','.join(map(str, self.ranges[cluster_id])),
+                ENV_SHARD_COUNT: str(self.shard_count),
+                ENV_IPC_SOCKET: self.socket_path,
+            })
+            started = time.monotonic()
+            process = await asyncio.create_subprocess_exec(*self.command, env=env)
+            self._processes[cluster_id] = process
+            print(f'Cluster {cluster_id} started (pid {process.pid}, shards {self.ranges[cluster_id]})')
+            code = await process.wait()
+            self.stats.pop(cluster_id, None)
+            if self._stopping:
+                return
+            # Reset the backoff once a process has stayed up for a while
+            delay = 1.0 if time.monotonic() - started > 60 else backoff
+            backoff = min(delay * 2, 60.0)
+            print(f'Cluster {cluster_id} exited with code {code}; restarting in {delay:.0f}s')
+            await asyncio.sleep(delay)
+
+    async def _handle(self, reader, writer):
+        cluster_id = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                message = json.loads(line)
+                op = message.get('op')
+                if op == 'hello':
+                    cluster_id = message['cluster']
+                elif op == 'heartbeat':
+                    self.stats[message['cluster']] = message['data']
+                elif op == 'stats':
+                    await _send(writer, {'id': message['id'], 'data': {
+                        'started_at': self.started_at,
+                        'shard_count': self.shard_count,
+                        'clusters': self.stats,
+                    }})
+        finally:
+            if cluster_id is not None:
+                self.stats.pop(cluster_id, None)
+            writer.close()
+
+
+# Stand-in for a bot process: pretends to own some guilds and reports them over IPC,
+# so the supervisor and IPC can be exercised locally without connecting to Discord.
+async def run_stub_worker():
+    client = ClusterClient.from_env()
+    guilds = random.randint(100, 1000) * len(client.shard_ids)
+
+    def collect_stats():
+        return {
+            'guilds': guilds,
+            'members': guilds * 150,
+            'latencies': {str(shard): round(random.uniform(0.03, 0.12), 3) for shard in client.shard_ids},
+        }
+
+    client.heartbeat_interval = 1.0
+    await client.start(collect_stats)
+    while True:
+        await asyncio.sleep(3)
+        if client.cluster_id == 0:
+            stats = await client.stats()
+            total = sum(cluster['guilds'] for cluster in stats['clusters'].values())
+            print(f"[stub cluster 0] {len(stats['clusters'])} clusters reporting, {total} guilds")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run botix as a supervised multi-process shard cluster.')
+    parser.add_argument('--shards', type=int, required=True, help='total number of shards')
+    parser.add_argument('--clusters', type=int, default=os.cpu_count() or 1, help='number of processes')
+    parser.add_argument('--socket', default='/tmp/botix-cluster.sock', help='IPC unix socket path')
+    parser.add_argument('--stub', action='store_true', help='run stub workers instead of connecting to Discord')
+    parser.add_argument('--worker-stub', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker_stub:
+        asyncio.run(run_stub_worker())
+        return
+
+    clusters = max(1, min(args.clusters, args.shards))
+    if args.stub:
+        command = [sys.executable, os.path.abspath(__file__), '--shards', str(args.shards), '--worker-stub']
+    else:
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'botix.py')]
+    supervisor = Supervisor(command, args.shards, clusters, args.socket)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, lambda: asyncio.ensure_future(supervisor.stop()))
+        await supervisor.run()
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
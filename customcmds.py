@@ -0,0 +1,147 @@
+import re
+from collections import OrderedDict
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS custom_commands (
+    guild_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    response TEXT NOT NULL,
+    PRIMARY KEY (guild_id, name)
+);
+'''
+
+_VARIABLE_RE = re.compile(r'\{([a-z_.]+)\}')
+
+# Template variables and how to resolve them from the triggering message and its arguments
+VARIABLES = {
+    'user': lambda message, args: message.author.mention,
+    'user.name': lambda message, args: message.author.display_name,
+    'user.id': lambda message, args: str(message.author.id),
+    'server': lambda message, args: message.guild.name,
+    'server.id': lambda message, args: str(message.guild.id),
+    'membercount': lambda message, args: str(message.guild.member_count),
+    'channel': lambda message, args: message.channel.mention,
+    'args': lambda message, args: args,
+}
+
+
+# A response template split once into literal text and variable resolvers
+class Template:
+    __slots__ = ('source', '_parts')
+
+    def __init__(self, source):
+        self.source = source
+        parts = []
+        position = 0
+        for match in _VARIABLE_RE.finditer(source):
+            resolver = VARIABLES.get(match.group(1))
+            if resolver is None:
+                continue
+            if match.start() > position:
+                parts.append(source[position:match.start()])
+            parts.append(resolver)
+            position = match.end()
+        if position < len(source):
+            parts.append(source[position:])
+        self._parts = tuple(parts)
+
+    def render(self, message, args=''):
+        return ''.join(part if isinstance(part, str) else part(message, args) for part in self._parts)
+
+
+# Custom commands for every guild.
+# Each guild's commands compile into a dict of name -> Template, and compiled tables are kept
+# in an LRU bounded by the total number of commands held, so idle guilds fall out of memory and
+# are reloaded from the custom_commands table on their next use.
+class CustomCommands:
+    def __init__(self, db, prefix='!', max_entries=50000):
+        self.db = db
+        self.prefix = prefix
+        self.max_entries = max_entries
+        self._tables = OrderedDict()
+        self._cached_entries = 0
+        self._guilds = set()
+
+    async def start(self):
+        await self.db.executescript(SCHEMA)
+        rows = await self.db.fetchall('SELECT DISTINCT guild_id FROM custom_commands')
+        self._guilds = {row['guild_id'] for row in rows}
+
+    @staticmethod
+    def normalize(name):
+        name = name.strip().lower()
+        if name.startswith('!'):
+            name = name[1:]
+        return name
+
+    def parse(self, content):
+        # Split "!name args" into (name, args), or return None if it isn't prefixed
+        if not content.startswith(self.prefix):
+            return None
+        body = content[len(self.prefix):]
+        name, _, args = body.partition(' ')
+        return name.lower(), args.strip()
+
+    async def table(self, guild_id):
+        table = self._tables.get(guild_id)
+        if table is not None:
+            self._tables.move_to_end(guild_id)
+            return table
+
+        table = {}
+        if guild_id in self._guilds:
+            rows = await self.db.fetchall('SELECT name, response FROM custom_commands WHERE guild_id = ?', (guild_id,))
+            table = {row['name']: Template(row['response']) for row in rows}
+        self._tables[guild_id] = table
+        self._cached_entries += len(table)
+        self._evict()
+        return table
+
+    def _evict(self):
+        while self._cached_entries > self.max_entries and len(self._tables) > 1:
+            _, table = self._tables.popitem(last=False)
+            self._cached_entries -= len(table)
+
+    async def add(self, guild_id, name, response):
+        template = Template(response)
+        await self.db.execute(
+            'INSERT OR REPLACE INTO custom_commands (guild_id, name, response) VALUES (?, ?, ?)',
+            (guild_id, name, response),
+        )
+        self._guilds.add(guild_id)
+        table = await self.table(guild_id)
+        if name not in table:
+            self._cached_entries += 1
+        table[name] = template
+        self._evict()
+
+    async def remove(self, guild_id, name):
+        _, removed = await self.db.execute('DELETE FROM custom_commands WHERE guild_id = ? AND name = ?', (guild_id, name))
+        table = self._tables.get(guild_id)
+        if table is not None and table.pop(name, None) is not None:
+            self._cached_entries -= 1
+            if not table:
+                self._guilds.discard(guild_id)
+        return removed > 0
+
+    async def names(self, guild_id):
+        return sorted(await self.table(guild_id))
+
+    async def resolve(self, message):
+        # Return the rendered response for a custom command message, or None
+        guild_id = message.guild.id
+        if guild_id not in self._guilds:
+            return None
+        parsed = self.parse(message.content)
+        if parsed is None:
+            return None
+        name, args = parsed
+        table = self._tables.get(guild_id)
+        if table is None:
+            table = await self.table(guild_id)
+        else:
+            self._tables.move_to_end(guild_id)
+        template = table.get(name)
+        if template is None:
+            return None
+        return template.render(message, args)
@@ -0,0 +1,207 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+from metrics import Histogram
+
+# Priority classes, most urgent first
+MODERATION = 0
+AUTOMATION = 1
+UTILITY = 2
+PRIORITY_NAMES = ('moderation', 'automation', 'utility')
+
+# Requests allowed per window (seconds) for each route, per major ID (guild or channel).
+# Discord publishes buckets only through response headers, so these are conservative pacing
+# limits that keep bursts from reaching discord.py's own 429 handling.
+DEFAULT_LIMITS = {
+    'guild.ban': (5, 5.0),
+    'guild.unban': (5, 5.0),
+    'guild.bulk_ban': (1, 2.0),
+    'member.kick': (5, 5.0),
+    'member.edit': (10, 10.0),
+    'member.fetch': (10, 1.0),
+    'channel.edit': (5, 5.0),
+    'channel.send': (5, 5.0),
+    'message.delete': (5, 5.0),
+    'message.bulk_delete': (1, 1.0),
+    'role.edit': (5, 5.0),
+    'user.dm': (5, 5.0),
+}
+FALLBACK_LIMIT = (5, 5.0)
+# Seconds between sweeps of idle route buckets
+BUCKET_SWEEP_INTERVAL = 60.0
+
+
+class _Bucket:
+    __slots__ = ('limit', 'per', 'remaining', 'reset_at')
+
+    def __init__(self, limit, per):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def acquire(self, now):
+        # Take a slot and return 0, or return how long until the window resets
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.per
+        if self.remaining > 0:
+            self.remaining -= 1
+            return 0.0
+        return self.reset_at - now
+
+
+class _Job:
+    __slots__ = ('priority', 'seq', 'route', 'key', 'factory', 'future', 'enqueued_at', 'started')
+
+    def __init__(self, priority, seq, route, key, factory, future):
+        self.priority = priority
+        self.seq = seq
+        self.route = route
+        self.key = key
+        self.factory = factory
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.started = False
+
+
+# Run factory() through the dispatcher, or directly when there is none
+async def request(rest, priority, route, factory, key=None):
+    if rest is None:
+        return await factory()
+    return await rest.submit(priority, route, factory, key=key)
+
+
+# Central outbound REST scheduler.
+# Requests are queued by priority class and started highest first, with a bounded number in
+# flight and some slots held back for moderation, so bulk work never starves a ban. Each route
+# (route name, major ID) is paced by a proactive bucket; a request whose bucket is empty waits
+# aside until the window resets while other routes keep going. A bucket whose window has passed
+# is as good as a new one, so those are swept periodically to bound memory across every major
+# ID ever seen. Requests submitted with a key that is already queued are coalesced into the
+# queued one.
+class RestDispatcher:
+    def __init__(self, concurrency=8, reserved=2, limits=None):
+        self.concurrency = concurrency
+        self.reserved = reserved
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.in_flight = 0
+        self.coalesced = 0
+        self.wait_times = [Histogram() for _ in PRIORITY_NAMES]
+        self._heap = []
+        self._parked = 0
+        self._queued = [0] * len(PRIORITY_NAMES)
+        self._buckets = {}
+        self._next_sweep = 0.0
+        self._pending = {}
+        self._seq = itertools.count()
+
+    def depth(self):
+        # Queued (not yet started) requests per priority name
+        return dict(zip(PRIORITY_NAMES, self._queued))
+
+    def _bucket(self, route):
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            bucket = self._buckets[route] = _Bucket(*self.limits.get(route[0], FALLBACK_LIMIT))
+        return bucket
+
+    async def submit(self, priority, route, factory, key=None):
+        # Run factory() (returning an awaitable request) under the given priority and route
+        # (route name, major ID) and return its result. A request queued under the same key
+        # takes the new factory and both callers share its result.
+        job = self._pending.get(key) if key is not None else None
+        if job is not None:
+            job.factory = factory
+            self.coalesced += 1
+            if priority < job.priority:
+                self._queued[job.priority] -= 1
+                self._queued[priority] += 1
+                job.priority = priority
+                self._push(job)
+        else:
+            job = _Job(priority, next(self._seq), route, key, factory, asyncio.get_running_loop().create_future())
+            if key is not None:
+                self._pending[key] = job
+            self._queued[priority] += 1
+            self._push(job)
+        self._pump()
+        return await asyncio.shield(job.future)
+
+    def _push(self, job):
+        heapq.heappush(self._heap, (job.priority, job.seq, job))
+
+    def _sweep(self, now):
+        self._buckets = {route: bucket for route, bucket in self._buckets.items() if bucket.reset_at > now}
+        self._next_sweep = now + BUCKET_SWEEP_INTERVAL
+
+    def _pump(self):
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+        while self._heap and self.in_flight < self.concurrency:
+            priority, _, job = self._heap[0]
+            if job.started or priority != job.priority:
+                # Stale entry left behind by a priority escalation
+                heapq.heappop(self._heap)
+                continue
+            if priority != MODERATION and self.in_flight >= self.concurrency - self.reserved:
+                return
+            heapq.heappop(self._heap)
+            wait = self._bucket(job.route).acquire(now)
+            if wait > 0:
+                self._parked += 1
+                asyncio.get_running_loop().call_later(wait, self._unpark, job)
+                continue
+            self._start(job)
+
+    def _unpark(self, job):
+        self._parked -= 1
+        if not job.started:
+            self._push(job)
+            self._pump()
+
+    def _start(self, job):
+        job.started = True
+        if job.key is not None and self._pending.get(job.key) is job:
+            del self._pending[job.key]
+        self._queued[job.priority] -= 1
+        self.wait_times[job.priority].observe(time.monotonic() - job.enqueued_at)
+        self.in_flight += 1
+        asyncio.create_task(self._execute(job))
+
+    async def _execute(self, job):
+        try:
+            result = await job.factory()
+        except Exception as exc:
+            job.future.set_exception(exc)
+            # Mark it retrieved: every submitter may have been cancelled meanwhile
+            job.future.exception()
+        else:
+            job.future.set_result(result)
+        finally:
+            # Cancellation and other BaseExceptions skip both branches; don't leave submitters waiting
+            if not job.future.done():
+                job.future.cancel()
+            self.in_flight -= 1
+            self._pump()
+
+    def metric_lines(self, namespace):
+        # Prometheus text lines for queue depth, in-flight requests, wait times and coalescing
+        lines = [f'# TYPE {namespace}_rest_queue_depth gauge']
+        for name, depth in self.depth().items():
+            lines.append(f'{namespace}_rest_queue_depth{{priority="{name}"}} {depth}')
+        lines.append(f'# TYPE {namespace}_rest_in_flight gauge')
+        lines.append(f'{namespace}_rest_in_flight {self.in_flight}')
+        lines.append(f'# TYPE {namespace}_rest_rate_limited_waiting gauge')
+        lines.append(f'{namespace}_rest_rate_limited_waiting {self._parked}')
+        lines.append(f'# TYPE {namespace}_rest_buckets gauge')
+        lines.append(f'{namespace}_rest_buckets {len(self._buckets)}')
+        lines.append(f'# TYPE {namespace}_rest_coalesced_total counter')
+        lines.append(f'{namespace}_rest_coalesced_total {self.coalesced}')
+        lines.append(f'# TYPE {namespace}_rest_wait_seconds histogram')
+        for name, histogram in zip(PRIORITY_NAMES, self.wait_times):
+            lines.extend(histogram.lines(f'{namespace}_rest_wait_seconds', {'priority': name}))
+        return lines
@@ -0,0 +1,158 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import pathlib
+import sqlite3
+import sys
+
+# Rows of each export kind for one guild, read in id order one batch at a time. The unary +
+# keeps sqlite walking the primary key from the last id rather than re-sorting the guild's rows
+# out of a guild_id index on every batch.
+QUERIES = {
+    'cases': 'SELECT id, target_id, target_seq, moderator_id, action, reason, created_at, expires_at, active, deleted '
+             'FROM cases WHERE +guild_id = ? AND id > ? ORDER BY id LIMIT ?',
+    'warnings': 'SELECT id, target_id, target_seq, moderator_id, reason, created_at, active, deleted '
+                "FROM cases WHERE +guild_id = ? AND action = 'warn' AND id > ? ORDER BY id LIMIT ?",
+    'notes': 'SELECT id, target_id, moderator_id, text, created_at, edited_at '
+             'FROM notes WHERE +guild_id = ? AND id > ? ORDER BY id LIMIT ?',
+}
+FORMATS = ('ndjson', 'csv')
+# Compressed bytes kept free below the part limit for output zlib still holds in its buffers
+PART_HEADROOM = 256 * 1024
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+# Open the database read-only; in WAL mode this reads alongside the bot's own connection
+def connect(path):
+    return sqlite3.connect(f'{pathlib.Path(path).absolute().as_uri()}?mode=ro', uri=True, timeout=30)
+
+
+def iter_rows(conn, kind, guild_id, batch_size=1000, stop=None):
+    # Yield column names first, then every row; keyset pagination keeps each query small
+    cursor = conn.execute(QUERIES[kind], (guild_id, 0, 0))
+    yield [column[0] for column in cursor.description]
+    last_id = 0
+    while True:
+        if stop is not None and stop.is_set():
+            raise ExportCancelled()
+        rows = conn.execute(QUERIES[kind], (guild_id, last_id, batch_size)).fetchall()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1][0]
+
+
+def ndjson_lines(columns, rows):
+    for row in rows:
+        yield (json.dumps(dict(zip(columns, row)), ensure_ascii=False, separators=(',', ':')) + '\n').encode()
+
+
+def csv_lines(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def csv_header(columns):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(columns)
+    return buffer.getvalue().encode()
+
+
+def write_parts(lines, directory, basename, header=b'', part_limit=0):
+    # Gzip lines into basename-1.gz, basename-2.gz, ... each below part_limit compressed bytes
+    # (0 for a single file), repeating header at the top of each part. Yields (path, lines).
+    part = 0
+    raw = gz = None
+    count = 0
+    for line in lines:
+        if gz is None:
+            part += 1
+            path = os.path.join(directory, f'{basename}-{part}.gz')
+            raw = open(path, 'wb')
+            gz = gzip.GzipFile(filename='', mode='wb', compresslevel=6, fileobj=raw, mtime=0)
+            gz.write(header)
+            count = 0
+        gz.write(line)
+        count += 1
+        if part_limit and raw.tell() >= part_limit - PART_HEADROOM:
+            gz.close()
+            raw.close()
+            gz = None
+            yield path, count
+    if gz is not None:
+        gz.close()
+        raw.close()
+        yield path, count
+
+
+# Export the given kinds of a guild's moderation history into gzip parts in directory.
+# Rows stream from sqlite through the encoder into the compressor, so memory stays constant
+# however many rows there are. on_part(kind, path, rows) is called as each part is finished and
+# may move or upload it. Returns {kind: rows exported}.
+def export_guild(db_path, guild_id, kinds, fmt, directory, part_limit=0, stop=None, on_part=None, batch_size=1000):
+    conn = connect(db_path)
+    totals = {}
+    try:
+        for kind in kinds:
+            rows = iter_rows(conn, kind, guild_id, batch_size, stop)
+            columns = next(rows)
+            if fmt == 'csv':
+                lines, header = csv_lines(columns, rows), csv_header(columns)
+            else:
+                lines, header = ndjson_lines(columns, rows), b''
+            totals[kind] = 0
+            for path, count in write_parts(lines, directory, f'modlog-{guild_id}-{kind}.{fmt}', header, part_limit):
+                totals[kind] += count
+                if on_part is not None:
+                    on_part(kind, path, count)
+    finally:
+        conn.close()
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a guild's moderation history as gzip-compressed NDJSON or CSV.")
+    parser.add_argument('guild_id', type=int)
+    parser.add_argument('--db', default=None, help="database path (default: 'database' from config.json, else botix.db)")
+    parser.add_argument('--kind', choices=('all',) + tuple(QUERIES), default='all')
+    parser.add_argument('--format', choices=FORMATS, default='ndjson')
+    parser.add_argument('--out', default='.', help='output directory')
+    parser.add_argument('--part-size', type=float, default=0, help='split into parts of at most this many MB (default: one file)')
+    args = parser.parse_args(argv)
+
+    db_path = args.db
+    if db_path is None:
+        try:
+            with open('config.json') as file:
+                db_path = json.load(file).get('database', 'botix.db')
+        except FileNotFoundError:
+            db_path = 'botix.db'
+    if not os.path.exists(db_path):
+        parser.error(f'database not found: {db_path}')
+    os.makedirs(args.out, exist_ok=True)
+
+    kinds = ('cases', 'notes') if args.kind == 'all' else (args.kind,)
+    part_limit = int(args.part_size * 2**20)
+    if part_limit and part_limit <= PART_HEADROOM:
+        parser.error(f'--part-size must be above {PART_HEADROOM / 2**20} MB')
+
+    def report(kind, path, count):
+        print(f'{path}: {count} {kind} rows, {os.path.getsize(path)} bytes')
+
+    totals = export_guild(db_path, args.guild_id, kinds, args.format, args.out, part_limit, on_part=report)
+    print(', '.join(f'{count} {kind}' for kind, count in totals.items()) + ' exported', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
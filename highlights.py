@@ -0,0 +1,210 @@
+import time
+from collections import deque
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS highlights (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    phrase TEXT NOT NULL,
+    PRIMARY KEY (guild_id, user_id, phrase)
+);
+'''
+
+
+# Aho-Corasick automaton over one guild's highlight phrases.
+# Adding a phrase only extends the trie; failure links are recomputed lazily on the next search,
+# so a burst of subscriptions costs one rebuild. Removed phrases just lose their output mark and
+# the trie is compacted once dead nodes outnumber live ones.
+class PhraseIndex:
+    def __init__(self):
+        self.subscribers = {}
+        self._reset()
+
+    def _reset(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._link = [0]
+        self._out = [None]
+        self._live_chars = 1
+        self._dirty = False
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def add(self, phrase, user_id):
+        users = self.subscribers.get(phrase)
+        if users is None:
+            users = self.subscribers[phrase] = set()
+            self._insert(phrase)
+        users.add(user_id)
+
+    def remove(self, phrase, user_id):
+        users = self.subscribers.get(phrase)
+        if users is None:
+            return
+        users.discard(user_id)
+        if users:
+            return
+        del self.subscribers[phrase]
+        node = self._find(phrase)
+        if node is not None:
+            self._out[node] = None
+            self._live_chars -= len(phrase)
+            self._dirty = True
+        if len(self._goto) > 2 * self._live_chars:
+            self._compact()
+
+    def _insert(self, phrase):
+        node = 0
+        for char in phrase:
+            child = self._goto[node].get(char)
+            if child is None:
+                child = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._link.append(0)
+                self._out.append(None)
+                self._goto[node][char] = child
+            node = child
+        self._out[node] = phrase
+        self._live_chars += len(phrase)
+        self._dirty = True
+
+    def _find(self, phrase):
+        node = 0
+        for char in phrase:
+            node = self._goto[node].get(char)
+            if node is None:
+                return None
+        return node
+
+    def _compact(self):
+        self._reset()
+        for phrase in self.subscribers:
+            self._insert(phrase)
+
+    def _build(self):
+        # Breadth-first pass computing failure links and output (dictionary suffix) links
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            self._link[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                fail = self._fail[child]
+                self._link[child] = fail if self._out[fail] is not None else self._link[fail]
+                queue.append(child)
+        self._dirty = False
+
+    def search(self, text):
+        # Return the set of subscribed phrases found in text as whole words, in one pass
+        if not self.subscribers:
+            return set()
+        if self._dirty:
+            self._build()
+
+        goto, fail, link, out = self._goto, self._fail, self._link, self._out
+        found = set()
+        node = 0
+        length = len(text)
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            match = node if out[node] is not None else link[node]
+            while match:
+                phrase = out[match]
+                start = index - len(phrase) + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (index + 1 == length or not text[index + 1].isalnum()):
+                    found.add(phrase)
+                match = link[match]
+        return found
+
+
+# Per-guild highlight subscriptions backed by the highlights table
+class Highlights:
+    def __init__(self, db, cooldown=300):
+        self.db = db
+        self.cooldown = cooldown
+        self._indexes = {}
+        self._last_notified = {}
+
+    async def start(self):
+        await self.db.executescript(SCHEMA)
+        rows = await self.db.fetchall('SELECT guild_id, user_id, phrase FROM highlights')
+        for row in rows:
+            self._index(row['guild_id']).add(row['phrase'], row['user_id'])
+
+    def _index(self, guild_id):
+        index = self._indexes.get(guild_id)
+        if index is None:
+            index = self._indexes[guild_id] = PhraseIndex()
+        return index
+
+    @staticmethod
+    def normalize(phrase):
+        return ' '.join(phrase.lower().split())
+
+    def phrases_for(self, guild_id, user_id):
+        index = self._indexes.get(guild_id)
+        if index is None:
+            return []
+        return sorted(phrase for phrase, users in index.subscribers.items() if user_id in users)
+
+    async def add(self, guild_id, user_id, phrase):
+        phrase = self.normalize(phrase)
+        if not phrase or phrase in self.phrases_for(guild_id, user_id):
+            return False
+        await self.db.execute(
+            'INSERT OR IGNORE INTO highlights (guild_id, user_id, phrase) VALUES (?, ?, ?)',
+            (guild_id, user_id, phrase),
+        )
+        self._index(guild_id).add(phrase, user_id)
+        return True
+
+    async def remove(self, guild_id, user_id, phrase):
+        phrase = self.normalize(phrase)
+        _, removed = await self.db.execute(
+            'DELETE FROM highlights WHERE guild_id = ? AND user_id = ? AND phrase = ?',
+            (guild_id, user_id, phrase),
+        )
+        if guild_id in self._indexes:
+            self._indexes[guild_id].remove(phrase, user_id)
+        return removed > 0
+
+    async def clear(self, guild_id, user_id):
+        phrases = self.phrases_for(guild_id, user_id)
+        await self.db.execute('DELETE FROM highlights WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
+        for phrase in phrases:
+            self._indexes[guild_id].remove(phrase, user_id)
+        return len(phrases)
+
+    def match(self, guild_id, content):
+        # Map each subscribed user to the first phrase of theirs found in content
+        index = self._indexes.get(guild_id)
+        if index is None or not len(index):
+            return {}
+        matches = {}
+        for phrase in sorted(index.search(' '.join(content.lower().split()))):
+            for user_id in index.subscribers[phrase]:
+                matches.setdefault(user_id, phrase)
+        return matches
+
+    def take_cooldown(self, guild_id, user_id, now=None):
+        # Return True and start the cooldown if the user may be notified now
+        now = time.monotonic() if now is None else now
+        key = (guild_id, user_id)
+        last = self._last_notified.get(key)
+        if last is not None and now - last < self.cooldown:
+            return False
+        self._last_notified[key] = now
+        if len(self._last_notified) > 10000:
+            self._last_notified = {k: v for k, v in self._last_notified.items() if now - v < self.cooldown}
+        return True
@@ -0,0 +1,194 @@
+import asyncio
+import itertools
+import time
+import traceback
+from collections import deque
+
+import discord
+
+# Interaction tokens expire after 15 minutes; after that results go to the channel instead
+INTERACTION_TTL = 14 * 60
+
+
+class Job:
+    __slots__ = ('id', 'guild_id', 'user_id', 'name', 'description', 'status', 'progress', 'result',
+                 'created_at', 'started_at', 'finished_at', 'interaction', 'work', 'task', '_last_update', '_done')
+
+    def __init__(self, job_id, interaction, name, description, work):
+        self.id = job_id
+        self.guild_id = interaction.guild_id
+        self.user_id = interaction.user.id
+        self.name = name
+        self.description = description
+        self.status = 'queued'
+        self.progress = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.interaction = interaction
+        self.work = work
+        self.task = None
+        self._last_update = 0.0
+        self._done = asyncio.Event()
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    def summary(self):
+        text = f"#{self.id} `{self.name}` {self.status}"
+        if self.description:
+            text += f": {self.description}"
+        if self.progress and self.active:
+            text += f" ({self.progress})"
+        return text
+
+    async def wait(self):
+        await self._done.wait()
+
+    async def update(self, text, force=False):
+        # Report progress on the deferred response, at most once every two seconds
+        self.progress = text
+        if not force and time.monotonic() - self._last_update < 2:
+            return
+        self._last_update = time.monotonic()
+        await self._edit(text)
+
+    async def _edit(self, text):
+        if time.time() - self.created_at > INTERACTION_TTL:
+            return False
+        try:
+            await self.interaction.edit_original_response(content=text)
+            return True
+        except discord.HTTPException:
+            return False
+
+    async def _finish(self, text):
+        if not await self._edit(text) and self.interaction.channel is not None:
+            try:
+                await self.interaction.channel.send(f"<@{self.user_id}> {text}")
+            except discord.HTTPException:
+                pass
+
+
+# Background job runner for long-running commands.
+# submit() defers the interaction at once and queues the work; a fixed pool of workers runs
+# queued jobs in order, skipping guilds that already have their per-guild limit of jobs running
+# so one busy guild cannot hold every worker. Jobs report progress by editing the deferred
+# response and post their result the same way. Finished jobs are kept for a while for /jobs.
+class JobRunner:
+    def __init__(self, workers=4, limit_for_guild=None, max_queued=500, history=200):
+        self.workers = workers
+        self.limit_for_guild = limit_for_guild or (lambda guild_id: 2)
+        self.max_queued = max_queued
+        self._ids = itertools.count(1)
+        self._queue = deque()
+        self._jobs = {}
+        self._finished = deque(maxlen=history)
+        self._running = {}
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def for_guild(self, guild_id):
+        return [job for job in self._jobs.values() if job.guild_id == guild_id]
+
+    async def submit(self, interaction, name, work, description=None, ephemeral=False):
+        # Defer and queue work(job), a coroutine function returning the completion message.
+        # Returns the job, or None if the queue is full.
+        if not interaction.response.is_done():
+            await interaction.response.defer(ephemeral=ephemeral, thinking=True)
+        if len(self._queue) >= self.max_queued:
+            await interaction.edit_original_response(content="Too many jobs are queued right now, try again shortly.")
+            return None
+        job = Job(next(self._ids), interaction, name, description, work)
+        self._jobs[job.id] = job
+        self._queue.append(job)
+        self._wakeup.set()
+        if job.status == 'queued':
+            await job.update(f"Queued as job #{job.id}...", force=True)
+        return job
+
+    async def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None or not job.active:
+            return None
+        if job.status == 'queued':
+            self._queue.remove(job)
+            self._complete(job, 'cancelled')
+            await job._finish(f"Job #{job.id} was cancelled.")
+        else:
+            job.task.cancel()
+        return job
+
+    def _next_job(self):
+        for job in self._queue:
+            if self._running.get(job.guild_id, 0) < self.limit_for_guild(job.guild_id):
+                self._queue.remove(job)
+                return job
+        return None
+
+    async def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                # Nothing runnable; sleep until a job is queued or one finishes
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._run(job)
+            self._wakeup.set()
+
+    async def _run(self, job):
+        self._running[job.guild_id] = self._running.get(job.guild_id, 0) + 1
+        job.status = 'running'
+        job.started_at = time.time()
+        job.task = task = asyncio.create_task(job.work(job))
+        try:
+            # wait() leaves the job task alone if this worker is cancelled, so only /jobs cancel
+            # shows up as a cancelled task below
+            try:
+                await asyncio.wait((task,))
+            except asyncio.CancelledError:
+                task.cancel()
+                self._complete(job, 'cancelled')
+                raise
+            if task.cancelled():
+                self._complete(job, 'cancelled')
+                await job._finish(f"Job #{job.id} was cancelled{f' after {job.progress}' if job.progress else ''}.")
+            elif task.exception() is not None:
+                error = task.exception()
+                traceback.print_exception(type(error), error, error.__traceback__)
+                self._complete(job, 'failed')
+                await job._finish(f"Job #{job.id} failed: {error}")
+            else:
+                job.result = task.result()
+                self._complete(job, 'done')
+                await job._finish(job.result or f"Job #{job.id} finished.")
+        finally:
+            self._running[job.guild_id] -= 1
+            if not self._running[job.guild_id]:
+                del self._running[job.guild_id]
+
+    def _complete(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        job.work = job.task = None
+        job._done.set()
+        # Finished jobs stay visible until pushed out of the history
+        if len(self._finished) == self._finished.maxlen:
+            self._jobs.pop(self._finished[0].id, None)
+        self._finished.append(job)
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import time
+
+import discord
+
+from dispatcher import AUTOMATION, request
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS channel_locks (
+    channel_id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    overwrites TEXT NOT NULL,
+    locked_at REAL NOT NULL
+);
+'''
+
+
+# Roles that keep talking in a locked channel
+def is_staff_role(role):
+    return not role.is_default() and (role.permissions.administrator or role.permissions.manage_messages)
+
+
+def _with_send_messages(overwrite, value):
+    allow, deny = overwrite.pair() if overwrite is not None else (discord.Permissions.none(), discord.Permissions.none())
+    overwrite = discord.PermissionOverwrite.from_pair(allow, deny)
+    overwrite.send_messages = value
+    return overwrite
+
+
+# Compute the full overwrite map for a locked channel.
+# Denying @everyone covers every role without an overwrite, so only roles that explicitly
+# allow sending need touching; staff roles get an explicit allow.
+def lock_overwrites(channel):
+    guild = channel.guild
+    overwrites = dict(channel.overwrites)
+    overwrites[guild.default_role] = _with_send_messages(overwrites.get(guild.default_role), False)
+    for target, overwrite in list(overwrites.items()):
+        if target == guild.default_role:
+            continue
+        if isinstance(target, discord.Role) and is_staff_role(target):
+            continue
+        if overwrite.send_messages:
+            overwrites[target] = _with_send_messages(overwrite, False)
+    for role in guild.roles:
+        if is_staff_role(role):
+            overwrites[role] = _with_send_messages(overwrites.get(role), True)
+    return overwrites
+
+
+def serialize_overwrites(overwrites):
+    data = {}
+    for target, overwrite in overwrites.items():
+        allow, deny = overwrite.pair()
+        kind = 'role' if isinstance(target, discord.Role) else 'member'
+        data[str(target.id)] = [kind, allow.value, deny.value]
+    return json.dumps(data)
+
+
+def deserialize_overwrites(guild, text):
+    overwrites = {}
+    for target_id, (kind, allow, deny) in json.loads(text).items():
+        target_id = int(target_id)
+        if kind == 'role':
+            target = guild.get_role(target_id)
+            if target is None:
+                continue
+        else:
+            target = guild.get_member(target_id) or discord.Object(id=target_id, type=discord.Member)
+        overwrites[target] = discord.PermissionOverwrite.from_pair(discord.Permissions(allow), discord.Permissions(deny))
+    return overwrites
+
+
+# Channel lock/unlock engine.
+# A lock is a single channel edit carrying the complete overwrite map, and the previous
+# overwrites are saved first so unlock can restore them exactly. Many channels are processed
+# with a bounded number of edits in flight.
+class LockEngine:
+    def __init__(self, db, concurrency=3, rest=None):
+        self.db = db
+        self.concurrency = concurrency
+        self.rest = rest
+
+    async def start(self):
+        await self.db.executescript(SCHEMA)
+
+    async def is_locked(self, channel_id):
+        return await self.db.fetchone('SELECT 1 FROM channel_locks WHERE channel_id = ?', (channel_id,)) is not None
+
+    def _edit(self, channel, overwrites, reason, priority):
+        return request(self.rest, priority, ('channel.edit', channel.id),
+                       lambda: channel.edit(overwrites=overwrites, reason=reason))
+
+    async def lock(self, channel, reason=None, priority=AUTOMATION):
+        # Return False if the channel is already locked; the insert doubles as the check so
+        # concurrent lockdowns cannot both claim a channel
+        _, inserted = await self.db.execute(
+            'INSERT OR IGNORE INTO channel_locks (channel_id, guild_id, overwrites, locked_at) VALUES (?, ?, ?, ?)',
+            (channel.id, channel.guild.id, serialize_overwrites(channel.overwrites), time.time()),
+        )
+        if not inserted:
+            return False
+        try:
+            await self._edit(channel, lock_overwrites(channel), reason, priority)
+        except Exception:
+            await self.db.execute('DELETE FROM channel_locks WHERE channel_id = ?', (channel.id,))
+            raise
+        return True
+
+    async def unlock(self, channel, reason=None, priority=AUTOMATION):
+        # Restore the overwrites saved at lock time; channels locked by hand just lose the @everyone deny
+        row = await self.db.fetchone('SELECT overwrites FROM channel_locks WHERE channel_id = ?', (channel.id,))
+        if row is not None:
+            overwrites = deserialize_overwrites(channel.guild, row['overwrites'])
+        else:
+            overwrites = dict(channel.overwrites)
+            everyone = overwrites.get(channel.guild.default_role)
+            if everyone is None or everyone.send_messages is not False:
+                return False
+            overwrites[channel.guild.default_role] = _with_send_messages(everyone, None)
+        await self._edit(channel, overwrites, reason, priority)
+        await self.db.execute('DELETE FROM channel_locks WHERE channel_id = ?', (channel.id,))
+        return True
+
+    async def apply(self, channels, unlock=False, reason=None, message=None, progress=None, priority=AUTOMATION):
+        # Lock or unlock many channels; returns (changed, skipped, failed) and reports progress(done, total)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        action = self.unlock if unlock else self.lock
+        counts = {True: 0, False: 0, None: 0}
+
+        async def run(channel):
+            async with semaphore:
+                try:
+                    if not await action(channel, reason=reason, priority=priority):
+                        return False
+                    if message:
+                        await request(self.rest, priority, ('channel.send', channel.id), lambda: channel.send(message))
+                    return True
+                except discord.HTTPException:
+                    return None
+
+        for done, future in enumerate(asyncio.as_completed([run(channel) for channel in channels]), 1):
+            counts[await future] += 1
+            if progress is not None:
+                await progress(done, len(channels))
+        return counts[True], counts[False], counts[None]
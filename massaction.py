@@ -0,0 +1,122 @@
+import asyncio
+import datetime
+import fnmatch
+import re
+
+import discord
+
+from dispatcher import AUTOMATION, request
+
+# Discord accepts at most 7 days of message history deletion and 200 users per bulk ban
+MAX_DELETE_SECONDS = 7 * 86400
+BULK_BAN_SIZE = 200
+
+_ID_RE = re.compile(r'<@!?(\d+)>|(\d{15,21})')
+
+
+# Parse user mentions and IDs separated by spaces, commas or newlines into (ids, invalid tokens)
+def parse_ids(text):
+    ids, invalid = [], []
+    for token in re.split(r'[\s,]+', text or ''):
+        if not token:
+            continue
+        match = _ID_RE.fullmatch(token)
+        if match is None:
+            invalid.append(token)
+            continue
+        user_id = int(match.group(1) or match.group(2))
+        if user_id not in ids:
+            ids.append(user_id)
+    return ids, invalid
+
+
+# Members that joined within the last joined_within seconds and/or whose name or display name
+# matches the case-insensitive glob pattern name (e.g. 'free*nitro*')
+def match_members(members, joined_within=None, name=None, now=None):
+    now = now or discord.utils.utcnow()
+    since = now - datetime.timedelta(seconds=joined_within) if joined_within is not None else None
+    pattern = name.lower() if name else None
+    matched = []
+    for member in members:
+        if since is not None and (member.joined_at is None or member.joined_at < since):
+            continue
+        if pattern is not None and not (fnmatch.fnmatchcase(member.name.lower(), pattern)
+                                        or fnmatch.fnmatchcase(member.display_name.lower(), pattern)):
+            continue
+        matched.append(member)
+    return matched
+
+
+# Bans and kicks many users as one operation.
+# Bans go out through the bulk ban endpoint, 200 users per request, falling back to single bans
+# for a batch the endpoint refuses; kicks are one request each. At most `concurrency` requests are
+# in flight, at automation priority so single moderation commands still go first, and every
+# successful action is written to the mod log in one transaction at the end (or on cancel).
+class MassModeration:
+    def __init__(self, moderation, rest=None, concurrency=4):
+        self.moderation = moderation
+        self.rest = rest
+        self.concurrency = concurrency
+
+    async def ban(self, guild, targets, moderator_id, reason=None, delete_seconds=86400, progress=None):
+        # Ban members or discord.Objects; returns (banned ids, failed ids, case ids)
+        delete_seconds = max(0, min(delete_seconds, MAX_DELETE_SECONDS))
+        chunks = [targets[index:index + BULK_BAN_SIZE] for index in range(0, len(targets), BULK_BAN_SIZE)]
+
+        async def ban_one(target):
+            await request(self.rest, AUTOMATION, ('guild.ban', guild.id),
+                          lambda: guild.ban(target, reason=reason, delete_message_seconds=delete_seconds))
+
+        async def ban_chunk(chunk):
+            try:
+                result = await request(self.rest, AUTOMATION, ('guild.bulk_ban', guild.id),
+                                       lambda: guild.bulk_ban(chunk, reason=reason, delete_message_seconds=delete_seconds))
+                return [user.id for user in result.banned], [user.id for user in result.failed]
+            except discord.HTTPException:
+                # Bulk bans also need Manage Server and reject a batch with any bad ID;
+                # fall back to banning one at a time
+                return await self._each(chunk, ban_one)
+
+        return await self._run(guild, 'ban', chunks, ban_chunk, len(targets), moderator_id, reason, progress)
+
+    async def kick(self, guild, members, moderator_id, reason=None, progress=None):
+        # Kick members; returns (kicked ids, failed ids, case ids)
+        async def kick_one(member):
+            await request(self.rest, AUTOMATION, ('member.kick', guild.id), lambda: member.kick(reason=reason))
+
+        async def kick_member(member):
+            return await self._each([member], kick_one)
+
+        return await self._run(guild, 'kick', members, kick_member, len(members), moderator_id, reason, progress)
+
+    async def _each(self, targets, act):
+        done, failed = [], []
+        for target in targets:
+            try:
+                await act(target)
+                done.append(target.id)
+            except discord.HTTPException:
+                failed.append(target.id)
+        return done, failed
+
+    async def _run(self, guild, action, units, act, total, moderator_id, reason, progress):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        done, failed = [], []
+
+        async def run(unit):
+            async with semaphore:
+                unit_done, unit_failed = await act(unit)
+            done.extend(unit_done)
+            failed.extend(unit_failed)
+            if progress is not None:
+                await progress(len(done), len(failed), total)
+
+        cases = []
+        try:
+            await asyncio.gather(*(run(unit) for unit in units))
+        finally:
+            if done:
+                cases = await self.moderation.add_cases([
+                    (guild.id, user_id, moderator_id, action, reason, None) for user_id in done
+                ])
+        return done, failed, cases
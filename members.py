@@ -0,0 +1,106 @@
+import asyncio
+from collections import OrderedDict
+
+import discord
+
+from dispatcher import UTILITY, request
+
+# Marks a member known not to be in the guild, so repeated lookups skip the API
+_ABSENT = object()
+
+
+# Member lookups for the 'lean' member-cache policy.
+# With lean caching discord.py keeps no guild member lists (no chunking at startup, only
+# members in voice channels), so this keeps an LRU of recently active members instead: message
+# authors, interaction users and member joins. Lookups try discord.py's cache, then the LRU, then
+# fetch the member from the API once (concurrent lookups share the fetch) and remember the
+# answer. discord.py drops member updates for members it has not cached, so LRU entries can
+# carry stale roles; anything that edits roles asks for a fresh member, which skips the LRU.
+# With max_entries=0 (the 'full' policy) it only wraps get_member/fetch_member.
+class MemberCache:
+    def __init__(self, max_entries=50000, rest=None):
+        self.max_entries = max_entries
+        self.rest = rest
+        self.hits = 0
+        self.misses = 0
+        self._members = OrderedDict()
+        self._fetching = {}
+
+    def __len__(self):
+        return len(self._members)
+
+    def touch(self, member):
+        if not self.max_entries or not isinstance(member, discord.Member):
+            return
+        self._store((member.guild.id, member.id), member)
+
+    def _store(self, key, value):
+        self._members[key] = value
+        self._members.move_to_end(key)
+        if len(self._members) > self.max_entries:
+            self._members.popitem(last=False)
+
+    def discard(self, guild_id, user_id):
+        self._members.pop((guild_id, user_id), None)
+
+    def discard_guild(self, guild_id):
+        for key in [key for key in self._members if key[0] == guild_id]:
+            del self._members[key]
+
+    def members(self, guild):
+        # Every known member of a guild: discord.py's cache plus the LRU
+        members = {member.id: member for member in guild.members}
+        for (guild_id, user_id), member in self._members.items():
+            if guild_id == guild.id and member is not _ABSENT:
+                members.setdefault(user_id, member)
+        return list(members.values())
+
+    def get(self, guild, user_id):
+        # Return a cached member, or None when unknown or known to be absent
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member
+        key = (guild.id, user_id)
+        member = self._members.get(key)
+        if member is None or member is _ABSENT:
+            return None
+        self._members.move_to_end(key)
+        return member
+
+    async def fetch(self, guild, user_id, priority=UTILITY, fresh=False):
+        # Return the member, fetching it from the API on a cache miss; None if not in the guild.
+        # With fresh=True an LRU entry is not trusted and the member is fetched again.
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member
+        key = (guild.id, user_id)
+        member = None if fresh else self._members.get(key)
+        if member is not None:
+            self.hits += 1
+            self._members.move_to_end(key)
+            return None if member is _ABSENT else member
+
+        self.misses += 1
+        future = self._fetching.get(key)
+        if future is None:
+            future = self._fetching[key] = asyncio.ensure_future(self._fetch(guild, user_id, priority))
+            future.add_done_callback(lambda _: self._fetching.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _fetch(self, guild, user_id, priority):
+        try:
+            member = await request(self.rest, priority, ('member.fetch', guild.id), lambda: guild.fetch_member(user_id))
+        except discord.NotFound:
+            member = None
+        if self.max_entries:
+            self._store((guild.id, user_id), _ABSENT if member is None else member)
+        return member
+
+    def metric_lines(self, namespace):
+        return [
+            f'# TYPE {namespace}_member_cache_entries gauge',
+            f'{namespace}_member_cache_entries {len(self._members)}',
+            f'# TYPE {namespace}_member_cache_lookups_total counter',
+            f'{namespace}_member_cache_lookups_total{{result="hit"}} {self.hits}',
+            f'{namespace}_member_cache_lookups_total{{result="fetch"}} {self.misses}',
+        ]
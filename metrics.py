@@ -0,0 +1,212 @@
+import asyncio
+import functools
+import logging
+import time
+import traceback
+from bisect import bisect_left
+
+# Upper bounds in seconds shared by every latency histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Estimate a quantile by interpolating inside the bucket that contains it
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                upper = self.bounds[index]
+                lower = self.bounds[index - 1] if index else 0.0
+                if upper == float('inf'):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.bounds[-2]
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds, self.counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            yield f'{name}_bucket{_labels(labels, le=le)} {cumulative}'
+        yield f'{name}_sum{_labels(labels)} {self.sum}'
+        yield f'{name}_count{_labels(labels)} {self.count}'
+
+
+def _labels(labels, **extra):
+    items = dict(labels, **extra)
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in items.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(items, escaped)) + '}'
+
+
+# Counts the rate-limit warnings discord.py logs when it receives a 429
+class _RateLimitHandler(logging.Handler):
+    def __init__(self, metrics):
+        super().__init__(logging.WARNING)
+        self.metrics = metrics
+
+    def emit(self, record):
+        message = record.getMessage().lower()
+        if 'rate limit' in message:
+            self.metrics.rate_limit('global' if 'global' in message else 'route')
+
+
+# Process metrics registry.
+# Keeps per-command and per-event latency histograms, error and rate-limit counters, event
+# loop lag and the process start time, and serves them in the Prometheus text format.
+class Metrics:
+    def __init__(self, namespace='botix'):
+        self.namespace = namespace
+        self.started_at = time.time()
+        self.commands = {}
+        self.command_errors = {}
+        self.events = {}
+        self.event_errors = {}
+        self.rate_limits = {}
+        self.loop_lag = Histogram()
+        self.last_loop_lag = 0.0
+        # Callables taking the namespace and returning extra exposition lines
+        self.collectors = []
+        self._tasks = []
+
+    def observe_command(self, name, seconds, error=False):
+        histogram = self.commands.get(name)
+        if histogram is None:
+            histogram = self.commands[name] = Histogram()
+        histogram.observe(seconds)
+        if error:
+            self.command_errors[name] = self.command_errors.get(name, 0) + 1
+
+    def observe_event(self, key, seconds, error=False):
+        # key is (event, handler)
+        histogram = self.events.get(key)
+        if histogram is None:
+            histogram = self.events[key] = Histogram()
+        histogram.observe(seconds)
+        if error:
+            self.event_errors[key] = self.event_errors.get(key, 0) + 1
+
+    def rate_limit(self, scope):
+        self.rate_limits[scope] = self.rate_limits.get(scope, 0) + 1
+
+    def timed_event(self, event):
+        # Decorator for event listeners that records their latency and errors
+        def decorator(func):
+            key = (event, func.__name__)
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                error = False
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    error = True
+                    raise
+                finally:
+                    self.observe_event(key, time.perf_counter() - started, error)
+            return wrapper
+        return decorator
+
+    def command_summary(self, name):
+        # Return (calls, p50, p99, error_rate) for a command, or None if it never ran
+        histogram = self.commands.get(name)
+        if histogram is None or not histogram.count:
+            return None
+        errors = self.command_errors.get(name, 0)
+        return histogram.count, histogram.quantile(0.5), histogram.quantile(0.99), errors / histogram.count
+
+    def uptime(self):
+        return time.time() - self.started_at
+
+    def start(self, host='127.0.0.1', port=None, lag_interval=0.5, rate_limit_logger='discord.http'):
+        if self._tasks:
+            return
+        logging.getLogger(rate_limit_logger).addHandler(_RateLimitHandler(self))
+        self._tasks.append(asyncio.create_task(self._sample_loop_lag(lag_interval)))
+        if port:
+            self._tasks.append(asyncio.create_task(self._serve(host, port)))
+
+    async def _sample_loop_lag(self, interval):
+        # Anything that blocks the loop shows up as oversleeping this timer
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.last_loop_lag = max(loop.time() - expected, 0.0)
+            self.loop_lag.observe(self.last_loop_lag)
+
+    async def _serve(self, host, port):
+        try:
+            server = await asyncio.start_server(self._handle, host, port)
+        except OSError:
+            traceback.print_exc()
+            return
+        print(f'Serving metrics on http://{host}:{port}/metrics')
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=5)
+            path = request.split(b' ', 2)[1] if request.count(b' ') >= 2 else b''
+            if path.split(b'?')[0] == b'/metrics':
+                status, body = '200 OK', self.render().encode()
+            else:
+                status, body = '404 Not Found', b'Not found\n'
+            writer.write(
+                f'HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def render(self):
+        ns = self.namespace
+        lines = [
+            f'# TYPE {ns}_process_start_time_seconds gauge',
+            f'{ns}_process_start_time_seconds {self.started_at}',
+            f'# TYPE {ns}_command_latency_seconds histogram',
+        ]
+        for name, histogram in sorted(self.commands.items()):
+            lines.extend(histogram.lines(f'{ns}_command_latency_seconds', {'command': name}))
+        lines.append(f'# TYPE {ns}_command_errors_total counter')
+        for name, count in sorted(self.command_errors.items()):
+            lines.append(f'{ns}_command_errors_total{_labels({"command": name})} {count}')
+        lines.append(f'# TYPE {ns}_event_latency_seconds histogram')
+        for (event, handler), histogram in sorted(self.events.items()):
+            lines.extend(histogram.lines(f'{ns}_event_latency_seconds', {'event': event, 'handler': handler}))
+        lines.append(f'# TYPE {ns}_event_errors_total counter')
+        for (event, handler), count in sorted(self.event_errors.items()):
+            lines.append(f'{ns}_event_errors_total{_labels({"event": event, "handler": handler})} {count}')
+        lines.append(f'# TYPE {ns}_rate_limits_total counter')
+        for scope, count in sorted(self.rate_limits.items()):
+            lines.append(f'{ns}_rate_limits_total{_labels({"scope": scope})} {count}')
+        lines.append(f'# TYPE {ns}_event_loop_lag_seconds histogram')
+        lines.extend(self.loop_lag.lines(f'{ns}_event_loop_lag_seconds', {}))
+        lines.append(f'# TYPE {ns}_event_loop_lag_last_seconds gauge')
+        lines.append(f'{ns}_event_loop_lag_last_seconds {self.last_loop_lag}')
+        for collector in self.collectors:
+            lines.extend(collector(ns))
+        return '\n'.join(lines) + '\n'
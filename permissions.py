@@ -0,0 +1,89 @@
+import discord
+
+# Permissions granted by the bot's own mod role setting (addmod)
+MOD_PERMISSIONS = discord.Permissions(
+    kick_members=True,
+    ban_members=True,
+    manage_messages=True,
+    manage_roles=True,
+    manage_nicknames=True,
+    manage_channels=True,
+    moderate_members=True,
+    view_audit_log=True,
+)
+
+
+# Memoized permission resolver.
+# Effective channel permissions are computed once per (channel, member role set) and reused by
+# every member sharing that role set; members with their own channel overwrite, the owner and
+# timed-out members get their own entries. Entries are dropped when roles, channel overwrites or
+# the guild change. Mod/admin grants from the bot's settings are applied on top of the cached
+# value, so changing them needs no invalidation.
+class PermissionResolver:
+    def __init__(self, settings, max_entries_per_channel=1024):
+        self.settings = settings
+        self.max_entries_per_channel = max_entries_per_channel
+        self._cache = {}
+        self._member_overwrites = {}
+        self._masks = {}
+
+    def _mask(self, required):
+        required = tuple(required)
+        mask = self._masks.get(required)
+        if mask is None:
+            mask = self._masks[required] = discord.Permissions(**{name: True for name in required}).value
+        return mask
+
+    def _overwritten_members(self, channel):
+        members = self._member_overwrites.get(channel.id)
+        if members is None:
+            members = frozenset(target.id for target in channel.overwrites if not isinstance(target, discord.Role))
+            self._member_overwrites[channel.id] = members
+        return members
+
+    def resolve(self, member, channel):
+        # Return the member's effective permission value in channel, including bot grants
+        if isinstance(channel, discord.Thread):
+            channel = channel.parent
+        guild = member.guild
+        special = member.id if (
+            member.id == guild.owner_id
+            or member.id in self._overwritten_members(channel)
+            or member.is_timed_out()
+        ) else 0
+        key = (tuple(role.id for role in member.roles), special)
+
+        channels = self._cache.setdefault(guild.id, {})
+        entries = channels.get(channel.id)
+        if entries is None:
+            entries = channels[channel.id] = {}
+        value = entries.get(key)
+        if value is None:
+            if len(entries) >= self.max_entries_per_channel:
+                entries.clear()
+            value = entries[key] = channel.permissions_for(member).value
+
+        return value | self._grants(member)
+
+    def _grants(self, member):
+        guild_settings = self.settings.guild(member.guild.id)
+        if member.id in guild_settings.admin_users or any(member.get_role(role_id) for role_id in guild_settings.admin_roles):
+            return discord.Permissions.all().value
+        if any(member.get_role(role_id) for role_id in guild_settings.mod_roles):
+            return MOD_PERMISSIONS.value
+        return 0
+
+    def has(self, member, channel, required):
+        if not isinstance(member, discord.Member) or channel is None:
+            return False
+        mask = self._mask(required)
+        return self.resolve(member, channel) & mask == mask
+
+    def invalidate_guild(self, guild_id):
+        channels = self._cache.pop(guild_id, {})
+        for channel_id in channels:
+            self._member_overwrites.pop(channel_id, None)
+
+    def invalidate_channel(self, guild_id, channel_id):
+        self._cache.get(guild_id, {}).pop(channel_id, None)
+        self._member_overwrites.pop(channel_id, None)
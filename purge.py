@@ -0,0 +1,98 @@
+import asyncio
+import datetime
+
+import discord
+
+from dispatcher import AUTOMATION, request
+
+# Bulk delete only accepts messages younger than 14 days; keep a margin for clock skew
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14) - datetime.timedelta(minutes=5)
+BULK_DELETE_SIZE = 100
+
+
+# Build a message predicate from the purge filters; every filter given must match
+def build_filter(author_id=None, bots_only=False, contains=None, attachments=False, skip_pinned=True):
+    contains = contains.lower() if contains else None
+
+    def check(message):
+        if skip_pinned and message.pinned:
+            return False
+        if author_id is not None and message.author.id != author_id:
+            return False
+        if bots_only and not message.author.bot:
+            return False
+        if contains is not None and contains not in message.content.lower():
+            return False
+        if attachments and not message.attachments:
+            return False
+        return True
+
+    return check
+
+
+# Streaming deletion pipeline.
+# A producer walks the channel history and groups matching messages into batches of up to 100
+# for bulk delete, or single deletes for messages past the bulk-delete window, while a consumer
+# deletes the previous batch; the bounded queue keeps memory flat however many messages match.
+async def purge_messages(channel, limit, check, before=None, after=None, scan_limit=None,
+                         progress=None, single_delete_delay=1.0, rest=None, priority=AUTOMATION):
+    queue = asyncio.Queue(maxsize=2)
+    stats = {'scanned': 0, 'deleted': 0}
+    cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+
+    async def produce():
+        batch = []
+        matched = 0
+        try:
+            async for message in channel.history(limit=scan_limit, before=before, after=after):
+                if matched >= limit:
+                    break
+                stats['scanned'] += 1
+                if not check(message):
+                    continue
+                matched += 1
+                if message.created_at < cutoff:
+                    await queue.put([message])
+                else:
+                    batch.append(message)
+                    if len(batch) == BULK_DELETE_SIZE:
+                        await queue.put(batch)
+                        batch = []
+            if batch:
+                await queue.put(batch)
+        except asyncio.CancelledError:
+            # Only cancelled once the consumer has stopped, so nobody is waiting for the end marker
+            raise
+        except Exception:
+            await queue.put(None)
+            raise
+        await queue.put(None)
+
+    async def consume():
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                return
+            try:
+                if len(batch) == 1 and batch[0].created_at < cutoff:
+                    await request(rest, priority, ('message.delete', channel.id), batch[0].delete)
+                    # The dispatcher paces single deletes itself
+                    if rest is None:
+                        await asyncio.sleep(single_delete_delay)
+                else:
+                    await request(rest, priority, ('message.bulk_delete', channel.id),
+                                  lambda: channel.delete_messages(batch))
+                stats['deleted'] += len(batch)
+            except discord.NotFound:
+                pass
+            if progress is not None:
+                await progress(stats['deleted'], stats['scanned'])
+
+    producer = asyncio.create_task(produce())
+    try:
+        await consume()
+    finally:
+        if not producer.done():
+            producer.cancel()
+    await producer
+    return stats['deleted'], stats['scanned']
@@ -0,0 +1,148 @@
+import time
+from collections import deque
+
+# Account-age histogram bucket upper bounds in seconds, with a label for each
+AGE_BUCKETS = (3600, 86400, 7 * 86400, 30 * 86400, 365 * 86400, float('inf'))
+AGE_LABELS = ('<1h', '<1d', '<7d', '<30d', '<1y', 'older')
+# The join window is split into this many ring slots
+SLOTS = 30
+
+
+def _age_bucket(age):
+    for index, bound in enumerate(AGE_BUCKETS):
+        if age < bound:
+            return index
+    return len(AGE_BUCKETS) - 1
+
+
+class _GuildJoins:
+    __slots__ = ('window', 'slot_width', 'head', 'joins', 'young', 'ages', 'total_joins', 'total_young',
+                 'total_ages', 'recent', 'review', 'raid_until', 'triggered_at')
+
+    def __init__(self, window, review_size):
+        self.window = window
+        self.slot_width = window / SLOTS
+        self.head = 0
+        self.joins = [0] * SLOTS
+        self.young = [0] * SLOTS
+        self.ages = [[0] * len(AGE_BUCKETS) for _ in range(SLOTS)]
+        self.total_joins = 0
+        self.total_young = 0
+        self.total_ages = [0] * len(AGE_BUCKETS)
+        # Recent young joins, moved into review when a raid starts
+        self.recent = deque(maxlen=review_size)
+        self.review = deque(maxlen=review_size)
+        self.raid_until = 0.0
+        self.triggered_at = None
+
+    def advance(self, now):
+        # Clear the slots that fell out of the window since the last join; at most SLOTS of them
+        slot = int(now / self.slot_width)
+        if slot - self.head >= SLOTS:
+            for index in range(SLOTS):
+                self._clear(index)
+        else:
+            for passed in range(self.head + 1, slot + 1):
+                self._clear(passed % SLOTS)
+        self.head = max(self.head, slot)
+
+    def _clear(self, index):
+        self.total_joins -= self.joins[index]
+        self.total_young -= self.young[index]
+        self.joins[index] = self.young[index] = 0
+        ages = self.ages[index]
+        for bucket, count in enumerate(ages):
+            self.total_ages[bucket] -= count
+            ages[bucket] = 0
+
+
+# Per-guild join-burst detector.
+# Joins are counted in a ring of SLOTS time slots spanning the guild's window, with running
+# totals and an account-age histogram per slot, so each join costs a constant amount of work and
+# each guild a fixed amount of memory whatever its size. A raid starts when the number of young
+# accounts joining within the window reaches the threshold; it then stays active for the
+# cooldown, and every young account seen meanwhile is queued (boundedly) for review.
+class RaidDetector:
+    def __init__(self, cooldown=600.0, review_size=500):
+        self.cooldown = cooldown
+        self.review_size = review_size
+        self._guilds = {}
+
+    def _state(self, guild_id, window):
+        # The window is split into slots, so it has to be positive whatever the settings file says
+        window = max(window, 1)
+        state = self._guilds.get(guild_id)
+        if state is None or state.window != window:
+            previous = state
+            state = self._guilds[guild_id] = _GuildJoins(window, self.review_size)
+            if previous is not None:
+                state.review.extend(previous.review)
+                state.raid_until = previous.raid_until
+                state.triggered_at = previous.triggered_at
+        return state
+
+    def record(self, guild_id, member_id, account_age, threshold, window=10, young_age=7 * 86400, now=None):
+        # Count a join; returns True when it starts a raid
+        now = time.time() if now is None else now
+        state = self._state(guild_id, window)
+        state.advance(now)
+        index = state.head % SLOTS
+        bucket = _age_bucket(account_age)
+        state.joins[index] += 1
+        state.ages[index][bucket] += 1
+        state.total_joins += 1
+        state.total_ages[bucket] += 1
+        if account_age >= young_age:
+            return False
+
+        state.young[index] += 1
+        state.total_young += 1
+        entry = (member_id, account_age, now)
+        if now < state.raid_until:
+            state.review.append(entry)
+            return False
+        state.recent.append(entry)
+        if state.total_young < threshold:
+            return False
+        state.raid_until = now + self.cooldown
+        state.triggered_at = now
+        state.review.extend(item for item in state.recent if now - item[2] <= window)
+        state.recent.clear()
+        return True
+
+    def active(self, guild_id, now=None):
+        state = self._guilds.get(guild_id)
+        return state is not None and (time.time() if now is None else now) < state.raid_until
+
+    def end(self, guild_id):
+        state = self._guilds.get(guild_id)
+        if state is not None:
+            state.raid_until = 0.0
+
+    def status(self, guild_id, now=None):
+        # (joins, young joins, {age label: joins}) within the current window, or None if untracked
+        state = self._guilds.get(guild_id)
+        if state is None:
+            return None
+        state.advance(time.time() if now is None else now)
+        return state.total_joins, state.total_young, dict(zip(AGE_LABELS, state.total_ages))
+
+    def review(self, guild_id):
+        # Queued (member_id, account_age, joined_at) entries, oldest first
+        state = self._guilds.get(guild_id)
+        return list(state.review) if state is not None else []
+
+    def dismiss(self, guild_id, member_ids=None):
+        # Drop the given members from the review queue, or all of it; returns how many were dropped
+        state = self._guilds.get(guild_id)
+        if state is None:
+            return 0
+        before = len(state.review)
+        if member_ids is None:
+            state.review.clear()
+        else:
+            state.review = deque((entry for entry in state.review if entry[0] not in member_ids), maxlen=self.review_size)
+        return before - len(state.review)
+
+    def forget(self, guild_id):
+        self._guilds.pop(guild_id, None)
@@ -0,0 +1,192 @@
+from bisect import bisect_left
+from collections import OrderedDict
+
+import discord
+
+MESSAGE_LIMIT = 2000
+_ALL = object()
+
+
+# Cache for read-mostly command responses.
+# Entries are keyed (guild_id, kind, key) and built on first use; listeners for the gateway
+# events that change what a response shows drop the affected entries, so repeated calls
+# (and page turns) are served from memory. The total number of entries is LRU-bounded.
+class ResponseCache:
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._keys = {}
+
+    def get(self, guild_id, kind, key, build):
+        # Return the cached value for (guild_id, kind, key), calling build() to create it if missing
+        cache_key = (guild_id, kind, key)
+        value = self._entries.get(cache_key)
+        if value is not None:
+            self._entries.move_to_end(cache_key)
+            return value
+        value = self._entries[cache_key] = build()
+        self._keys.setdefault((guild_id, kind), set()).add(key)
+        while len(self._entries) > self.max_entries:
+            (old_guild, old_kind, old_key), _ = self._entries.popitem(last=False)
+            self._discard_key(old_guild, old_kind, old_key)
+        return value
+
+    def _discard_key(self, guild_id, kind, key):
+        keys = self._keys.get((guild_id, kind))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys[(guild_id, kind)]
+
+    def invalidate(self, guild_id, kind, key=_ALL):
+        # Drop one entry, or every entry of that kind for the guild when no key is given
+        if key is not _ALL:
+            self._entries.pop((guild_id, kind, key), None)
+            self._discard_key(guild_id, kind, key)
+            return
+        for key in self._keys.pop((guild_id, kind), ()):
+            self._entries.pop((guild_id, kind, key), None)
+
+    def invalidate_guild(self, guild_id):
+        for guild_key in [guild_key for guild_key in self._keys if guild_key[0] == guild_id]:
+            self.invalidate(*guild_key)
+
+
+# Lowercased emoji names in sorted order, built once per emoji set.
+# Prefix matches come from a binary search; substring matches from one scan of a joined name blob.
+class EmojiIndex:
+    def __init__(self, emojis):
+        entries = sorted((emoji.name.lower(), str(emoji)) for emoji in emojis)
+        self.names = [name for name, _ in entries]
+        self.rendered = [rendered for _, rendered in entries]
+        self._blob = '\n'.join(self.names)
+        self._starts = []
+        offset = 0
+        for name in self.names:
+            self._starts.append(offset)
+            offset += len(name) + 1
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, query=None):
+        # Rendered emojis matching query: name prefix matches first, then other substring matches
+        if not query:
+            return list(self.rendered)
+        query = query.lower()
+        start = bisect_left(self.names, query)
+        end = start
+        while end < len(self.names) and self.names[end].startswith(query):
+            end += 1
+        results = self.rendered[start:end]
+
+        seen = set(range(start, end))
+        position = self._blob.find(query)
+        while position != -1:
+            index = bisect_left(self._starts, position + 1) - 1
+            if index not in seen:
+                seen.add(index)
+                results.append(self.rendered[index])
+            # Skip to the next name; one hit per name is enough
+            next_start = self._starts[index + 1] if index + 1 < len(self._starts) else len(self._blob)
+            position = self._blob.find(query, next_start)
+        return results
+
+
+# Split items into message-sized pages of space-separated text
+def paginate_text(items, header='', limit=MESSAGE_LIMIT):
+    pages, current = [], []
+    size = 0
+    budget = limit - len(header) - 32
+    for item in items:
+        if current and size + len(item) + 1 > budget:
+            pages.append(' '.join(current))
+            current, size = [], 0
+        current.append(item)
+        size += len(item) + 1
+    if current:
+        pages.append(' '.join(current))
+    total = len(pages)
+    return [f'{header} (page {number}/{total})\n{page}' if total > 1 else f'{header}\n{page}'
+            for number, page in enumerate(pages, 1)]
+
+
+def serverinfo_embed(guild):
+    embed = discord.Embed(title=f"Server Info: {guild.name}", description=f"ID: {guild.id}")
+    if guild.icon:
+        embed.set_thumbnail(url=guild.icon.url)
+    embed.add_field(name="Owner", value=f"<@{guild.owner_id}>")
+    embed.add_field(name="Created", value=discord.utils.format_dt(guild.created_at, 'D'))
+    embed.add_field(name="Total Members", value=guild.member_count)
+    embed.add_field(name="Channels", value=f"{len(guild.text_channels)} text, {len(guild.voice_channels)} voice")
+    embed.add_field(name="Roles", value=len(guild.roles))
+    embed.add_field(name="Emojis", value=f"{len(guild.emojis)}/{guild.emoji_limit}")
+    embed.add_field(name="Boosts", value=f"Level {guild.premium_tier} ({guild.premium_subscription_count or 0} boosts)")
+    embed.add_field(name="Locale", value=str(guild.preferred_locale))
+    return embed
+
+
+def whois_embed(member):
+    embed = discord.Embed(title=f"User Info: {member.name}", description=f"ID: {member.id}", color=member.color)
+    embed.set_thumbnail(url=member.display_avatar.url)
+    embed.add_field(name="Display Name", value=member.display_name)
+    embed.add_field(name="Account Created", value=discord.utils.format_dt(member.created_at, 'R'))
+    if member.joined_at:
+        embed.add_field(name="Joined Server", value=discord.utils.format_dt(member.joined_at, 'R'))
+    roles = [role.mention for role in reversed(member.roles) if not role.is_default()]
+    value = ' '.join(roles) or 'None'
+    if len(value) > 1024:
+        value = value[:value.rfind(' ', 0, 1000)] + ' ...'
+    embed.add_field(name=f"Roles ({len(roles)})", value=value, inline=False)
+    if member.bot:
+        embed.set_footer(text="Bot account")
+    return embed
+
+
+# Previous/next buttons over a list of text pages.
+# get_pages() is called on every page turn, so pages come from the response cache and pick up
+# any rebuild after an invalidation. Only the user who ran the command can turn pages.
+class PageView(discord.ui.View):
+    def __init__(self, author_id, get_pages, timeout=180):
+        super().__init__(timeout=timeout)
+        self.author_id = author_id
+        self.get_pages = get_pages
+        self.page = 0
+        self.message = None
+        self._update_buttons(len(get_pages()))
+
+    def _update_buttons(self, total):
+        self.previous_page.disabled = self.page <= 0
+        self.next_page.disabled = self.page >= total - 1
+        self.position.label = f'{self.page + 1}/{total}'
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("Only the user who ran the command can change pages.", ephemeral=True)
+            return False
+        return True
+
+    async def _show(self, interaction, page):
+        pages = self.get_pages()
+        self.page = max(0, min(page, len(pages) - 1))
+        self._update_buttons(len(pages))
+        await interaction.response.edit_message(content=pages[self.page], view=self)
+
+    @discord.ui.button(label='\N{BLACK LEFT-POINTING TRIANGLE}', style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction, button):
+        await self._show(interaction, self.page - 1)
+
+    @discord.ui.button(label='1/1', style=discord.ButtonStyle.secondary, disabled=True)
+    async def position(self, interaction, button):
+        pass
+
+    @discord.ui.button(label='\N{BLACK RIGHT-POINTING TRIANGLE}', style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction, button):
+        await self._show(interaction, self.page + 1)
+
+    async def on_timeout(self):
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
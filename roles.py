@@ -0,0 +1,312 @@
+import asyncio
+import re
+import time
+import traceback
+from dataclasses import dataclass
+
+import discord
+
+from dispatcher import AUTOMATION, MODERATION, request
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS role_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER,
+    created_by INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    role_id INTEGER NOT NULL,
+    has_role_id INTEGER,
+    joined_after REAL,
+    last_member_id INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    changed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_role_jobs_status ON role_jobs (status);
+CREATE TABLE IF NOT EXISTS role_persist (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    role_id INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, user_id, role_id)
+);
+'''
+
+_ROLE_TOKEN_RE = re.compile(r'<@&(\d+)>|(\d{15,21})')
+
+
+# Parse a comma separated list of role mentions, IDs or names into (roles, unknown tokens)
+def parse_roles(guild, text):
+    roles, unknown = [], []
+    for token in (part.strip() for part in text.split(',')):
+        if not token:
+            continue
+        match = _ROLE_TOKEN_RE.fullmatch(token)
+        if match:
+            role = guild.get_role(int(match.group(1) or match.group(2)))
+        else:
+            role = discord.utils.find(lambda r: r.name.lower() == token.lower(), guild.roles)
+        if role is None or role.is_default():
+            unknown.append(token)
+        elif role not in roles:
+            roles.append(role)
+    return roles, unknown
+
+
+# Apply role additions/removals as a set diff in a single member edit.
+# Returns the (added, removed) roles that actually changed; no request is made if nothing changes.
+async def apply_role_diff(member, add=(), remove=(), reason=None):
+    current = {role for role in member.roles if not role.is_default()}
+    added = [role for role in add if role not in current]
+    removed = [role for role in remove if role in current and role not in add]
+    if not added and not removed:
+        return [], []
+    roles = (current | set(added)) - set(removed)
+    await member.edit(roles=sorted(roles), reason=reason)
+    return added, removed
+
+
+# Role edits routed through the REST dispatcher.
+# Diffs for a member whose edit has not started yet merge into it, so a burst of role changes
+# for one member (mute, temprole, massrole...) becomes a single member edit.
+class RoleEditQueue:
+    def __init__(self, rest=None):
+        self.rest = rest
+        self._pending = {}
+
+    async def edit(self, member, add=(), remove=(), reason=None, priority=MODERATION):
+        key = ('member.roles', member.guild.id, member.id)
+        state = self._pending.get(key)
+        if state is None:
+            state = self._pending[key] = {'add': {}, 'remove': {}, 'reasons': []}
+        for role in add:
+            state['remove'].pop(role.id, None)
+            state['add'][role.id] = role
+        for role in remove:
+            state['add'].pop(role.id, None)
+            state['remove'][role.id] = role
+        if reason and reason not in state['reasons']:
+            state['reasons'].append(reason)
+
+        def factory():
+            self._pending.pop(key, None)
+            return apply_role_diff(member, list(state['add'].values()), list(state['remove'].values()),
+                                   reason='; '.join(state['reasons'])[:512] or None)
+        return await request(self.rest, priority, ('member.edit', member.guild.id), factory, key=key)
+
+
+# Roles that are given back when a member leaves and rejoins.
+# Every persisted (guild_id, user_id) -> role IDs entry is held in memory, so the join path
+# answers from a dict lookup and the common case of a member with nothing persisted never
+# touches storage. Writes go to the role_persist table before the in-memory index changes.
+class RolePersistence:
+    def __init__(self, db):
+        self.db = db
+        self._roles = {}
+
+    async def start(self):
+        await self.db.executescript(SCHEMA)
+        rows = await self.db.fetchall('SELECT guild_id, user_id, role_id FROM role_persist')
+        self._roles = {}
+        for row in rows:
+            self._roles.setdefault((row['guild_id'], row['user_id']), set()).add(row['role_id'])
+
+    def __len__(self):
+        return len(self._roles)
+
+    def roles_for(self, guild_id, user_id):
+        return self._roles.get((guild_id, user_id), ())
+
+    def is_persisted(self, guild_id, user_id, role_id):
+        return role_id in self.roles_for(guild_id, user_id)
+
+    async def add(self, guild_id, user_id, role_id):
+        await self.db.execute('INSERT OR IGNORE INTO role_persist (guild_id, user_id, role_id) VALUES (?, ?, ?)',
+                              (guild_id, user_id, role_id))
+        self._roles.setdefault((guild_id, user_id), set()).add(role_id)
+
+    async def remove(self, guild_id, user_id, role_id):
+        await self.db.execute('DELETE FROM role_persist WHERE guild_id = ? AND user_id = ? AND role_id = ?',
+                              (guild_id, user_id, role_id))
+        roles = self._roles.get((guild_id, user_id))
+        if roles is not None:
+            roles.discard(role_id)
+            if not roles:
+                del self._roles[(guild_id, user_id)]
+
+    async def remove_role(self, guild_id, role_id):
+        # Forget a deleted role for every member of the guild
+        await self.db.execute('DELETE FROM role_persist WHERE guild_id = ? AND role_id = ?', (guild_id, role_id))
+        for key in [key for key, roles in self._roles.items() if key[0] == guild_id and role_id in roles]:
+            self._roles[key].discard(role_id)
+            if not self._roles[key]:
+                del self._roles[key]
+
+    def restorable(self, member):
+        # Persisted roles the member is missing and the bot can still assign
+        role_ids = self.roles_for(member.guild.id, member.id)
+        if not role_ids:
+            return []
+        guild = member.guild
+        top_role = guild.me.top_role if guild.me is not None else None
+        roles = []
+        for role in map(guild.get_role, role_ids):
+            if role is None or role.managed or role in member.roles:
+                continue
+            if top_role is not None and role >= top_role:
+                continue
+            roles.append(role)
+        return roles
+
+
+@dataclass
+class RoleJob:
+    id: int
+    guild_id: int
+    channel_id: int
+    created_by: int
+    action: str
+    role_id: int
+    has_role_id: int = None
+    joined_after: float = None
+    last_member_id: int = 0
+    processed: int = 0
+    changed: int = 0
+    failed: int = 0
+    status: str = 'running'
+
+    def describe(self):
+        text = f"{self.action} <@&{self.role_id}>"
+        if self.has_role_id:
+            text += f" for members with <@&{self.has_role_id}>"
+        if self.joined_after:
+            text += f" who joined after <t:{int(self.joined_after)}:f>"
+        return text
+
+    def matches(self, member):
+        if self.has_role_id and member.get_role(self.has_role_id) is None:
+            return False
+        if self.joined_after and (member.joined_at is None or member.joined_at.timestamp() < self.joined_after):
+            return False
+        has_role = member.get_role(self.role_id) is not None
+        return not has_role if self.action == 'add' else has_role
+
+
+# Mass role assignment jobs.
+# Members are streamed from the API in ID order, in chunks, with a bounded number of role
+# requests in flight. After each chunk the last member ID is checkpointed to role_jobs, so a
+# job interrupted by a restart resumes where it left off.
+class MassRoleJobs:
+    def __init__(self, db, concurrency=5, chunk_size=1000, role_edits=None):
+        self.db = db
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.role_edits = role_edits or RoleEditQueue()
+        self._jobs = {}
+        self._tasks = {}
+
+    async def start(self, bot):
+        await self.db.executescript(SCHEMA)
+        rows = await self.db.fetchall("SELECT * FROM role_jobs WHERE status = 'running'")
+        for row in rows:
+            guild = bot.get_guild(row['guild_id'])
+            if guild is not None and row['guild_id'] not in self._tasks:
+                job = RoleJob(**{key: row[key] for key in RoleJob.__dataclass_fields__})
+                self._spawn(guild, job)
+
+    def running(self, guild_id):
+        return self._jobs.get(guild_id)
+
+    async def create(self, guild, channel_id, created_by, action, role, has_role=None, joined_after=None):
+        job_id, _ = await self.db.execute(
+            'INSERT INTO role_jobs (guild_id, channel_id, created_by, action, role_id, has_role_id, joined_after, status, created_at) '
+            "VALUES (?, ?, ?, ?, ?, ?, ?, 'running', ?)",
+            (guild.id, channel_id, created_by, action, role.id, has_role.id if has_role else None, joined_after, time.time()),
+        )
+        job = RoleJob(job_id, guild.id, channel_id, created_by, action, role.id,
+                      has_role.id if has_role else None, joined_after)
+        self._spawn(guild, job)
+        return job
+
+    async def cancel(self, guild_id):
+        task = self._tasks.get(guild_id)
+        if task is None:
+            return None
+        job = self._jobs[guild_id]
+        task.cancel()
+        job.status = 'cancelled'
+        await self._checkpoint(job)
+        return job
+
+    def _spawn(self, guild, job):
+        self._jobs[guild.id] = job
+        task = asyncio.create_task(self._run(guild, job))
+        self._tasks[guild.id] = task
+        task.add_done_callback(lambda _: (self._tasks.pop(guild.id, None), self._jobs.pop(guild.id, None)))
+
+    async def _checkpoint(self, job):
+        await self.db.execute(
+            'UPDATE role_jobs SET last_member_id = ?, processed = ?, changed = ?, failed = ?, status = ? WHERE id = ?',
+            (job.last_member_id, job.processed, job.changed, job.failed, job.status, job.id),
+        )
+
+    async def _run(self, guild, job):
+        role = guild.get_role(job.role_id)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        reason = f"Mass role job #{job.id}"
+
+        async def mutate(member):
+            async with semaphore:
+                try:
+                    if job.action == 'add':
+                        await self.role_edits.edit(member, add=[role], reason=reason, priority=AUTOMATION)
+                    else:
+                        await self.role_edits.edit(member, remove=[role], reason=reason, priority=AUTOMATION)
+                    job.changed += 1
+                except discord.HTTPException:
+                    job.failed += 1
+
+        try:
+            if role is None:
+                job.status = 'failed'
+                return
+            chunk = []
+            async for member in guild.fetch_members(limit=None, after=discord.Object(id=job.last_member_id)):
+                chunk.append(member)
+                if len(chunk) >= self.chunk_size:
+                    await self._process_chunk(job, chunk, mutate)
+                    chunk = []
+            if chunk:
+                await self._process_chunk(job, chunk, mutate)
+            job.status = 'done'
+        except asyncio.CancelledError:
+            job.status = 'cancelled'
+            raise
+        except Exception:
+            traceback.print_exc()
+            job.status = 'failed'
+        finally:
+            await self._checkpoint(job)
+            if job.status != 'cancelled':
+                await self._announce(guild, job)
+
+    async def _process_chunk(self, job, chunk, mutate):
+        await asyncio.gather(*(mutate(member) for member in chunk if job.matches(member)))
+        job.processed += len(chunk)
+        job.last_member_id = chunk[-1].id
+        await self._checkpoint(job)
+
+    async def _announce(self, guild, job):
+        channel = guild.get_channel(job.channel_id) if job.channel_id else None
+        if channel is None:
+            return
+        try:
+            await request(self.role_edits.rest, AUTOMATION, ('channel.send', channel.id), lambda: channel.send(
+                f"<@{job.created_by}> Mass role job #{job.id} ({job.describe()}) {job.status}: "
+                f"{job.changed} members changed, {job.failed} failed, {job.processed} checked.",
+                allowed_mentions=discord.AllowedMentions(users=True, roles=False),
+            ))
+        except discord.HTTPException:
+            pass
@@ -0,0 +1,236 @@
+import asyncio
+import heapq
+import json
+import re
+import time
+import traceback
+from dataclasses import dataclass, field
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS timers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT UNIQUE,
+    created REAL NOT NULL,
+    due REAL NOT NULL,
+    payload TEXT NOT NULL
+);
+'''
+
+_DURATION_RE = re.compile(r'(\d+)\s*([smhdw]?)')
+_DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+# Parse "90", "10m", "1h30m" or "2d" into seconds
+def parse_duration(text):
+    text = text.strip().lower().replace(' ', '')
+    if not text or _DURATION_RE.sub('', text):
+        raise ValueError(f"Invalid duration: {text!r}")
+    seconds = sum(int(amount) * _DURATION_UNITS[unit] for amount, unit in _DURATION_RE.findall(text))
+    if seconds <= 0:
+        raise ValueError(f"Invalid duration: {text!r}")
+    return seconds
+
+
+@dataclass
+class Timer:
+    id: int
+    kind: str
+    created: float
+    due: float
+    payload: dict = field(default_factory=dict)
+    key: str = None
+    attempts: int = 0
+
+
+# Durable timer scheduler.
+# Pending timers live in a min-heap keyed on due time and are mirrored to the timers table,
+# so a single wakeup loop serves every temprole, reminder and timed ban/mute and nothing is
+# lost on restart. Timers that expire within batch_window of each other fire together and are
+# handed to their kind's handler as one list. A handler returns the timers it could not fire
+# (or raises, failing its whole batch); those are retried with exponential backoff up to
+# max_attempts times. When several processes share the timers table, owns(timer) limits each
+# process to the timers it is responsible for.
+class Scheduler:
+    def __init__(self, db, batch_window=1.0, owns=None, retry_delay=30.0, max_retry_delay=3600.0, max_attempts=8):
+        self.db = db
+        self.batch_window = batch_window
+        self.owns = owns
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        self._heap = []
+        self._timers = {}
+        self._keys = {}
+        self._handlers = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def handler(self, kind):
+        # Register the coroutine that fires a batch of timers of this kind and returns any that failed
+        def decorator(func):
+            self._handlers[kind] = func
+            return func
+        return decorator
+
+    async def setup(self):
+        # Create the timers table so timers can be scheduled before the wakeup loop starts
+        await self.db.executescript(SCHEMA)
+
+    async def start(self):
+        if self.running:
+            return
+        await self.setup()
+        rows = await self.db.fetchall('SELECT id, kind, key, created, due, payload FROM timers')
+        for row in rows:
+            timer = Timer(row['id'], row['kind'], row['created'], row['due'], json.loads(row['payload']), row['key'])
+            if self.owns is not None and not self.owns(timer):
+                continue
+            self._timers[timer.id] = timer
+            if timer.key is not None:
+                self._keys[timer.key] = timer.id
+        self._heap = [(timer.due, timer.id) for timer in self._timers.values()]
+        heapq.heapify(self._heap)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get(self, timer_id):
+        return self._timers.get(timer_id)
+
+    def get_by_key(self, key):
+        timer_id = self._keys.get(key)
+        return self._timers.get(timer_id) if timer_id is not None else None
+
+    def pending(self, kind=None):
+        return [timer for timer in self._timers.values() if kind is None or timer.kind == kind]
+
+    async def schedule(self, kind, delay, payload=None, key=None):
+        # Schedule a timer delay seconds from now; an existing timer with the same key is replaced
+        payload = payload or {}
+        created = time.time()
+        due = created + delay
+        if key is not None and key in self._keys:
+            await self.cancel(self._keys[key])
+        timer_id, _ = await self.db.execute(
+            'INSERT INTO timers (kind, key, created, due, payload) VALUES (?, ?, ?, ?, ?)',
+            (kind, key, created, due, json.dumps(payload)),
+        )
+        timer = Timer(timer_id, kind, created, due, payload, key)
+        self._timers[timer_id] = timer
+        if key is not None:
+            self._keys[key] = timer_id
+        self._push(timer)
+        return timer
+
+    async def reschedule(self, timer_id, due):
+        timer = self._timers.get(timer_id)
+        if timer is None:
+            return None
+        await self.db.execute('UPDATE timers SET due = ? WHERE id = ?', (due, timer_id))
+        timer.due = due
+        self._push(timer)
+        return timer
+
+    async def cancel(self, timer_id):
+        timer = self._timers.pop(timer_id, None)
+        if timer is None:
+            return None
+        if timer.key is not None:
+            self._keys.pop(timer.key, None)
+        await self.db.execute('DELETE FROM timers WHERE id = ?', (timer_id,))
+        # The heap entry is dropped lazily by the wakeup loop
+        return timer
+
+    async def cancel_key(self, key):
+        timer_id = self._keys.get(key)
+        return await self.cancel(timer_id) if timer_id is not None else None
+
+    def _push(self, timer):
+        heapq.heappush(self._heap, (timer.due, timer.id))
+        if self._heap[0][1] == timer.id:
+            self._wakeup.set()
+
+    def _is_live(self, entry):
+        due, timer_id = entry
+        timer = self._timers.get(timer_id)
+        return timer is not None and timer.due == due
+
+    async def _run(self):
+        while True:
+            while self._heap and not self._is_live(self._heap[0]):
+                heapq.heappop(self._heap)
+
+            if not self._heap:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            horizon = time.time() + self.batch_window
+            batch = []
+            while self._heap and self._heap[0][0] <= horizon:
+                entry = heapq.heappop(self._heap)
+                if self._is_live(entry):
+                    batch.append(self._timers[entry[1]])
+            await self._fire(batch)
+
+    async def _fire(self, batch):
+        fired_due = {timer.id: timer.due for timer in batch}
+        by_kind = {}
+        for timer in batch:
+            by_kind.setdefault(timer.kind, []).append(timer)
+
+        kinds = list(by_kind.items())
+        results = await asyncio.gather(*(self._dispatch(kind, timers) for kind, timers in kinds), return_exceptions=True)
+        failed = set()
+        for (kind, timers), result in zip(kinds, results):
+            if isinstance(result, BaseException):
+                traceback.print_exception(type(result), result, result.__traceback__)
+                failed.update(timer.id for timer in timers)
+            elif result:
+                failed.update(timer.id for timer in result)
+
+        # Timers cancelled or rescheduled by a handler while firing are left alone
+        fired = [timer for timer in batch if self._timers.get(timer.id) is timer and timer.due == fired_due[timer.id]]
+        done = []
+        for timer in fired:
+            if timer.id in failed and timer.attempts + 1 < self.max_attempts:
+                timer.attempts += 1
+                delay = min(self.retry_delay * 2 ** (timer.attempts - 1), self.max_retry_delay)
+                await self.reschedule(timer.id, time.time() + delay)
+                continue
+            if timer.id in failed:
+                print(f'Giving up on {timer.kind} timer {timer.id} after {self.max_attempts} attempts')
+            del self._timers[timer.id]
+            if timer.key is not None:
+                self._keys.pop(timer.key, None)
+            done.append(timer)
+        if done:
+            await self.db.executemany('DELETE FROM timers WHERE id = ?', [(timer.id,) for timer in done])
+
+    async def _dispatch(self, kind, timers):
+        handler = self._handlers.get(kind)
+        if handler is None:
+            print(f'No handler registered for timer kind {kind!r}; dropping {len(timers)} timer(s)')
+            return None
+        return await handler(timers)
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import os
+import traceback
+from dataclasses import dataclass, field, fields
+
+
+# Moderation settings for one guild
+@dataclass
+class GuildSettings:
+    mod_roles: list = field(default_factory=list)
+    admin_roles: list = field(default_factory=list)
+    admin_users: list = field(default_factory=list)
+    mute_role: int = None
+    lockdown_channels: list = field(default_factory=list)
+    starboard_channel: int = None
+    starboard_threshold: int = 3
+    job_concurrency: int = 2
+    server_slowmode: int = 0
+    user_slowmode: dict = field(default_factory=dict)
+    spam_duplicates: int = 0
+    spam_mentions: int = 0
+    raid_joins: int = 0
+    raid_window: int = 10
+    raid_account_age: int = 7
+    raid_alert_channel: int = None
+
+    @classmethod
+    def from_dict(cls, data, defaults=None):
+        values = dict(defaults or {})
+        values.update(data)
+        known = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in values.items() if key in known})
+
+
+# Type of each setting as accepted by the settings command
+SETTING_TYPES = {
+    'mod_roles': 'roles',
+    'admin_roles': 'roles',
+    'mute_role': 'role',
+    'lockdown_channels': 'channels',
+    'starboard_channel': 'channel',
+    'starboard_threshold': 'int',
+    'job_concurrency': 'int',
+    'server_slowmode': 'int',
+    'spam_duplicates': 'int',
+    'spam_mentions': 'int',
+    'raid_joins': 'int',
+    'raid_window': 'int',
+    'raid_account_age': 'int',
+    'raid_alert_channel': 'channel',
+}
+
+# Smallest accepted value of int settings where 0 makes no sense (other int settings use 0 for off)
+SETTING_MINIMUMS = {
+    'starboard_threshold': 1,
+    'job_concurrency': 1,
+    'raid_window': 1,
+    'raid_account_age': 1,
+}
+
+
+class _Entry:
+    __slots__ = ('version', 'value', 'overrides')
+
+    def __init__(self, version, value, overrides=None):
+        self.version = version
+        self.value = value
+        self.overrides = overrides
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _read_json(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_json(path, data):
+    # Write to a temporary file and rename so readers never see a partial file
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(data, file, indent=2)
+    os.replace(tmp_path, path)
+
+
+# Bot-wide config.json plus one settings/<guild_id>.json file per guild.
+# A guild file holds only the settings that guild overrides; guild_defaults from config.json
+# fill in the rest, so changing a default reaches every guild that has not overridden it.
+# load() reads every guild file in a thread at startup and remembers which guilds have one, so
+# a guild looked up on the event loop is served from memory or built from the defaults without
+# touching disk. Each cached entry remembers the file version (mtime) it was parsed from, and a
+# watcher task lists and stats the files in a thread and reloads exactly the entries whose file
+# changed; only those changed files (and files created since the last listing) are read on the
+# event loop.
+class SettingsStore:
+    def __init__(self, config_path='config.json', guild_dir='settings', poll_interval=5.0):
+        self.config_path = config_path
+        self.guild_dir = guild_dir
+        self.poll_interval = poll_interval
+        self._config = _Entry(_mtime(config_path), _read_json(config_path))
+        self._guilds = {}
+        # Guild IDs with a settings file as of the last listing, or None before load()
+        self._on_disk = None
+        self._task = None
+
+    @property
+    def config(self):
+        return self._config.value
+
+    def _guild_path(self, guild_id):
+        return os.path.join(self.guild_dir, f'{guild_id}.json')
+
+    def _guild_ids(self):
+        try:
+            with os.scandir(self.guild_dir) as items:
+                names = [os.path.splitext(item.name) for item in items]
+        except FileNotFoundError:
+            return []
+        return [int(name) for name, extension in names if extension == '.json' and name.isdigit()]
+
+    def _set_guild(self, guild_id, version, data):
+        known = {f.name for f in fields(GuildSettings)}
+        overrides = {key: value for key, value in data.items() if key in known}
+        entry = _Entry(version, GuildSettings.from_dict(overrides, self.config.get('guild_defaults')), overrides)
+        self._guilds[guild_id] = entry
+        return entry
+
+    def _load_guild(self, guild_id, from_disk=False):
+        if not from_disk and self._on_disk is not None and guild_id not in self._on_disk:
+            return self._set_guild(guild_id, None, {})
+        path = self._guild_path(guild_id)
+        return self._set_guild(guild_id, _mtime(path), _read_json(path))
+
+    def _read_guild_files(self):
+        files = {}
+        for guild_id in self._guild_ids():
+            path = self._guild_path(guild_id)
+            files[guild_id] = (_mtime(path), _read_json(path))
+        return files
+
+    async def load(self):
+        # Read every guild file off the event loop
+        files = await asyncio.to_thread(self._read_guild_files)
+        for guild_id, (version, data) in files.items():
+            self._set_guild(guild_id, version, data)
+        self._on_disk = set(files)
+
+    def guild(self, guild_id):
+        entry = self._guilds.get(guild_id)
+        if entry is None:
+            entry = self._load_guild(guild_id)
+        return entry.value
+
+    def update(self, guild_id, **changes):
+        # Persist changes as overrides for one guild and replace only that guild's cached entry
+        entry = self._guilds.get(guild_id) or self._load_guild(guild_id)
+        overrides = dict(entry.overrides)
+        overrides.update(changes)
+        os.makedirs(self.guild_dir, exist_ok=True)
+        path = self._guild_path(guild_id)
+        _write_json(path, overrides)
+        if self._on_disk is not None:
+            self._on_disk.add(guild_id)
+        return self._set_guild(guild_id, _mtime(path), overrides).value
+
+    def versions(self, guild_ids):
+        # (config.json version, {guild_id: version} for the given guilds' files, IDs of every guild
+        # file). Blocking, so the watcher runs it in a thread: one directory listing plus a stat per
+        # file of a cached guild.
+        on_disk = set(self._guild_ids())
+        found = {guild_id: _mtime(self._guild_path(guild_id)) for guild_id in on_disk & guild_ids}
+        return _mtime(self.config_path), found, on_disk
+
+    def reload_changed(self, versions=None):
+        # Re-read config.json and any cached guild file whose version changed; returns the reloaded keys
+        config_version, guild_versions, on_disk = versions or self.versions(set(self._guilds))
+        reloaded = []
+        if config_version != self._config.version:
+            self._config = _Entry(config_version, _read_json(self.config_path))
+            # Guild records are built on top of guild_defaults; rebuild them from their overrides
+            for guild_id, entry in list(self._guilds.items()):
+                self._set_guild(guild_id, entry.version, entry.overrides)
+            reloaded.append('config')
+        for guild_id, entry in list(self._guilds.items()):
+            if guild_versions.get(guild_id) != entry.version:
+                self._load_guild(guild_id, from_disk=True)
+                reloaded.append(guild_id)
+        # Files written by update() after the listing was taken still count as on disk
+        self._on_disk = on_disk | {guild_id for guild_id, entry in self._guilds.items() if entry.version is not None}
+        return reloaded
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                versions = await asyncio.to_thread(self.versions, set(self._guilds))
+                for key in self.reload_changed(versions):
+                    print(f'Reloaded settings for {key}')
+            except (OSError, ValueError):
+                traceback.print_exc()
@@ -0,0 +1,96 @@
+import time
+from collections import OrderedDict
+
+# Names of the rules check() can report, in the order they are tested
+RULES = ('slowmode', 'duplicate', 'mentions')
+
+
+class _Sender:
+    __slots__ = ('seen_at', 'allowed_at', 'digest', 'repeats', 'window_start', 'mentions', 'previous_mentions')
+
+    def __init__(self, now):
+        self.seen_at = now
+        self.allowed_at = float('-inf')
+        self.digest = None
+        self.repeats = 0
+        self.window_start = now
+        self.mentions = 0
+        self.previous_mentions = 0
+
+
+# Per-(guild, user) message rate state for slowmode and spam rules.
+# Each sender is one small slotted record: the time of the last message let through for
+# slowmode, a hash and repeat count of the last message for duplicate detection, and a
+# two-window sliding counter of mentions. Records live in an OrderedDict kept in last-seen
+# order, so every check is O(1) and idle senders are evicted a couple at a time from the front.
+class SpamFilter:
+    def __init__(self, window=10.0, idle_timeout=600.0, max_entries=1_000_000):
+        self.window = window
+        self.idle_timeout = idle_timeout
+        self.max_entries = max_entries
+        self.blocked = dict.fromkeys(RULES, 0)
+        self._senders = OrderedDict()
+
+    def __len__(self):
+        return len(self._senders)
+
+    def check(self, guild_id, user_id, content, mentions, slowmode=0, max_duplicates=0, max_mentions=0, now=None):
+        # Record a message and return the first rule it breaks, or None.
+        # slowmode is the seconds required between messages; the limits are disabled when 0.
+        now = time.monotonic() if now is None else now
+        key = (guild_id, user_id)
+        sender = self._senders.get(key)
+        if sender is None:
+            sender = self._senders[key] = _Sender(now)
+            self._evict(now)
+        else:
+            self._senders.move_to_end(key)
+        idle = now - sender.seen_at
+        sender.seen_at = now
+
+        digest = hash(content) if content else None
+        if digest is not None and digest == sender.digest and idle < self.window:
+            sender.repeats += 1
+        else:
+            sender.digest = digest
+            sender.repeats = 1
+
+        # Sliding window: the previous window's count is weighted by how much of it still overlaps
+        elapsed = now - sender.window_start
+        if elapsed >= self.window:
+            sender.previous_mentions = sender.mentions if elapsed < 2 * self.window else 0
+            sender.mentions = 0
+            sender.window_start = now - elapsed % self.window
+            elapsed = now - sender.window_start
+        sender.mentions += mentions
+        recent_mentions = sender.mentions + sender.previous_mentions * (1 - elapsed / self.window)
+
+        rule = None
+        if slowmode and now - sender.allowed_at < slowmode:
+            rule = 'slowmode'
+        elif max_duplicates and sender.repeats > max_duplicates:
+            rule = 'duplicate'
+        elif max_mentions and recent_mentions > max_mentions:
+            rule = 'mentions'
+        if rule is None:
+            sender.allowed_at = now
+        else:
+            self.blocked[rule] += 1
+        return rule
+
+    def _evict(self, now):
+        # Drop at most two stale records per new sender, which keeps up with the arrival rate
+        for _ in range(2):
+            if not self._senders:
+                return
+            key, oldest = next(iter(self._senders.items()))
+            if len(self._senders) <= self.max_entries and now - oldest.seen_at < self.idle_timeout:
+                return
+            del self._senders[key]
+
+    def metric_lines(self, namespace):
+        lines = [f'# TYPE {namespace}_spam_tracked_senders gauge', f'{namespace}_spam_tracked_senders {len(self._senders)}']
+        lines.append(f'# TYPE {namespace}_spam_blocked_total counter')
+        for rule, count in self.blocked.items():
+            lines.append(f'{namespace}_spam_blocked_total{{rule="{rule}"}} {count}')
+        return lines
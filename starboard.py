@@ -0,0 +1,221 @@
+import asyncio
+import time
+import traceback
+from collections import OrderedDict
+
+import discord
+
+from dispatcher import AUTOMATION, request
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS starboard (
+    message_id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    author_id INTEGER,
+    stars INTEGER NOT NULL,
+    post_id INTEGER,
+    updated_at REAL NOT NULL
+);
+'''
+
+STAR = '\N{WHITE MEDIUM STAR}'
+
+
+class StarEntry:
+    __slots__ = ('message_id', 'guild_id', 'channel_id', 'author_id', 'stars', 'post_id', 'updated_at', 'forced')
+
+    def __init__(self, message_id, guild_id, channel_id, author_id=None, stars=0, post_id=None, updated_at=0.0):
+        self.message_id = message_id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.stars = stars
+        self.post_id = post_id
+        self.updated_at = updated_at
+        self.forced = False
+
+    def row(self):
+        return (self.message_id, self.guild_id, self.channel_id, self.author_id, self.stars, self.post_id, self.updated_at)
+
+
+# Starboard reaction aggregator.
+# Raw reaction events only adjust in-memory counters. Each message's starboard post is created
+# or edited at most once per debounce window, and changed counters are checkpointed to the
+# starboard table in batches. Entries are kept in a bounded LRU and reloaded on demand. Post
+# requests go through the REST dispatcher at automation priority.
+class Starboard:
+    def __init__(self, db, settings_for_guild, bot=None, rest=None, debounce=5.0, flush_interval=10.0, max_entries=100000):
+        self.db = db
+        self.settings_for_guild = settings_for_guild
+        self.debounce = debounce
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self.bot = bot
+        self.rest = rest
+        self._entries = OrderedDict()
+        self._dirty = set()
+        self._pending_publish = set()
+        # (message_id, user_id) of ignored self-stars, so removing one does not take a star away
+        self._self_stars = OrderedDict()
+        self._flush_task = None
+
+    async def start(self):
+        if self._flush_task is not None:
+            return
+        await self.db.executescript(SCHEMA)
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    async def get(self, message_id):
+        entry = self._entries.get(message_id)
+        if entry is not None:
+            self._entries.move_to_end(message_id)
+            return entry
+        row = await self.db.fetchone('SELECT * FROM starboard WHERE message_id = ?', (message_id,))
+        if row is None:
+            return None
+        entry = StarEntry(row['message_id'], row['guild_id'], row['channel_id'], row['author_id'],
+                          row['stars'], row['post_id'], row['updated_at'])
+        self._remember(entry)
+        return entry
+
+    async def track(self, message_id, guild_id, channel_id, author_id=None):
+        # Return the entry for a message, creating an empty one if it was never starred
+        entry = await self.get(message_id)
+        if entry is None:
+            entry = StarEntry(message_id, guild_id, channel_id, author_id)
+            self._remember(entry)
+        return entry
+
+    def _remember(self, entry):
+        self._entries[entry.message_id] = entry
+        # Evict least recently used entries that have nothing left to write or publish
+        while len(self._entries) > self.max_entries:
+            for message_id in self._entries:
+                if message_id not in self._dirty and message_id not in self._pending_publish:
+                    del self._entries[message_id]
+                    break
+            else:
+                break
+
+    async def on_reaction(self, payload, delta):
+        # Feed a raw reaction add (+1) or remove (-1) event
+        if str(payload.emoji) != STAR or payload.guild_id is None:
+            return
+        if self.settings_for_guild(payload.guild_id).starboard_channel in (None, payload.channel_id):
+            return
+        # Only reaction adds carry the message author; removals are matched against the
+        # self-stars seen earlier or the author already known for the entry
+        key = (payload.message_id, payload.user_id)
+        author_id = getattr(payload, 'message_author_id', None)
+        if author_id is not None and author_id == payload.user_id:
+            self._self_stars[key] = None
+            self._self_stars.move_to_end(key)
+            if len(self._self_stars) > self.max_entries:
+                self._self_stars.popitem(last=False)
+            return
+        if delta < 0 and self._self_stars.pop(key, False) is None:
+            return
+
+        entry = await self.track(payload.message_id, payload.guild_id, payload.channel_id, author_id)
+        if entry.author_id is None:
+            entry.author_id = author_id
+        elif delta < 0 and entry.author_id == payload.user_id:
+            return
+        entry.stars = max(entry.stars + delta, 0)
+        entry.updated_at = time.time()
+        self._dirty.add(entry.message_id)
+        self.schedule_publish(entry)
+
+    def schedule_publish(self, entry, force=False):
+        entry.forced = entry.forced or force
+        if entry.message_id in self._pending_publish:
+            return
+        self._pending_publish.add(entry.message_id)
+        delay = 0 if force else self.debounce
+        asyncio.get_running_loop().call_later(delay, lambda: asyncio.ensure_future(self._publish(entry)))
+
+    async def _publish(self, entry):
+        self._pending_publish.discard(entry.message_id)
+        try:
+            await self._sync_post(entry)
+        except discord.HTTPException:
+            traceback.print_exc()
+
+    async def _sync_post(self, entry):
+        guild_settings = self.settings_for_guild(entry.guild_id)
+        board = self.bot.get_channel(guild_settings.starboard_channel) if guild_settings.starboard_channel else None
+        if board is None:
+            return
+        qualifies = entry.forced or entry.stars >= guild_settings.starboard_threshold
+
+        if entry.post_id is None:
+            if not qualifies:
+                return
+            source = self.bot.get_channel(entry.channel_id)
+            if source is None:
+                return
+            try:
+                message = await request(self.rest, AUTOMATION, ('message.fetch', source.id),
+                                        lambda: source.fetch_message(entry.message_id))
+            except discord.NotFound:
+                return
+            # Reconcile with the real reaction count the first time the message is fetched
+            reaction = discord.utils.get(message.reactions, emoji=STAR)
+            if reaction is not None:
+                entry.stars = max(entry.stars, reaction.count)
+            entry.author_id = message.author.id
+            post = await request(self.rest, AUTOMATION, ('channel.send', board.id),
+                                 lambda: board.send(content=self.header(entry), embed=self.embed(message)))
+            entry.post_id = post.id
+        elif qualifies:
+            post = board.get_partial_message(entry.post_id)
+            await request(self.rest, AUTOMATION, ('message.edit', board.id), lambda: post.edit(content=self.header(entry)))
+        else:
+            post = board.get_partial_message(entry.post_id)
+            await request(self.rest, AUTOMATION, ('message.delete', board.id), post.delete)
+            entry.post_id = None
+        self._dirty.add(entry.message_id)
+
+    @staticmethod
+    def header(entry):
+        return f"{STAR} **{entry.stars}** <#{entry.channel_id}>"
+
+    @staticmethod
+    def embed(message):
+        embed = discord.Embed(description=message.content, timestamp=message.created_at, color=0xFFAC33)
+        embed.set_author(name=message.author.display_name, icon_url=message.author.display_avatar.url)
+        embed.add_field(name="Source", value=f"[Jump to message]({message.jump_url})")
+        image = next((a for a in message.attachments if a.content_type and a.content_type.startswith('image/')), None)
+        if image is not None:
+            embed.set_image(url=image.url)
+        return embed
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        rows = [self._entries[message_id].row() for message_id in dirty if message_id in self._entries]
+        try:
+            await self.db.executemany(
+                'INSERT OR REPLACE INTO starboard (message_id, guild_id, channel_id, author_id, stars, post_id, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows,
+            )
+        except Exception:
+            self._dirty |= dirty
+            raise
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                traceback.print_exc()
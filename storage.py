@@ -0,0 +1,296 @@
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MODERATION_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    target_id INTEGER NOT NULL,
+    target_seq INTEGER NOT NULL,
+    moderator_id INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    reason TEXT,
+    created_at REAL NOT NULL,
+    expires_at REAL,
+    active INTEGER NOT NULL DEFAULT 1,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_cases_target ON cases (guild_id, target_id, created_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_cases_target_seq ON cases (guild_id, target_id, target_seq);
+CREATE INDEX IF NOT EXISTS idx_cases_moderator ON cases (guild_id, moderator_id);
+CREATE INDEX IF NOT EXISTS idx_cases_active ON cases (guild_id, active) WHERE active = 1 AND expires_at IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    target_id INTEGER NOT NULL,
+    moderator_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    edited_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_notes_target ON notes (guild_id, target_id, created_at);
+
+CREATE TABLE IF NOT EXISTS mod_stats_totals (
+    guild_id INTEGER NOT NULL,
+    moderator_id INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, moderator_id, action)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS mod_stats_daily (
+    guild_id INTEGER NOT NULL,
+    moderator_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, moderator_id, day, action)
+) WITHOUT ROWID;
+'''
+
+STATS_RETENTION_DAYS = 30
+
+
+# Thin async wrapper around a single sqlite connection.
+# Every query runs on one dedicated worker thread so the event loop never blocks on disk.
+class Database:
+    def __init__(self, path):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='botix-db')
+        self._conn = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _call(self, fn, args):
+        if self._conn is None:
+            self._conn = self._connect()
+        return fn(self._conn, *args)
+
+    async def run(self, fn, *args):
+        # Run fn(conn, *args) on the database thread
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn, args)
+
+    async def executescript(self, script):
+        await self.run(lambda conn: conn.executescript(script))
+
+    async def execute(self, sql, params=()):
+        def _execute(conn):
+            cursor = conn.execute(sql, params)
+            return cursor.lastrowid, cursor.rowcount
+        return await self.run(_execute)
+
+    async def executemany(self, sql, seq_of_params):
+        def _executemany(conn):
+            with conn:
+                conn.execute('BEGIN')
+                conn.executemany(sql, seq_of_params)
+        await self.run(_executemany)
+
+    async def fetchone(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def close(self):
+        def _close(conn):
+            conn.close()
+        if self._conn is not None:
+            await self.run(_close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+
+def _insert_case(conn, guild_id, target_id, moderator_id, action, reason, expires_at, created_at):
+    # Each target's cases are numbered 1..n so modlogs pages map to a fixed target_seq range
+    seq = conn.execute(
+        'SELECT COALESCE(MAX(target_seq), 0) + 1 FROM cases WHERE guild_id = ? AND target_id = ?',
+        (guild_id, target_id),
+    ).fetchone()[0]
+    cursor = conn.execute(
+        'INSERT INTO cases (guild_id, target_id, target_seq, moderator_id, action, reason, created_at, expires_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        (guild_id, target_id, seq, moderator_id, action, reason, created_at, expires_at),
+    )
+    _bump_stats(conn, guild_id, moderator_id, action, created_at)
+    return cursor.lastrowid
+
+
+def _bump_stats(conn, guild_id, moderator_id, action, created_at):
+    # Keep modstats aggregates in step with the cases table, inside the same transaction
+    conn.execute(
+        'INSERT INTO mod_stats_totals (guild_id, moderator_id, action, total) VALUES (?, ?, ?, 1) '
+        'ON CONFLICT (guild_id, moderator_id, action) DO UPDATE SET total = total + 1',
+        (guild_id, moderator_id, action),
+    )
+    conn.execute(
+        'INSERT INTO mod_stats_daily (guild_id, moderator_id, day, action, count) VALUES (?, ?, ?, ?, 1) '
+        'ON CONFLICT (guild_id, moderator_id, day, action) DO UPDATE SET count = count + 1',
+        (guild_id, moderator_id, int(created_at // 86400), action),
+    )
+
+
+def _rebuild_stats(conn):
+    # Materialize the modstats aggregates from existing cases (used once for databases that predate them)
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('DELETE FROM mod_stats_totals')
+        conn.execute('DELETE FROM mod_stats_daily')
+        conn.execute(
+            'INSERT INTO mod_stats_totals (guild_id, moderator_id, action, total) '
+            'SELECT guild_id, moderator_id, action, COUNT(*) FROM cases GROUP BY guild_id, moderator_id, action'
+        )
+        conn.execute(
+            'INSERT INTO mod_stats_daily (guild_id, moderator_id, day, action, count) '
+            'SELECT guild_id, moderator_id, CAST(created_at / 86400 AS INTEGER) AS day, action, COUNT(*) '
+            'FROM cases WHERE created_at >= ? GROUP BY guild_id, moderator_id, day, action',
+            ((time.time() // 86400 - STATS_RETENTION_DAYS) * 86400,),
+        )
+
+
+# Moderation cases (bans, kicks, warnings, mutes, ...) and notes, all stored in the bot database.
+# Warnings are cases with action 'warn'; deleting one only flags it so case numbering stays stable.
+class ModerationStore:
+    def __init__(self, db):
+        self.db = db
+
+    async def start(self):
+        await self.db.executescript(MODERATION_SCHEMA)
+        missing = await self.db.fetchone(
+            'SELECT EXISTS (SELECT 1 FROM cases) AND NOT EXISTS (SELECT 1 FROM mod_stats_totals)'
+        )
+        if missing[0]:
+            await self.db.run(_rebuild_stats)
+        await self.prune_stats()
+
+    async def prune_stats(self):
+        # Daily buckets only back the rolling windows; all-time counts live in mod_stats_totals
+        cutoff = int(time.time() // 86400) - STATS_RETENTION_DAYS
+        await self.db.execute('DELETE FROM mod_stats_daily WHERE day < ?', (cutoff,))
+
+    async def add_case(self, guild_id, target_id, moderator_id, action, reason=None, expires_at=None):
+        def _add(conn):
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                case_id = _insert_case(conn, guild_id, target_id, moderator_id, action, reason, expires_at, time.time())
+            return conn.execute('SELECT * FROM cases WHERE id = ?', (case_id,)).fetchone()
+        return await self.db.run(_add)
+
+    async def add_cases(self, cases):
+        # Record many (guild_id, target_id, moderator_id, action, reason, expires_at) cases in one transaction
+        def _add(conn):
+            now = time.time()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                return [_insert_case(conn, *case, now) for case in cases]
+        return await self.db.run(_add)
+
+    async def get_case(self, guild_id, case_id):
+        return await self.db.fetchone('SELECT * FROM cases WHERE guild_id = ? AND id = ?', (guild_id, case_id))
+
+    async def set_case_expiry(self, guild_id, case_id, expires_at):
+        await self.db.execute('UPDATE cases SET expires_at = ? WHERE guild_id = ? AND id = ?', (expires_at, guild_id, case_id))
+
+    async def deactivate_cases(self, case_ids):
+        await self.db.executemany('UPDATE cases SET active = 0 WHERE id = ?', [(case_id,) for case_id in case_ids])
+
+    async def active_cases(self, guild_id):
+        return await self.db.fetchall(
+            'SELECT * FROM cases WHERE guild_id = ? AND active = 1 AND expires_at IS NOT NULL ORDER BY expires_at',
+            (guild_id,),
+        )
+
+    async def modlogs_page(self, guild_id, target_id, page, per_page=10):
+        # Return (cases, total_pages) for a 1-based page, newest first.
+        # The page is a target_seq range, so any page is a single bounded index range scan.
+        def _page(conn):
+            total = conn.execute(
+                'SELECT MAX(target_seq) FROM cases WHERE guild_id = ? AND target_id = ?',
+                (guild_id, target_id),
+            ).fetchone()[0] or 0
+            high = total - (page - 1) * per_page
+            low = max(high - per_page + 1, 1)
+            rows = conn.execute(
+                'SELECT * FROM cases WHERE guild_id = ? AND target_id = ? AND target_seq BETWEEN ? AND ? '
+                'ORDER BY target_seq DESC',
+                (guild_id, target_id, low, high),
+            ).fetchall()
+            return rows, -(-total // per_page)
+        return await self.db.run(_page)
+
+    async def warnings(self, guild_id, target_id):
+        return await self.db.fetchall(
+            "SELECT * FROM cases WHERE guild_id = ? AND target_id = ? AND action = 'warn' AND deleted = 0 ORDER BY created_at",
+            (guild_id, target_id),
+        )
+
+    async def delete_warning(self, guild_id, case_id):
+        _, changed = await self.db.execute(
+            "UPDATE cases SET deleted = 1, active = 0 WHERE guild_id = ? AND id = ? AND action = 'warn' AND deleted = 0",
+            (guild_id, case_id),
+        )
+        return changed > 0
+
+    async def moderator_stats(self, guild_id, moderator_id, now=None):
+        # Return {action: (last_7_days, last_30_days, all_time)} from the materialized aggregates.
+        # This reads at most one totals row and 30 daily rows per action, however many cases exist.
+        today = int((time.time() if now is None else now) // 86400)
+
+        def _stats(conn):
+            stats = {}
+            for row in conn.execute(
+                'SELECT action, total FROM mod_stats_totals WHERE guild_id = ? AND moderator_id = ?',
+                (guild_id, moderator_id),
+            ):
+                stats[row['action']] = [0, 0, row['total']]
+            for row in conn.execute(
+                'SELECT day, action, count FROM mod_stats_daily WHERE guild_id = ? AND moderator_id = ? AND day > ?',
+                (guild_id, moderator_id, today - STATS_RETENTION_DAYS),
+            ):
+                counts = stats.setdefault(row['action'], [0, 0, 0])
+                counts[1] += row['count']
+                if row['day'] > today - 7:
+                    counts[0] += row['count']
+            return {action: tuple(counts) for action, counts in stats.items()}
+
+        return await self.db.run(_stats)
+
+    async def add_note(self, guild_id, target_id, moderator_id, text):
+        note_id, _ = await self.db.execute(
+            'INSERT INTO notes (guild_id, target_id, moderator_id, text, created_at) VALUES (?, ?, ?, ?, ?)',
+            (guild_id, target_id, moderator_id, text, time.time()),
+        )
+        return note_id
+
+    async def notes(self, guild_id, target_id):
+        return await self.db.fetchall(
+            'SELECT * FROM notes WHERE guild_id = ? AND target_id = ? ORDER BY created_at',
+            (guild_id, target_id),
+        )
+
+    async def edit_note(self, guild_id, target_id, note_id, text):
+        _, changed = await self.db.execute(
+            'UPDATE notes SET text = ?, edited_at = ? WHERE guild_id = ? AND target_id = ? AND id = ?',
+            (text, time.time(), guild_id, target_id, note_id),
+        )
+        return changed > 0
+
+    async def delete_note(self, guild_id, target_id, note_id):
+        _, changed = await self.db.execute(
+            'DELETE FROM notes WHERE guild_id = ? AND target_id = ? AND id = ?',
+            (guild_id, target_id, note_id),
+        )
+        return changed > 0
+
+    async def clear_notes(self, guild_id, target_id):
+        _, changed = await self.db.execute('DELETE FROM notes WHERE guild_id = ? AND target_id = ?', (guild_id, target_id))
+        return changed
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import time
+
+import discord
+from discord import app_commands
+from discord.utils import MISSING
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+
+class DuplicateCommandError(ValueError):
+    def __init__(self, command, existing):
+        def where(cmd):
+            code = getattr(getattr(cmd, 'callback', None), '__code__', None)
+            return f'{code.co_filename}:{code.co_firstlineno}' if code else 'unknown location'
+        super().__init__(f"Command '{command.name}' defined at {where(command)} is already registered at {where(existing)}")
+
+
+# Command tree that refuses to register the same command name twice, so a duplicate
+# definition fails at import with both locations instead of silently replacing the first one.
+# It also stamps each interaction with the time it was received.
+class CommandTree(app_commands.CommandTree):
+    def add_command(self, command, /, *, guild=MISSING, guilds=MISSING, override=False):
+        if not override:
+            # tree.command() always forwards guild and guilds, MISSING when not given
+            targets = [guild] if guild is not MISSING else list(guilds or ())
+            command_type = getattr(command, 'type', discord.AppCommandType.chat_input)
+            for target in targets or [None]:
+                existing = self.get_command(command.name, guild=target, type=command_type)
+                if existing is not None:
+                    raise DuplicateCommandError(command, existing)
+        return super().add_command(command, guild=guild, guilds=guilds, override=override)
+
+    async def interaction_check(self, interaction):
+        # Stamp when the interaction reached the tree so its handling time can be measured
+        interaction.extras['received_at'] = time.perf_counter()
+        return True
+
+
+def _command_payload(command, tree):
+    try:
+        return command.to_dict(tree)
+    except TypeError:
+        return command.to_dict()
+
+
+# Stable hash of the serialized command schema that would be sent to Discord on sync
+def schema_hash(tree, guild=None):
+    payload = [_command_payload(command, tree) for command in tree.get_commands(guild=guild)]
+    payload.sort(key=lambda data: (data.get('type', 1), data['name']))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+# Sync the command tree only when its schema differs from the last synced one.
+# Returns True if the sync endpoint was called.
+async def sync_if_changed(tree, db, guild=None, force=False):
+    await db.executescript(SCHEMA)
+    key = f'command_hash:{guild.id}' if guild is not None else 'command_hash'
+    current = schema_hash(tree, guild=guild)
+    row = await db.fetchone('SELECT value FROM meta WHERE key = ?', (key,))
+    if not force and row is not None and row['value'] == current:
+        return False
+    await tree.sync(guild=guild)
+    await db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, current))
+    return True